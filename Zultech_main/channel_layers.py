@@ -0,0 +1,79 @@
+"""
+Configuración de la capa de canales de Django Channels a partir de
+variables de entorno.
+
+CHANNEL_LAYER_BACKEND elige el backend (si no se define, se deduce de las
+demás variables):
+
+- memory: InMemoryChannelLayer. Solo entrega mensajes dentro del mismo
+  proceso; sirve para desarrollo con un único servidor y para los tests.
+- redis: channels_redis con REDIS_URL (redis:// o rediss://).
+- sentinel: channels_redis con Redis Sentinel. REDIS_SENTINELS es una lista
+  host:puerto separada por comas y REDIS_SENTINEL_MASTER el nombre del
+  master. REDIS_PASSWORD y REDIS_SENTINEL_PASSWORD son opcionales.
+
+Con varios workers (WEB_CONCURRENCY > 1) hace falta Redis: cada worker
+tiene su propia capa en memoria y los mensajes de un worker no llegarían a
+los sockets conectados a otro.
+"""
+from django.core.exceptions import ImproperlyConfigured
+
+MEMORY_BACKEND = 'channels.layers.InMemoryChannelLayer'
+REDIS_BACKEND = 'channels_redis.core.RedisChannelLayer'
+
+
+def parse_sentinels(value):
+    """Convierte 'host1:26379,host2:26379' en [('host1', 26379), ('host2', 26379)]"""
+    sentinels = []
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, _, port = entry.rpartition(':')
+        if not host or not port.isdigit():
+            raise ImproperlyConfigured(f'REDIS_SENTINELS inválido: "{entry}" (se espera host:puerto)')
+        sentinels.append((host, int(port)))
+    return sentinels
+
+
+def build_channel_layers(environ):
+    """Retorna el valor de CHANNEL_LAYERS para las variables de `environ`"""
+    redis_url = environ.get('REDIS_URL')
+    sentinels = environ.get('REDIS_SENTINELS', '')
+    backend = environ.get('CHANNEL_LAYER_BACKEND')
+    if not backend:
+        backend = 'sentinel' if sentinels else 'redis' if redis_url else 'memory'
+
+    if backend == 'memory':
+        return {'default': {'BACKEND': MEMORY_BACKEND}}
+
+    if backend == 'redis':
+        if not redis_url:
+            raise ImproperlyConfigured('CHANNEL_LAYER_BACKEND=redis requiere REDIS_URL.')
+        host = {'address': redis_url}
+    elif backend == 'sentinel':
+        host = {
+            'sentinels': parse_sentinels(sentinels),
+            'master_name': environ.get('REDIS_SENTINEL_MASTER', 'mymaster'),
+        }
+        if not host['sentinels']:
+            raise ImproperlyConfigured('CHANNEL_LAYER_BACKEND=sentinel requiere REDIS_SENTINELS.')
+        if environ.get('REDIS_PASSWORD'):
+            host['password'] = environ['REDIS_PASSWORD']
+        if environ.get('REDIS_SENTINEL_PASSWORD'):
+            host['sentinel_kwargs'] = {'password': environ['REDIS_SENTINEL_PASSWORD']}
+    else:
+        raise ImproperlyConfigured(
+            f'CHANNEL_LAYER_BACKEND desconocido: "{backend}" (memory, redis o sentinel).'
+        )
+
+    return {
+        'default': {
+            'BACKEND': REDIS_BACKEND,
+            'CONFIG': {
+                'hosts': [host],
+                'prefix': environ.get('CHANNEL_LAYER_PREFIX', 'zultech'),
+                'capacity': int(environ.get('CHANNEL_LAYER_CAPACITY', '1500')),
+            },
+        },
+    }
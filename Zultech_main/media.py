@@ -0,0 +1,159 @@
+"""
+Servicio de los archivos media (MEDIA_ROOT) en producción.
+
+Los archivos de productos llevan el hash de su contenido en el nombre: los
+originales se guardan como `products/<sha256>.jpg` (ver app_products.storage)
+y los derivados como `products/<stem>.<hash>.webp` (ver
+app_products.renditions). Una URL así nunca cambia de contenido, de modo que
+se sirven con `Cache-Control: immutable` por un año. El resto (imágenes
+anteriores, fotos de perfil) se sirve con MEDIA_CACHE_MAX_AGE y se revalida
+con ETag / Last-Modified.
+
+El archivo se transmite por bloques sin cargarlo en memoria y se admiten
+peticiones Range de un solo rango. Bajo WSGI se usa FileResponse (gunicorn
+síncrono lo envía con sendfile). Bajo ASGI, como en Render (gunicorn con
+UvicornWorker), Django consumiría un iterador síncrono con
+`sync_to_async(list)`, leyendo el archivo entero a memoria: ahí se responde
+con un iterador asíncrono que lee cada bloque en un hilo.
+"""
+import mimetypes
+import os
+import re
+import stat
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+# `<sha256>.ext` (originales direccionados por contenido) o `stem.<hash12>.ext` (derivados)
+FINGERPRINTED = re.compile(r'(?:^[0-9a-f]{64}|\.[0-9a-f]{12})\.[A-Za-z0-9]+$')
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Bytes leídos por bloque bajo ASGI
+ASYNC_BLOCK_SIZE = 64 * 1024
+
+
+def is_fingerprinted(path):
+    return bool(FINGERPRINTED.search(os.path.basename(path)))
+
+
+class _FileRange:
+    """Archivo abierto limitado a `length` bytes desde la posición actual"""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+async def _read_async(file, length):
+    """Lee `length` bytes de `file` por bloques, cada lectura en un hilo"""
+    read = sync_to_async(file.read, thread_sensitive=False)
+    remaining = length
+    while remaining:
+        data = await read(min(ASYNC_BLOCK_SIZE, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        yield data
+
+
+def file_response(request, full_path, start, length, status=200):
+    """
+    Respuesta que transmite `length` bytes de `full_path` desde `start` sin
+    cargarlos en memoria: asíncrona bajo ASGI, FileResponse bajo WSGI
+    """
+    file = open(full_path, 'rb')
+    file.seek(start)
+    if isinstance(request, ASGIRequest):
+        content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        response = StreamingHttpResponse(_read_async(file, length), status=status, content_type=content_type)
+        response._resource_closers.append(file.close)
+    elif start == 0 and status == 200:
+        response = FileResponse(file)
+    else:
+        response = FileResponse(_FileRange(file, length), status=status)
+    response.headers['Content-Length'] = length
+    return response
+
+
+def parse_range(header, size):
+    """
+    Retorna (inicio, fin) inclusivos de un encabezado Range de un solo rango,
+    None si no aplica (ausente, mal formado o varios rangos: se envía el
+    archivo completo) o False si el rango no se puede satisfacer.
+    """
+    match = RANGE.match(header.replace(' ', '')) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        # Sufijo: los últimos `end` bytes
+        length = int(end)
+        return (max(size - length, 0), size - 1) if length and size else False
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        file_stat = os.stat(full_path)
+    except (OSError, ValueError, SuspiciousFileOperation):
+        raise Http404('El archivo no existe')
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404('El archivo no existe')
+
+    etag = f'"{file_stat.st_mtime_ns:x}-{file_stat.st_size:x}"'
+    last_modified = int(file_stat.st_mtime)
+    if is_fingerprinted(path):
+        cache_control = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        cache_control = f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        byte_range = parse_range(request.headers.get('Range'), file_stat.st_size)
+        # If-Range: solo se responde el rango si el archivo no cambió
+        if_range = request.headers.get('If-Range')
+        if byte_range is not None and if_range and if_range != etag and \
+                parse_http_date_safe(if_range) != last_modified:
+            byte_range = None
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response.headers['Content-Range'] = f'bytes */{file_stat.st_size}'
+        elif byte_range is not None:
+            start, end = byte_range
+            response = file_response(request, full_path, start, end - start + 1, status=206)
+            response.headers['Content-Range'] = f'bytes {start}-{end}/{file_stat.st_size}'
+        else:
+            response = file_response(request, full_path, 0, file_stat.st_size)
+
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    response.headers['Cache-Control'] = cache_control
+    return response
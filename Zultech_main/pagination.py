@@ -0,0 +1,201 @@
+"""
+Paginación por cursor (keyset) para listados grandes.
+
+A diferencia de Paginator, no ejecuta COUNT(*) ni OFFSET: cada página filtra
+a partir de los valores de ordenamiento de la última fila vista
+(por ejemplo `created_at < X OR (created_at = X AND id < Y)`), así que la
+página N cuesta lo mismo que la página 1 si existe un índice sobre el
+ordenamiento.
+
+Los cursores son opacos y van firmados: un cursor manipulado o de otro
+listado simplemente devuelve la primera página.
+"""
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import QueryDict
+
+CURSOR_PARAM = 'cursor'
+
+
+class CursorPage:
+    """Página de resultados con cursores hacia la página siguiente y anterior"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, params=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.params = params
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def _querystring(self, cursor):
+        params = self.params.copy() if self.params is not None else QueryDict(mutable=True)
+        params.pop('page', None)
+        params[CURSOR_PARAM] = cursor
+        return params.urlencode()
+
+    @property
+    def next_querystring(self):
+        """Parámetros GET actuales con el cursor de la página siguiente"""
+        return self._querystring(self.next_cursor)
+
+    @property
+    def previous_querystring(self):
+        """Parámetros GET actuales con el cursor de la página anterior"""
+        return self._querystring(self.previous_cursor)
+
+    def to_dict(self, serialize):
+        """Representación para JsonResponse; `serialize` convierte cada objeto"""
+        return {
+            'results': [serialize(obj) for obj in self.object_list],
+            'next_cursor': self.next_cursor,
+            'previous_cursor': self.previous_cursor,
+        }
+
+
+class CursorPaginator:
+    """
+    Pagina `queryset` por cursor según `ordering` (por ejemplo ['name'] o
+    ['-created_at']). La clave primaria se agrega como desempate, en la misma
+    dirección que el último campo. Los campos del ordenamiento no deben
+    admitir NULL.
+
+    Con `ordering=None` se respeta el orden que ya tenga el queryset (por
+    ejemplo el ranking de una búsqueda) y el cursor guarda un desplazamiento;
+    sigue sin ejecutar COUNT(*), pero las páginas profundas usan OFFSET.
+    """
+
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.model = queryset.model
+
+        if ordering is None:
+            self.keys = None
+            self.salt = f'cursor:{self.model._meta.label}:offset'
+        else:
+            keys = [self._parse_key(name) for name in ordering]
+            pk_name = self.model._meta.pk.name
+            if pk_name not in [name for name, _ in keys]:
+                keys.append((pk_name, keys[-1][1] if keys else False))
+            self.keys = keys
+            self.salt = 'cursor:{}:{}'.format(
+                self.model._meta.label,
+                ','.join(('-' if desc else '') + name for name, desc in keys)
+            )
+
+    @staticmethod
+    def _parse_key(name):
+        return (name[1:], True) if name.startswith('-') else (name, False)
+
+    def _encode(self, payload):
+        return signing.dumps(payload, salt=self.salt, compress=True)
+
+    def _decode(self, cursor):
+        if not cursor:
+            return None
+        try:
+            return signing.loads(cursor, salt=self.salt)
+        except signing.BadSignature:
+            return None
+
+    def get_page(self, cursor=None, params=None):
+        """Retorna la CursorPage que corresponde a `cursor` (None: primera página)"""
+        payload = self._decode(cursor)
+        if self.keys is None:
+            return self._get_offset_page(payload, params)
+        return self._get_keyset_page(payload, params)
+
+    def _get_offset_page(self, payload, params):
+        offset = payload.get('o', 0) if isinstance(payload, dict) else 0
+        offset = max(int(offset), 0)
+        rows = list(self.queryset[offset:offset + self.per_page + 1])
+
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            next_cursor = self._encode({'o': offset + self.per_page})
+        previous_cursor = None
+        if offset > 0:
+            previous_cursor = self._encode({'o': max(offset - self.per_page, 0)})
+        return CursorPage(rows, next_cursor, previous_cursor, params)
+
+    def _get_keyset_page(self, payload, params):
+        values = None
+        backwards = False
+        if isinstance(payload, dict) and len(payload.get('k') or []) == len(self.keys):
+            try:
+                values = [
+                    self.model._meta.get_field(name).to_python(value)
+                    for (name, _), value in zip(self.keys, payload['k'])
+                ]
+            except (ValidationError, TypeError):
+                values = None
+            backwards = values is not None and payload.get('d') == 'p'
+
+        ordering = [('-' if desc != backwards else '') + name for name, desc in self.keys]
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._after(values, backwards))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or backwards:
+                next_cursor = self._cursor_for(rows[-1], 'n')
+            if values is not None and (has_more or not backwards):
+                previous_cursor = self._cursor_for(rows[0], 'p')
+        return CursorPage(rows, next_cursor, previous_cursor, params)
+
+    def _cursor_for(self, obj, direction):
+        values = [
+            self.model._meta.get_field(name).value_to_string(obj)
+            for name, _ in self.keys
+        ]
+        return self._encode({'k': values, 'd': direction})
+
+    def _after(self, values, backwards):
+        """
+        Condición "viene después de `values`" en el orden de las claves
+        (o antes, si `backwards`): (a > x) OR (a = x AND b > y) ...
+        """
+        condition = Q()
+        equal = {}
+        for (name, desc), value in zip(self.keys, values):
+            lookup = 'lt' if desc != backwards else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+
+def paginate(request, queryset, per_page, ordering=None):
+    """
+    Atajo para vistas: pagina con el cursor de `request.GET` y conserva los
+    demás parámetros (filtros, búsqueda) en los enlaces de la página
+    """
+    paginator = CursorPaginator(queryset, per_page, ordering)
+    return paginator.get_page(request.GET.get(CURSOR_PARAM), params=request.GET)
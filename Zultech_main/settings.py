@@ -14,6 +14,7 @@ from pathlib import Path
 import dj_database_url
 import os
 from dotenv import load_dotenv
+from Zultech_main.channel_layers import build_channel_layers
 
 # Cargar variables de entorno desde .env
 load_dotenv()
@@ -128,11 +129,32 @@ WSGI_APPLICATION = 'Zultech_main.wsgi.application'
 ASGI_APPLICATION = 'Zultech_main.asgi.application'
 
 # Channels Configuration
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-    },
-}
+# En memoria por defecto (un solo proceso); con REDIS_URL o REDIS_SENTINELS
+# se usa Redis para compartir los mensajes entre workers.
+# Ver Zultech_main/channel_layers.py
+CHANNEL_LAYERS = build_channel_layers(os.environ)
+
+# Mensajes por página del historial del chat (al conectar y con "load_older")
+CHAT_HISTORY_PAGE_SIZE = int(os.environ.get('CHAT_HISTORY_PAGE_SIZE', '50'))
+
+# Escritura diferida de mensajes del chat: se difunden al instante y se
+# guardan en lote cada CHAT_WRITE_BUFFER_SIZE mensajes o
+# CHAT_WRITE_BUFFER_DELAY segundos; un mensaje que no se puede guardar se
+# descarta tras CHAT_WRITE_MAX_ATTEMPTS intentos y con
+# CHAT_WRITE_BUFFER_MAX_PENDING pendientes se guarda sin buffer. Ver
+# app_room_chats/buffer.py
+CHAT_WRITE_BEHIND = os.environ.get('CHAT_WRITE_BEHIND', 'False') == 'True'
+CHAT_WRITE_BUFFER_SIZE = int(os.environ.get('CHAT_WRITE_BUFFER_SIZE', '100'))
+CHAT_WRITE_BUFFER_DELAY = float(os.environ.get('CHAT_WRITE_BUFFER_DELAY', '0.5'))
+CHAT_WRITE_MAX_ATTEMPTS = int(os.environ.get('CHAT_WRITE_MAX_ATTEMPTS', '3'))
+CHAT_WRITE_BUFFER_MAX_PENDING = int(os.environ.get('CHAT_WRITE_BUFFER_MAX_PENDING', '10000'))
+
+# Presencia e indicador de escritura del chat (solo capa de canales, ver
+# app_room_chats/presence.py): vencimiento de la presencia sin heartbeat,
+# duración del indicador en el navegador e intervalo mínimo entre eventos
+CHAT_PRESENCE_TTL = int(os.environ.get('CHAT_PRESENCE_TTL', '60'))
+CHAT_TYPING_TTL = int(os.environ.get('CHAT_TYPING_TTL', '5'))
+CHAT_TYPING_THROTTLE = float(os.environ.get('CHAT_TYPING_THROTTLE', '2'))
 
 
 # Database
@@ -283,6 +305,20 @@ SOCIALACCOUNT_LOGIN_ON_GET = True  # Reactivado para probar login automático
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Servicio de media desde Django (ver Zultech_main/media.py): desactivarlo si
+# un CDN o el servidor web sirve /media/. Los archivos con el hash de su
+# contenido en el nombre se cachean un año como immutable; el resto, estos
+# segundos con revalidación por ETag
+SERVE_MEDIA = os.environ.get('SERVE_MEDIA', 'True') == 'True'
+MEDIA_CACHE_MAX_AGE = int(os.environ.get('MEDIA_CACHE_MAX_AGE', '3600'))
+
+# Derivados de las imágenes de productos en segundo plano (ver
+# app_products/processing.py): hilos del proceso web que los generan (0 para
+# dejarlos solo a `manage.py generate_renditions --watch`) y segundos tras los
+# que una imagen en proceso de un worker caído vuelve a la cola
+PRODUCT_IMAGE_WORKERS = int(os.environ.get('PRODUCT_IMAGE_WORKERS', '2'))
+PRODUCT_IMAGE_STALE_AFTER = int(os.environ.get('PRODUCT_IMAGE_STALE_AFTER', '600'))
+
 # Email Configuration
 EMAIL_BACKEND_ENV = os.environ.get('EMAIL_BACKEND', 'console')
 
@@ -16,6 +16,7 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from Zultech_main.media import serve_media
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -44,7 +45,12 @@ urlpatterns += [
     path('chat/', include('app_room_chats.urls')),
 ]
 
-# Servir archivos media en desarrollo
+# Servir archivos media, también en producción (cache, ETag y Range)
+if settings.SERVE_MEDIA:
+    urlpatterns += [
+        path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", serve_media, name='media'),
+    ]
+
+# Servir archivos estáticos en desarrollo
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
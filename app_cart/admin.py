@@ -12,6 +12,10 @@ class CartItemInline(admin.TabularInline):
     fields = ('product', 'quantity', 'get_subtotal_display', 'created_at')
     can_delete = True
     
+    def get_queryset(self, request):
+        """Carga el producto y el subtotal calculado en la base de datos"""
+        return super().get_queryset(request).with_cart_totals()
+    
     def get_subtotal_display(self, obj):
         if obj.id:
             return f"${obj.get_subtotal():.2f}"
@@ -57,9 +61,9 @@ class CartAdmin(admin.ModelAdmin):
     )
     
     def get_queryset(self, request):
-        """Optimiza las consultas con select_related y prefetch_related"""
+        """Optimiza las consultas con select_related y totales calculados en la base de datos"""
         queryset = super().get_queryset(request)
-        return queryset.select_related('user').prefetch_related('items__product')
+        return queryset.select_related('user').with_totals()
     
     def get_owner(self, obj):
         if obj.user:
@@ -85,6 +89,7 @@ class CartAdmin(admin.ModelAdmin):
             return format_html('<span style="color: #888;">0</span>')
         return format_html('<strong>{}</strong>', count)
     get_total_items_display.short_description = "Items"
+    get_total_items_display.admin_order_field = '_total_items'
     
     def get_total_display(self, obj):
         total = obj.get_total()
@@ -92,6 +97,7 @@ class CartAdmin(admin.ModelAdmin):
             return format_html('<span style="color: #888;">$0.00</span>')
         return format_html('<strong style="color: #2e7d32;">${}</strong>', f"{total:.2f}")
     get_total_display.short_description = "Total"
+    get_total_display.admin_order_field = '_total'
     
     @admin.action(description='Limpiar carritos vacíos')
     def clear_empty_carts(self, request, queryset):
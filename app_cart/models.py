@@ -1,9 +1,58 @@
 from django.db import models
 from django.conf import settings
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum, Window
 from app_products.models import Product
+from decimal import Decimal
 import uuid
 
 
+def _subtotal(prefix=''):
+    """cantidad * precio calculado en la base de datos"""
+    return ExpressionWrapper(
+        F(f'{prefix}quantity') * F(f'{prefix}product__price'),
+        output_field=DecimalField(max_digits=12, decimal_places=2)
+    )
+
+
+def _sum_subtotal(prefix=''):
+    return Sum(_subtotal(prefix), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def _sum_quantity(prefix=''):
+    return Sum(f'{prefix}quantity')
+
+
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Anota el total y la cantidad de artículos de cada carrito"""
+        return self.annotate(
+            _total=_sum_subtotal('items__'),
+            _total_items=_sum_quantity('items__')
+        )
+
+
+class CartItemQuerySet(models.QuerySet):
+    def totals(self):
+        """Retorna el total y la cantidad de artículos con un único aggregate"""
+        result = self.aggregate(total=_sum_subtotal(), total_items=_sum_quantity())
+        return {
+            'total': result['total'] or Decimal('0.00'),
+            'total_items': result['total_items'] or 0,
+        }
+
+    def with_cart_totals(self):
+        """
+        Carga el producto con JOIN y anota en cada fila el subtotal del item
+        y los totales de su carrito (funciones de ventana), de modo que items
+        y totales se obtienen en un solo viaje a la base de datos
+        """
+        return self.select_related('product').annotate(
+            _subtotal=_subtotal(),
+            _cart_total=Window(_sum_subtotal(), partition_by=F('cart')),
+            _cart_total_items=Window(_sum_quantity(), partition_by=F('cart')),
+        )
+
+
 class Cart(models.Model):
     """Modelo para el carrito de compras"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -18,23 +67,43 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Carrito"
         verbose_name_plural = "Carritos"
         ordering = ['-updated_at']
+        indexes = [
+            # Limpieza de carritos antiguos
+            models.Index(fields=['updated_at'], name='cart_updated_idx'),
+        ]
 
     def __str__(self):
         if self.user:
             return f"Carrito de {self.user.username}"
         return f"Carrito (Sesión: {self.session_key})"
 
+    def get_contents(self):
+        """
+        Retorna (items, total, total_items): los items con su producto y los
+        totales calculados en la base de datos, en una sola consulta
+        """
+        items = list(self.items.with_cart_totals().select_related('product__category'))
+        if not items:
+            return items, Decimal('0.00'), 0
+        return items, items[0]._cart_total, items[0]._cart_total_items
+
     def get_total(self):
         """Calcula el total del carrito"""
-        return sum(item.get_subtotal() for item in self.items.all())
+        if hasattr(self, '_total'):
+            return self._total or Decimal('0.00')
+        return self.items.totals()['total']
 
     def get_total_items(self):
         """Obtiene el número total de artículos en el carrito"""
-        return sum(item.quantity for item in self.items.all())
+        if hasattr(self, '_total_items'):
+            return self._total_items or 0
+        return self.items.totals()['total_items']
 
     def clear(self):
         """Limpia todos los items del carrito"""
@@ -58,6 +127,8 @@ class CartItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Item del Carrito"
         verbose_name_plural = "Items del Carrito"
@@ -69,6 +140,8 @@ class CartItem(models.Model):
 
     def get_subtotal(self):
         """Calcula el subtotal del item"""
+        if hasattr(self, '_subtotal'):
+            return self._subtotal
         return self.product.price * self.quantity
 
     def save(self, *args, **kwargs):
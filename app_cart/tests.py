@@ -1,8 +1,14 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.core.cache import cache
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from app_products.models import Product, Category
+from app_products.models import Product, Category, ProductImage
 from .models import Cart, CartItem
+from .context_processors import cart_context
 from decimal import Decimal
 
 User = get_user_model()
@@ -57,6 +63,37 @@ class CartModelTest(TestCase):
         CartItem.objects.create(cart=self.cart, product=self.product2, quantity=3)
         self.assertEqual(self.cart.get_total_items(), 5)
     
+    def test_cart_get_contents(self):
+        """Test obtener items y totales en una sola consulta"""
+        CartItem.objects.create(cart=self.cart, product=self.product1, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.product2, quantity=3)
+        with self.assertNumQueries(1):
+            items, total, total_items = self.cart.get_contents()
+            self.assertEqual(total, Decimal('80.00'))
+            self.assertEqual(total_items, 5)
+            self.assertEqual(
+                {item.product.name: item.get_subtotal() for item in items},
+                {'Product 1': Decimal('20.00'), 'Product 2': Decimal('60.00')}
+            )
+
+    def test_cart_get_contents_empty(self):
+        """Test el contenido de un carrito vacío"""
+        self.assertEqual(self.cart.get_contents(), ([], Decimal('0.00'), 0))
+
+    def test_cart_with_totals(self):
+        """Test anotar los totales de varios carritos en una sola consulta"""
+        other_user = User.objects.create_user(username='other', password='testpass123')
+        other_cart = Cart.objects.create(user=other_user)
+        CartItem.objects.create(cart=self.cart, product=self.product1, quantity=2)
+        CartItem.objects.create(cart=other_cart, product=self.product2, quantity=1)
+        with self.assertNumQueries(1):
+            totals = {
+                cart.id: (cart.get_total(), cart.get_total_items())
+                for cart in Cart.objects.with_totals()
+            }
+        self.assertEqual(totals[self.cart.id], (Decimal('20.00'), 2))
+        self.assertEqual(totals[other_cart.id], (Decimal('20.00'), 1))
+
     def test_cart_clear(self):
         """Test limpiar carrito"""
         CartItem.objects.create(cart=self.cart, product=self.product1, quantity=2)
@@ -213,3 +250,97 @@ class CartViewTest(TestCase):
         )
         # Debe redirigir con mensaje de error
         self.assertEqual(response.status_code, 302)
+
+    def test_cart_view_query_count(self):
+        """Test el carrito no genera consultas por cada producto (N+1)"""
+        self.client.login(username='testuser', password='testpass123')
+        cart = Cart.objects.create(user=self.user)
+
+        def add_products(start, count):
+            for i in range(start, start + count):
+                product = Product.objects.create(
+                    category=self.category,
+                    name=f'Producto {i}',
+                    description='Test',
+                    price=Decimal('5.00'),
+                    stock=10
+                )
+                ProductImage.objects.create(product=product, image=f'products/p{i}.jpg')
+                CartItem.objects.create(cart=cart, product=product, quantity=1)
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(reverse('cart:cart_view'))
+            self.assertEqual(response.status_code, 200)
+            return len(context.captured_queries)
+
+        add_products(0, 2)
+        count_queries()  # Calienta las cachés de los context processors
+        baseline = count_queries()
+        add_products(2, 6)
+        self.assertEqual(count_queries(), baseline)
+
+
+class CartContextProcessorTest(TestCase):
+    """Tests para el contador del carrito en el contexto global"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.category = Category.objects.create(name='Test Category')
+        self.product = Product.objects.create(
+            category=self.category,
+            name='Test Product',
+            description='Test product',
+            price=Decimal('25.00'),
+            stock=50
+        )
+
+    def make_request(self, user):
+        request = self.factory.get('/')
+        request.user = user
+        request.session = SessionStore()
+        return request
+
+    def test_anonymous_without_session_has_no_queries(self):
+        """Test visitantes sin sesión no generan consultas"""
+        request = self.make_request(AnonymousUser())
+        with self.assertNumQueries(0):
+            self.assertEqual(cart_context(request)['cart_count'], 0)
+
+    def test_cart_count_is_cached(self):
+        """Test el contador se calcula con una consulta y luego se cachea"""
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=3)
+        request = self.make_request(self.user)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(cart_context(request)['cart_count'], 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(cart_context(request)['cart_count'], 3)
+
+    def test_cart_views_invalidate_count(self):
+        """Test las vistas del carrito invalidan el contador cacheado"""
+        self.client.login(username='testuser', password='testpass123')
+        request = self.make_request(self.user)
+        self.assertEqual(cart_context(request)['cart_count'], 0)
+
+        self.client.post(
+            reverse('cart:add_to_cart', kwargs={'product_id': self.product.id}),
+            {'quantity': 2}
+        )
+        self.assertEqual(cart_context(request)['cart_count'], 2)
+
+        self.client.post(
+            reverse('cart:update_cart', kwargs={'product_id': self.product.id}),
+            {'quantity': 5}
+        )
+        self.assertEqual(cart_context(request)['cart_count'], 5)
+
+        self.client.post(reverse('cart:clear_cart'))
+        self.assertEqual(cart_context(request)['cart_count'], 0)
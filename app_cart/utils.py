@@ -1,9 +1,56 @@
 """
 Utilidades para el manejo del carrito de compras
 """
+from decimal import Decimal
+from django.core.cache import cache
 from .models import Cart, CartItem
 from app_products.models import Product
 
+CART_SUMMARY_CACHE_TIMEOUT = 120  # segundos
+
+
+def get_cart_summary_cache_key(request):
+    """
+    Clave de caché del resumen del carrito: por usuario o por sesión.
+    Retorna None para visitantes anónimos sin sesión
+    """
+    if request.user.is_authenticated:
+        return f'cart:summary:user:{request.user.pk}'
+    if request.session.session_key:
+        return f'cart:summary:session:{request.session.session_key}'
+    return None
+
+
+def get_cart_summary(request):
+    """
+    Obtiene el número de artículos y el total del carrito actual.
+    Se calcula con un único SUM y se guarda en caché por usuario o sesión
+    """
+    cache_key = get_cart_summary_cache_key(request)
+    if cache_key is None:
+        return {'count': 0, 'total': Decimal('0.00')}
+
+    summary = cache.get(cache_key)
+    if summary is None:
+        if request.user.is_authenticated:
+            items = CartItem.objects.filter(cart__user=request.user)
+        else:
+            items = CartItem.objects.filter(cart__session_key=request.session.session_key)
+        totals = items.totals()
+        summary = {
+            'count': totals['total_items'],
+            'total': totals['total'],
+        }
+        cache.set(cache_key, summary, CART_SUMMARY_CACHE_TIMEOUT)
+    return summary
+
+
+def invalidate_cart_summary(request):
+    """Invalida el resumen cacheado después de modificar el carrito"""
+    cache_key = get_cart_summary_cache_key(request)
+    if cache_key is not None:
+        cache.delete(cache_key)
+
 
 def migrate_session_cart_to_db(request):
     """
@@ -44,20 +91,21 @@ def migrate_session_cart_to_db(request):
     # Limpiar el carrito de sesión
     request.session['cart'] = {}
     request.session.modified = True
+    invalidate_cart_summary(request)
 
 
 def get_cart_total(cart):
     """
     Calcula el total del carrito
     """
-    return sum(item.get_subtotal() for item in cart.items.all())
+    return cart.get_total()
 
 
 def get_cart_count(cart):
     """
     Obtiene el número total de items en el carrito
     """
-    return sum(item.quantity for item in cart.items.all())
+    return cart.get_total_items()
 
 
 def validate_cart_stock(cart):
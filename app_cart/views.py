@@ -1,10 +1,11 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import F
+from django.db.models import F, prefetch_related_objects
 from django.http import JsonResponse
 from app_products.models import Product
 from .models import Cart, CartItem
+from .utils import get_cart_summary, invalidate_cart_summary
 
 
 def get_or_create_cart(request):
@@ -30,13 +31,14 @@ def cart_view(request):
     Muestra todos los items del carrito
     """
     cart = get_or_create_cart(request)
-    cart_items = cart.items.select_related('product').all()
+    cart_items, cart_total, total_items = cart.get_contents()
+    prefetch_related_objects(cart_items, 'product__images')
 
     context = {
         'cart': cart,
         'cart_items': cart_items,
-        'cart_total': cart.get_total(),
-        'total_items': cart.get_total_items(),
+        'cart_total': cart_total,
+        'total_items': total_items,
     }
 
     return render(request, 'cart.html', context)
@@ -75,6 +77,7 @@ def add_to_cart(request, product_id):
 
             cart_item.quantity = new_quantity
             cart_item.save()
+            invalidate_cart_summary(request)
             messages.success(request, f'Cantidad de {product.name} actualizada en el carrito.')
 
         except CartItem.DoesNotExist:
@@ -91,6 +94,7 @@ def add_to_cart(request, product_id):
                 product=product,
                 quantity=quantity
             )
+            invalidate_cart_summary(request)
             messages.success(request, f'{product.name} agregado al carrito.')
 
     return redirect('cart:cart_view')
@@ -119,10 +123,12 @@ def update_cart(request, product_id):
                 else:
                     cart_item.quantity = quantity
                     cart_item.save()
+                    invalidate_cart_summary(request)
                     messages.success(request, 'Cantidad actualizada correctamente.')
             else:
                 # Si la cantidad es 0, eliminar el item
                 cart_item.delete()
+                invalidate_cart_summary(request)
                 messages.success(request, f'{product.name} eliminado del carrito.')
 
         except CartItem.DoesNotExist:
@@ -146,6 +152,7 @@ def remove_from_cart(request, product_id):
             cart_item = CartItem.objects.get(cart=cart, product=product)
             product_name = cart_item.product.name
             cart_item.delete()
+            invalidate_cart_summary(request)
             messages.success(request, f'{product_name} eliminado del carrito.')
         except CartItem.DoesNotExist:
             messages.error(request, 'El producto no está en tu carrito.')
@@ -161,6 +168,7 @@ def clear_cart(request):
     if request.method == 'POST':
         cart = get_or_create_cart(request)
         cart.clear()
+        invalidate_cart_summary(request)
         messages.success(request, 'Carrito vaciado correctamente.')
 
     return redirect('cart:cart_view')
@@ -169,8 +177,7 @@ def clear_cart(request):
 @login_required
 def checkout(request):
     """Proceso de checkout - crea orden y redirige al chat"""
-    from app_orders.models import Order, OrderItem
-    from decimal import Decimal
+    from app_orders.services import CheckoutError, checkout_cart
     
     cart = get_or_create_cart(request)
 
@@ -179,41 +186,18 @@ def checkout(request):
         return redirect('cart:cart_view')
 
     try:
-        # Crear la orden
-        order = Order.objects.create(
-            user=request.user,
-            status='pending',
-            total=Decimal('0.00')
-        )
-        
-        # Calcular total y crear items de la orden
-        total = Decimal('0.00')
-        for cart_item in cart.items.all():
-            # Usar el precio actual del producto
-            price = cart_item.product.price if hasattr(cart_item.product, 'price') else Decimal('0.00')
-            subtotal = price * cart_item.quantity
-            
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.product,
-                quantity=cart_item.quantity,
-                price=price,
-                subtotal=subtotal
-            )
-            total += subtotal
-        
-        # Actualizar el total de la orden
-        order.total = total
-        order.save()
-        
-        # Limpiar el carrito
-        cart.clear()
+        # Crear la orden, reservar stock y limpiar el carrito en una transacción
+        order = checkout_cart(cart, request.user)
+        invalidate_cart_summary(request)
         
         messages.success(request, 'Tu orden ha sido creada exitosamente. Ahora puedes chatear con un administrador para tu cotización.')
         
         # Redirigir a crear/obtener el chat de esta orden
         return redirect('room_chats:create_or_get_chat', order_id=order.id)
         
+    except CheckoutError as e:
+        messages.error(request, str(e))
+        return redirect('cart:cart_view')
     except Exception as e:
         messages.error(request, f'Hubo un error al procesar tu orden: {str(e)}')
         return redirect('cart:cart_view')
@@ -224,8 +208,8 @@ def cart_item_count(request):
     """
     API endpoint para obtener el número de items en el carrito
     """
-    cart = get_or_create_cart(request)
+    summary = get_cart_summary(request)
     return JsonResponse({
-        'count': cart.get_total_items(),
-        'total': float(cart.get_total())
+        'count': summary['count'],
+        'total': float(summary['total'])
     })
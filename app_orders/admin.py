@@ -1,8 +1,8 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from django.utils import timezone
 from django.db.models import Sum, Count, Q
 from .models import Order, OrderItem
+from .services import cancel_orders, set_orders_status
 
 
 class OrderItemInline(admin.TabularInline):
@@ -110,34 +110,31 @@ class OrderAdmin(admin.ModelAdmin):
     # Acciones personalizadas
     @admin.action(description='Marcar como En Proceso')
     def mark_as_processing(self, request, queryset):
-        updated = queryset.filter(status='pending').update(status='processing')
+        updated = set_orders_status(queryset, 'processing', ['pending'])
         self.message_user(request, f'{updated} orden(es) marcada(s) como En Proceso.')
     
     @admin.action(description='Marcar como Enviado')
     def mark_as_shipped(self, request, queryset):
-        updated = queryset.filter(status__in=['pending', 'processing']).update(status='shipped')
+        updated = set_orders_status(queryset, 'shipped', ['pending', 'processing'])
         self.message_user(request, f'{updated} orden(es) marcada(s) como Enviado.')
     
     @admin.action(description='Marcar como Entregado')
     def mark_as_delivered(self, request, queryset):
-        updated = queryset.filter(status='shipped').update(status='delivered')
+        updated = set_orders_status(queryset, 'delivered', ['shipped'])
         self.message_user(request, f'{updated} orden(es) marcada(s) como Entregado.')
     
     @admin.action(description='Marcar como Completado')
     def mark_as_completed(self, request, queryset):
-        updated = queryset.filter(status='delivered').update(
-            status='completed',
-            completed_at=timezone.now()
-        )
+        updated = set_orders_status(queryset, 'completed', ['delivered'])
         self.message_user(request, f'{updated} orden(es) marcada(s) como Completado.')
     
     @admin.action(description='Cancelar órdenes')
     def cancel_orders(self, request, queryset):
-        updated = queryset.filter(status='pending').update(
-            status='cancelled',
-            cancelled_at=timezone.now()
+        updated, restored_products = cancel_orders(queryset)
+        self.message_user(
+            request,
+            f'{updated} orden(es) cancelada(s). Se restauró el stock de {restored_products} producto(s).'
         )
-        self.message_user(request, f'{updated} orden(es) cancelada(s).')
 
 
 @admin.register(OrderItem)
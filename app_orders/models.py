@@ -1,10 +1,27 @@
 from django.db import models
+from django.db.models import Count, Prefetch
 from django.contrib.auth import get_user_model
 from app_products.models import Product
 import uuid
 
 User = get_user_model()
 
+ORDER_PREVIEW_ITEMS = 3
+
+
+class OrderQuerySet(models.QuerySet):
+    def with_item_preview(self, limit=ORDER_PREVIEW_ITEMS):
+        """
+        Anota la cantidad de artículos de cada orden (`item_count`) y precarga
+        solo los primeros `limit` con su producto en `preview_items`, para que
+        los listados rindan con un número fijo de consultas
+        """
+        preview = OrderItem.objects.select_related('product').order_by('pk')[:limit]
+        return self.annotate(item_count=Count('items')).prefetch_related(
+            Prefetch('items', queryset=preview, to_attr='preview_items')
+        )
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pendiente'),
@@ -24,8 +41,16 @@ class Order(models.Model):
     completed_at = models.DateTimeField(null=True, blank=True)
     cancelled_at = models.DateTimeField(null=True, blank=True)
     
+    objects = OrderQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Listados paginados por cursor: del usuario, del staff y por estado
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            models.Index(fields=['-created_at', '-id'], name='order_created_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='order_status_created_idx'),
+        ]
     
     def __str__(self):
         return f"Orden {self.id} - {self.user.email}"
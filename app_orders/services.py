@@ -0,0 +1,308 @@
+"""
+Servicios de órdenes: creación atómica de órdenes con reserva de stock,
+cancelación con devolución de stock y edición de líneas de cotizaciones
+
+Una orden no cancelada mantiene reservadas en Product.stock las cantidades
+de sus líneas: al editarlas se reserva o devuelve la diferencia, para que
+cancel_orders devuelva exactamente lo reservado.
+"""
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, QuerySet, Subquery, Sum, Value, When
+from django.utils import timezone
+from app_products.models import Product
+from app_room_chats.consumers import notify_order_status
+from .models import Order, OrderItem
+
+
+class CheckoutError(ValueError):
+    """Error de validación al crear una orden (stock o disponibilidad)"""
+
+
+def place_order(user, lines):
+    """
+    Crea una orden para `user` a partir de `lines`, un iterable de
+    (product_id, cantidad), dentro de una única transacción:
+
+    - bloquea los productos con select_for_update en orden de id, para que
+      checkouts concurrentes no se bloqueen mutuamente (deadlock)
+    - descuenta el stock con expresiones F() condicionadas a que haya stock
+    - crea los items con bulk_create y calcula el total en una sola pasada
+
+    Lanza CheckoutError si algún producto no existe, no está disponible o
+    no tiene stock suficiente; en ese caso no se modifica nada.
+    """
+    quantities = {}
+    for product_id, quantity in lines:
+        quantity = int(quantity)
+        if quantity < 1:
+            raise CheckoutError('La cantidad debe ser al menos 1.')
+        key = str(product_id)
+        quantities[key] = quantities.get(key, 0) + quantity
+
+    if not quantities:
+        raise CheckoutError('Tu carrito está vacío.')
+
+    with transaction.atomic():
+        products = list(
+            Product.objects.select_for_update()
+            .filter(id__in=quantities.keys())
+            .order_by('id')
+        )
+        if len(products) != len(quantities):
+            raise CheckoutError('Algunos productos de tu carrito ya no existen.')
+
+        for product in products:
+            quantity = quantities[str(product.id)]
+            if not product.available:
+                raise CheckoutError(f'{product.name} no está disponible actualmente.')
+            if product.stock < quantity:
+                raise CheckoutError(
+                    f'No hay suficiente stock de {product.name}. '
+                    f'Stock disponible: {product.stock}'
+                )
+
+            # La condición stock__gte protege incluso si el motor no soporta
+            # bloqueos de fila (SQLite)
+            updated = Product.objects.filter(id=product.id, stock__gte=quantity).update(
+                stock=F('stock') - quantity
+            )
+            if not updated:
+                raise CheckoutError(f'No hay suficiente stock de {product.name}.')
+
+        order = Order(user=user, status='pending')
+        items = []
+        total = Decimal('0.00')
+        for product in products:
+            quantity = quantities[str(product.id)]
+            subtotal = product.price * quantity
+            items.append(OrderItem(
+                order=order,
+                product=product,
+                quantity=quantity,
+                price=product.price,
+                subtotal=subtotal
+            ))
+            total += subtotal
+
+        order.total = total
+        order.save()
+        OrderItem.objects.bulk_create(items)
+
+    return order
+
+
+def checkout_cart(cart, user):
+    """
+    Convierte el carrito en una orden y lo vacía, todo en la misma transacción
+    """
+    with transaction.atomic():
+        lines = cart.items.values_list('product_id', 'quantity')
+        order = place_order(user, lines)
+        cart.clear()
+    return order
+
+
+def cancel_orders(orders, allowed_statuses=('pending',)):
+    """
+    Cancela las órdenes de `orders` (queryset o iterable de órdenes/ids) cuyo
+    estado esté en `allowed_statuses` y devuelve su stock, con un número
+    fijo de consultas sin importar cuántas órdenes o items haya:
+
+    - bloquea las órdenes a cancelar con select_for_update
+    - suma las cantidades por producto y las devuelve con un único UPDATE
+      (stock = stock + cantidad) basado en subconsultas
+    - marca todas las órdenes como canceladas con un único UPDATE y avisa
+      a la bandeja de los admins al confirmar (ver set_orders_status)
+
+    Retorna una tupla (órdenes_canceladas, productos_restaurados).
+    """
+    with transaction.atomic():
+        previous = _lock_orders(orders, allowed_statuses)
+        if not previous:
+            return 0, 0
+        order_ids = list(previous)
+
+        items = OrderItem.objects.filter(order_id__in=order_ids, product__isnull=False)
+        restored_quantity = (
+            items.filter(product=OuterRef('pk'))
+            .order_by()
+            .values('product')
+            .annotate(total=Sum('quantity'))
+            .values('total')
+        )
+        restored_products = Product.objects.filter(
+            pk__in=items.values('product')
+        ).update(stock=F('stock') + Subquery(restored_quantity))
+
+        cancelled = Order.objects.filter(pk__in=order_ids).update(
+            status='cancelled',
+            cancelled_at=timezone.now()
+        )
+        _notify_status_changes(previous, 'cancelled')
+
+    return cancelled, restored_products
+
+
+def _lock_orders(orders, allowed_statuses):
+    """
+    Bloquea las órdenes de `orders` (queryset o iterable de órdenes/ids) cuyo
+    estado esté en `allowed_statuses`. Retorna {id: estado actual}.
+    """
+    if not isinstance(orders, QuerySet):
+        orders = [getattr(order, 'pk', order) for order in orders]
+    return dict(
+        Order.objects.select_for_update()
+        .filter(pk__in=orders, status__in=allowed_statuses)
+        .order_by('pk')
+        .values_list('pk', 'status')
+    )
+
+
+def _notify_status_changes(previous, status):
+    """Avisa a la bandeja de los admins (al confirmar) de cada orden que cambió de estado"""
+    for order_id, previous_status in previous.items():
+        if previous_status != status:
+            notify_order_status(order_id, previous_status, status)
+
+
+def set_orders_status(orders, status, allowed_statuses):
+    """
+    Cambia a `status` las órdenes de `orders` cuyo estado esté en
+    `allowed_statuses` con un único UPDATE y avisa a la bandeja de los
+    admins de cada cambio. Para cancelar (con devolución de stock) se usa
+    cancel_orders. Retorna cuántas órdenes cambiaron.
+    """
+    fields = {'status': status, 'updated_at': timezone.now()}
+    if status == 'completed':
+        fields['completed_at'] = fields['updated_at']
+
+    with transaction.atomic():
+        previous = _lock_orders(orders, allowed_statuses)
+        if not previous:
+            return 0
+        updated = Order.objects.filter(pk__in=list(previous)).update(**fields)
+        _notify_status_changes(previous, status)
+    return updated
+
+
+def recalculate_order_total(order):
+    """Recalcula el total de la orden con un único SUM sobre sus items"""
+    total = order.items.aggregate(total=Sum('subtotal'))['total'] or Decimal('0.00')
+    Order.objects.filter(pk=order.pk).update(total=total, updated_at=timezone.now())
+    order.total = total
+    return total
+
+
+def _lock_order(order):
+    """
+    Bloquea la orden para serializar ediciones concurrentes de sus líneas.
+    Retorna si la orden mantiene stock reservado (no está cancelada).
+    """
+    status = Order.objects.select_for_update().values_list('status', flat=True).get(pk=order.pk)
+    return status != 'cancelled'
+
+
+def _apply_stock_deltas(deltas):
+    """
+    Reserva (delta positivo) o devuelve (delta negativo) stock según
+    `deltas`, {product_id: unidades}, como place_order: bloquea los
+    productos en orden de id y los actualiza con un único UPDATE condicionado
+    a que haya stock. Lanza CheckoutError si algún producto no alcanza.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if pk is not None and delta}
+    if not deltas:
+        return
+
+    products = list(
+        Product.objects.select_for_update()
+        .filter(id__in=deltas.keys())
+        .order_by('id')
+        .only('id', 'name', 'stock')
+    )
+    for product in products:
+        if product.stock < deltas[product.id]:
+            raise CheckoutError(
+                f'No hay suficiente stock de {product.name}. '
+                f'Stock disponible: {product.stock}'
+            )
+
+    # La condición stock__gte protege incluso si el motor no soporta
+    # bloqueos de fila (SQLite)
+    enough = Q(id__in=[pk for pk, delta in deltas.items() if delta < 0])
+    for pk, delta in deltas.items():
+        if delta > 0:
+            enough |= Q(id=pk, stock__gte=delta)
+    updated = Product.objects.filter(enough).update(stock=F('stock') - Case(
+        *[When(id=pk, then=Value(delta)) for pk, delta in deltas.items()],
+        output_field=IntegerField()
+    ))
+    if updated != len(products):
+        raise CheckoutError('No hay suficiente stock para los cambios de la cotización.')
+
+
+def update_order_lines(order, items):
+    """
+    Guarda en bloque los cambios de precio y cantidad de `items` (instancias
+    de OrderItem de `order` ya modificadas), reserva o devuelve el stock de
+    las cantidades cambiadas y recalcula el total de la orden, con un número
+    fijo de consultas dentro de una transacción.
+    Lanza CheckoutError si no hay stock para las nuevas cantidades.
+    """
+    for item in items:
+        item.subtotal = item.price * item.quantity
+
+    with transaction.atomic():
+        if _lock_order(order):
+            previous = dict(
+                OrderItem.objects.filter(order=order, pk__in=[item.pk for item in items])
+                .values_list('pk', 'quantity')
+            )
+            deltas = {}
+            for item in items:
+                delta = item.quantity - previous.get(item.pk, item.quantity)
+                deltas[item.product_id] = deltas.get(item.product_id, 0) + delta
+            _apply_stock_deltas(deltas)
+        OrderItem.objects.bulk_update(items, ['price', 'quantity', 'subtotal'])
+        return recalculate_order_total(order)
+
+
+def add_order_line(order, product, quantity, price=None):
+    """
+    Agrega `quantity` unidades de `product` a la orden. Si el producto ya
+    está en la orden se suma la cantidad manteniendo su precio; si no, se
+    crea un item con `price` (o el precio actual del producto). Reserva el
+    stock agregado; lanza CheckoutError si no alcanza.
+    Retorna (item, creado).
+    """
+    with transaction.atomic():
+        if _lock_order(order):
+            _apply_stock_deltas({product.pk: quantity})
+        item = order.items.filter(product=product).first()
+        created = item is None
+        if created:
+            price = product.price if price is None else price
+            item = OrderItem.objects.create(
+                order=order,
+                product=product,
+                quantity=quantity,
+                price=price,
+                subtotal=price * quantity
+            )
+        else:
+            item.quantity += quantity
+            item.subtotal = item.price * item.quantity
+            item.save(update_fields=['quantity', 'subtotal'])
+        recalculate_order_total(order)
+    return item, created
+
+
+def remove_order_line(order, item):
+    """Elimina un item de la orden, devuelve su stock reservado y recalcula el total"""
+    with transaction.atomic():
+        if _lock_order(order):
+            quantity = OrderItem.objects.filter(pk=item.pk).values_list('quantity', flat=True).first()
+            if quantity:
+                _apply_stock_deltas({item.product_id: -quantity})
+        item.delete()
+        return recalculate_order_total(order)
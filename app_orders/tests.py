@@ -1,3 +1,568 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.test import TestCase, TransactionTestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection
+from django.urls import reverse
+from django.utils import timezone
+from app_cart.models import Cart, CartItem
+from app_products.models import Category, Product
+from .models import Order, OrderItem
+from .services import (
+    CheckoutError,
+    add_order_line,
+    cancel_orders,
+    place_order,
+    remove_order_line,
+    update_order_lines,
+)
 
-# Create your tests here.
+User = get_user_model()
+
+
+class PlaceOrderTest(TestCase):
+    """Tests para el servicio de creación de órdenes"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.category = Category.objects.create(name='Test Category')
+        self.product1 = Product.objects.create(
+            category=self.category,
+            name='Product 1',
+            description='Test product 1',
+            price=Decimal('10.00'),
+            stock=5
+        )
+        self.product2 = Product.objects.create(
+            category=self.category,
+            name='Product 2',
+            description='Test product 2',
+            price=Decimal('20.00'),
+            stock=3
+        )
+
+    def test_place_order_creates_items_and_decrements_stock(self):
+        """Test la orden crea sus items, calcula el total y descuenta stock"""
+        order = place_order(self.user, [(self.product1.id, 2), (self.product2.id, 3)])
+
+        self.assertEqual(order.total, Decimal('80.00'))
+        self.assertEqual(order.items.count(), 2)
+        self.product1.refresh_from_db()
+        self.product2.refresh_from_db()
+        self.assertEqual(self.product1.stock, 3)
+        self.assertEqual(self.product2.stock, 0)
+
+    def test_place_order_insufficient_stock_rolls_back(self):
+        """Test sin stock suficiente no se crea la orden ni se toca el stock"""
+        with self.assertRaises(CheckoutError):
+            place_order(self.user, [(self.product1.id, 2), (self.product2.id, 4)])
+
+        self.assertFalse(Order.objects.exists())
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.stock, 5)
+
+    def test_place_order_unavailable_product(self):
+        """Test no se pueden ordenar productos no disponibles"""
+        self.product1.available = False
+        self.product1.save()
+        with self.assertRaises(CheckoutError):
+            place_order(self.user, [(self.product1.id, 1)])
+
+    def test_place_order_query_count_is_constant(self):
+        """Test los items se insertan en bloque, sin INSERT por item"""
+        with self.assertNumQueries(7):
+            place_order(self.user, [(self.product1.id, 1), (self.product2.id, 1)])
+
+    def test_checkout_view(self):
+        """Test el checkout convierte el carrito en una orden"""
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product1, quantity=2)
+        client = Client()
+        client.login(username='testuser', password='testpass123')
+
+        response = client.get(reverse('cart:checkout'))
+
+        order = Order.objects.get(user=self.user)
+        self.assertRedirects(
+            response,
+            reverse('room_chats:create_or_get_chat', kwargs={'order_id': order.id}),
+            fetch_redirect_response=False
+        )
+        self.assertEqual(order.total, Decimal('20.00'))
+        self.assertEqual(cart.items.count(), 0)
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.stock, 3)
+
+
+class CancelOrdersTest(TestCase):
+    """Tests para la cancelación de órdenes con devolución de stock"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.staff = User.objects.create_superuser(username='staff', password='testpass123')
+        self.category = Category.objects.create(name='Test Category')
+        self.product1 = Product.objects.create(
+            category=self.category,
+            name='Product 1',
+            description='Test product 1',
+            price=Decimal('10.00'),
+            stock=50
+        )
+        self.product2 = Product.objects.create(
+            category=self.category,
+            name='Product 2',
+            description='Test product 2',
+            price=Decimal('20.00'),
+            stock=50
+        )
+        self.client = Client()
+
+    def create_orders(self, count):
+        return [
+            place_order(self.user, [(self.product1.id, 2), (self.product2.id, 1)])
+            for _ in range(count)
+        ]
+
+    def assertStock(self, product1, product2):
+        self.product1.refresh_from_db()
+        self.product2.refresh_from_db()
+        self.assertEqual((self.product1.stock, self.product2.stock), (product1, product2))
+
+    def test_cancel_orders_restores_stock_with_constant_queries(self):
+        """Test cancelar muchas órdenes usa un número fijo de consultas"""
+        self.create_orders(10)
+        self.assertStock(30, 40)
+
+        with self.assertNumQueries(5):
+            cancelled, restored = cancel_orders(Order.objects.all())
+
+        self.assertEqual((cancelled, restored), (10, 2))
+        self.assertStock(50, 50)
+        self.assertFalse(Order.objects.exclude(status='cancelled').exists())
+
+    def test_cancel_orders_skips_other_statuses(self):
+        """Test las órdenes que no están pendientes no se cancelan dos veces"""
+        first, second = self.create_orders(2)
+        Order.objects.filter(id=second.id).update(status='cancelled')
+
+        self.assertEqual(cancel_orders(Order.objects.all()), (1, 2))
+        self.assertStock(48, 49)
+
+    def test_customer_cancel_view(self):
+        """Test el cliente cancela su orden y se devuelve el stock"""
+        order = self.create_orders(1)[0]
+        self.client.login(username='testuser', password='testpass123')
+
+        self.client.post(reverse('orders:cancel_order', kwargs={'order_id': order.id}))
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'cancelled')
+        self.assertIsNotNone(order.cancelled_at)
+        self.assertStock(50, 50)
+
+    def test_staff_cancel_view(self):
+        """Test el staff cancela una orden en proceso y se devuelve el stock"""
+        order = self.create_orders(1)[0]
+        Order.objects.filter(id=order.id).update(status='processing')
+        self.client.force_login(self.staff)
+
+        self.client.post(
+            reverse('orders:admin_order_update', kwargs={'order_id': order.id}),
+            {'status': 'cancelled'}
+        )
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'cancelled')
+        self.assertStock(50, 50)
+
+    def test_admin_cancel_action(self):
+        """Test la acción masiva del admin devuelve el stock"""
+        orders = self.create_orders(3)
+        self.client.force_login(self.staff)
+
+        self.client.post(reverse('admin:app_orders_order_changelist'), {
+            'action': 'cancel_orders',
+            '_selected_action': [str(order.id) for order in orders],
+        })
+
+        self.assertEqual(Order.objects.filter(status='cancelled').count(), 3)
+        self.assertStock(50, 50)
+
+
+class OrderStatusNotificationTest(TestCase):
+    """Los cambios de estado de órdenes desde el admin avisan a la bandeja en vivo"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.staff = User.objects.create_superuser(username='staff', password='testpass123')
+        self.client = Client()
+        self.client.force_login(self.staff)
+
+    def run_action(self, action, orders):
+        with mock.patch('app_orders.services.notify_order_status') as notify, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:app_orders_order_changelist'), {
+                'action': action,
+                '_selected_action': [str(order.id) for order in orders],
+            })
+        return sorted(call.args for call in notify.call_args_list)
+
+    def test_bulk_status_actions_notify_each_changed_order(self):
+        """Test las acciones masivas notifican solo las órdenes que cambiaron de estado"""
+        pending = [Order.objects.create(user=self.user) for _ in range(2)]
+        shipped = Order.objects.create(user=self.user, status='shipped')
+
+        calls = self.run_action('mark_as_processing', [*pending, shipped])
+        self.assertEqual(calls, sorted((order.id, 'pending', 'processing') for order in pending))
+        self.assertEqual(Order.objects.filter(status='processing').count(), 2)
+
+        calls = self.run_action('mark_as_delivered', [shipped])
+        self.assertEqual(calls, [(shipped.id, 'shipped', 'delivered')])
+        calls = self.run_action('mark_as_completed', [shipped])
+        self.assertEqual(calls, [(shipped.id, 'delivered', 'completed')])
+        shipped.refresh_from_db()
+        self.assertIsNotNone(shipped.completed_at)
+
+    def test_admin_cancel_action_notifies(self):
+        """Test cancelar desde el admin notifica cada orden cancelada"""
+        order = Order.objects.create(user=self.user)
+        calls = self.run_action('cancel_orders', [order])
+        self.assertEqual(calls, [(order.id, 'pending', 'cancelled')])
+
+
+class OrderLineEditingTest(TestCase):
+    """Tests para la edición de líneas de cotizaciones por el staff"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.staff = User.objects.create_superuser(username='staff', password='testpass123')
+        self.category = Category.objects.create(name='Test Category')
+        self.order = Order.objects.create(user=self.user)
+        self.client = Client()
+        self.client.force_login(self.staff)
+
+    def create_lines(self, count):
+        products = [
+            Product(
+                category=self.category,
+                name=f'Product {i}',
+                slug=f'product-{i}',
+                description='Test',
+                price=Decimal('10.00'),
+                stock=100
+            )
+            for i in range(count)
+        ]
+        Product.objects.bulk_create(products)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=self.order, product=product, quantity=1,
+                      price=product.price, subtotal=product.price)
+            for product in products
+        ])
+        return products
+
+    def test_update_order_lines_constant_queries(self):
+        """Test editar una cotización grande usa un número fijo de consultas"""
+        self.create_lines(200)
+        items = list(self.order.items.all())
+        for item in items:
+            item.price = Decimal('2.50')
+            item.quantity = 4
+
+        with CaptureQueriesContext(connection) as context:
+            total = update_order_lines(self.order, items)
+
+        # Incluye las cantidades anteriores y la reserva del stock (bloqueo + UPDATE)
+        self.assertLessEqual(len(context.captured_queries), 10)
+        self.assertEqual(total, Decimal('2000.00'))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total, Decimal('2000.00'))
+
+    def test_update_prices_view(self):
+        """Test la vista aplica los cambios válidos y recalcula el total"""
+        self.create_lines(2)
+        first, second = self.order.items.all()
+
+        self.client.post(
+            reverse('orders:admin_update_prices', kwargs={'order_id': self.order.id}),
+            {
+                f'price_{first.id}': '5.00', f'quantity_{first.id}': '3',
+                f'price_{second.id}': '-1', f'quantity_{second.id}': '1',
+            }
+        )
+
+        first.refresh_from_db()
+        self.assertEqual((first.price, first.quantity, first.subtotal),
+                         (Decimal('5.00'), 3, Decimal('15.00')))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total, Decimal('25.00'))
+
+    def test_add_and_remove_product_views(self):
+        """Test agregar y eliminar productos mantiene el total actualizado"""
+        product = self.create_lines(1)[0]
+        url = reverse('orders:admin_add_product', kwargs={'order_id': self.order.id})
+
+        self.client.post(url, {'product_id': product.id, 'quantity': 2})
+        item = self.order.items.get()
+        self.assertEqual(item.quantity, 3)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total, Decimal('30.00'))
+
+        self.client.post(reverse(
+            'orders:admin_remove_product',
+            kwargs={'order_id': self.order.id, 'item_id': item.id}
+        ))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total, Decimal('0.00'))
+        self.assertFalse(self.order.items.exists())
+
+
+class OrderLineStockTest(TestCase):
+    """Tests para la reserva de stock al editar las líneas de una orden"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.category = Category.objects.create(name='Test Category')
+        self.product1 = Product.objects.create(
+            category=self.category, name='Product 1', description='Test',
+            price=Decimal('10.00'), stock=10
+        )
+        self.product2 = Product.objects.create(
+            category=self.category, name='Product 2', description='Test',
+            price=Decimal('20.00'), stock=10
+        )
+        self.order = place_order(self.user, [(self.product1.id, 2), (self.product2.id, 3)])
+
+    def assertStock(self, product1, product2):
+        self.product1.refresh_from_db()
+        self.product2.refresh_from_db()
+        self.assertEqual((self.product1.stock, self.product2.stock), (product1, product2))
+
+    def test_edit_quantities_then_cancel_restores_initial_stock(self):
+        """Test subir y bajar cantidades reserva la diferencia y cancelar devuelve el stock inicial"""
+        first, second = self.order.items.order_by('product__name')
+        first.quantity = 5
+        second.quantity = 1
+        update_order_lines(self.order, [first, second])
+        self.assertStock(5, 9)
+
+        cancel_orders([self.order])
+        self.assertStock(10, 10)
+
+    def test_add_and_remove_lines_then_cancel_restores_initial_stock(self):
+        """Test agregar y eliminar líneas reserva y devuelve su stock"""
+        add_order_line(self.order, self.product1, 4)
+        self.assertStock(4, 7)
+        remove_order_line(self.order, self.order.items.get(product=self.product2))
+        self.assertStock(4, 10)
+
+        cancel_orders([self.order])
+        self.assertStock(10, 10)
+
+    def test_edit_beyond_stock_changes_nothing(self):
+        """Test una cantidad mayor al stock disponible falla sin modificar la orden ni el stock"""
+        item = self.order.items.get(product=self.product1)
+        item.quantity = 11
+        with self.assertRaises(CheckoutError):
+            update_order_lines(self.order, [item])
+        with self.assertRaises(CheckoutError):
+            add_order_line(self.order, self.product2, 8)
+
+        self.assertStock(8, 7)
+        self.assertEqual(
+            sorted(self.order.items.values_list('quantity', flat=True)), [2, 3]
+        )
+
+    def test_cancelled_order_edits_do_not_touch_stock(self):
+        """Test editar una orden cancelada no vuelve a reservar stock"""
+        cancel_orders([self.order])
+        add_order_line(self.order, self.product1, 4)
+        self.assertStock(10, 10)
+
+
+class OrderListPaginationTest(TestCase):
+    """Tests para la paginación por cursor de los listados de órdenes"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client = Client()
+        self.client.force_login(self.user)
+        now = timezone.now()
+        self.orders = [Order.objects.create(user=self.user) for _ in range(25)]
+        for i, order in enumerate(self.orders):
+            # Pares de órdenes con la misma fecha para probar el desempate por id
+            Order.objects.filter(id=order.id).update(created_at=now - timedelta(minutes=i // 2))
+        self.expected = list(
+            Order.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+
+    def walk(self, url):
+        """Recorre las páginas hacia adelante y luego hacia atrás"""
+        pages = []
+        response = self.client.get(url)
+        while True:
+            page = response.context['orders']
+            pages.append([order.id for order in page])
+            if not page.has_next:
+                break
+            response = self.client.get(f'{url}?{page.next_querystring}')
+
+        backwards = [pages[-1]]
+        while page.has_previous:
+            response = self.client.get(f'{url}?{page.previous_querystring}')
+            page = response.context['orders']
+            backwards.append([order.id for order in page])
+        return pages, backwards[::-1]
+
+    def test_order_list_walks_all_pages(self):
+        """Test las páginas cubren todas las órdenes, sin repetir, en ambos sentidos"""
+        pages, backwards = self.walk(reverse('orders:order_list'))
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertEqual(backwards, pages)
+
+    def test_deep_page_costs_the_same(self):
+        """Test una página profunda usa las mismas consultas que la primera"""
+        url = reverse('orders:order_list')
+        self.client.get(url)  # Calienta las cachés de los context processors
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get(url)
+        page = response.context['orders']
+        page = self.client.get(f'{url}?{page.next_querystring}').context['orders']
+        with CaptureQueriesContext(connection) as deep:
+            self.client.get(f'{url}?{page.next_querystring}')
+        self.assertEqual(len(deep.captured_queries), len(first.captured_queries))
+        self.assertFalse(any(
+            query['sql'].startswith('SELECT COUNT(') and 'FROM "app_orders_order"' in query['sql']
+            for query in deep.captured_queries
+        ))
+
+    def test_tampered_cursor_returns_first_page(self):
+        """Test un cursor inválido muestra la primera página"""
+        response = self.client.get(reverse('orders:order_list'), {'cursor': 'no-valido'})
+        self.assertEqual([order.id for order in response.context['orders']], self.expected[:10])
+
+    def test_order_history_is_oldest_first(self):
+        """Test el historial pagina de la orden más antigua a la más reciente"""
+        pages, _ = self.walk(reverse('orders:order_history'))
+        self.assertEqual(sum(pages, []), self.expected[::-1])
+
+    def test_order_list_api(self):
+        """Test la variante JSON devuelve el cursor de la página siguiente"""
+        url = reverse('orders:order_list_api')
+        data = self.client.get(url).json()
+        self.assertEqual(len(data['results']), 10)
+        self.assertIsNone(data['previous_cursor'])
+
+        data = self.client.get(url, {'cursor': data['next_cursor']}).json()
+        self.assertEqual(
+            [result['id'] for result in data['results']],
+            [str(order_id) for order_id in self.expected[10:20]]
+        )
+
+
+class OrderListPreviewTest(TestCase):
+    """Tests para la vista previa de artículos en los listados de órdenes"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client = Client()
+        self.client.force_login(self.user)
+        category = Category.objects.create(name='Test Category')
+        self.products = [
+            Product.objects.create(category=category, name=f'Product {i}', description='Test',
+                                   price=Decimal('10.00'), stock=10)
+            for i in range(5)
+        ]
+
+    def create_orders(self, count, items=5):
+        for _ in range(count):
+            order = Order.objects.create(user=self.user)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=1, price=product.price, subtotal=product.price)
+                for product in self.products[:items]
+            ])
+
+    def count_queries(self, url):
+        self.client.get(url)  # Calienta las cachés de los context processors
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return len(queries.captured_queries), response
+
+    def test_with_item_preview(self):
+        """Test anota la cantidad de artículos y precarga solo los primeros"""
+        self.create_orders(1, items=5)
+        self.create_orders(1, items=2)
+        with self.assertNumQueries(2):
+            orders = list(Order.objects.with_item_preview())
+            self.assertEqual(sorted(order.item_count for order in orders), [2, 5])
+            self.assertEqual(sorted(len(order.preview_items) for order in orders), [2, 3])
+            self.assertTrue(all(item.product.name for order in orders for item in order.preview_items))
+
+    def test_listing_queries_do_not_depend_on_page_size(self):
+        """Test las páginas usan las mismas consultas con 1 o 10 órdenes"""
+        for name in ['orders:order_list', 'orders:order_history']:
+            url = reverse(name)
+            Order.objects.all().delete()
+            self.create_orders(1)
+            single, _ = self.count_queries(url)
+            self.create_orders(9)
+            full, response = self.count_queries(url)
+            self.assertEqual(single, full, name)
+            self.assertContains(response, '+2 productos más', count=10)
+
+
+class ConcurrentCheckoutTest(TransactionTestCase):
+    """Checkouts en paralelo sobre un producto con poco stock"""
+
+    def test_parallel_checkouts_do_not_oversell(self):
+        category = Category.objects.create(name='Test Category')
+        product = Product.objects.create(
+            category=category,
+            name='Low stock',
+            description='Test',
+            price=Decimal('10.00'),
+            stock=3
+        )
+        users = [
+            User.objects.create_user(username=f'buyer{i}', password='testpass123')
+            for i in range(12)
+        ]
+        barrier = threading.Barrier(len(users))
+
+        results = []
+
+        def buy(user):
+            try:
+                barrier.wait()
+                while True:
+                    try:
+                        place_order(user, [(product.id, 1)])
+                        results.append('sold')
+                        return
+                    except CheckoutError:
+                        results.append('out_of_stock')
+                        return
+                    except OperationalError:
+                        # Base de datos bloqueada por otro checkout (SQLite): reintentar
+                        time.sleep(0.01)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        sold = sum(OrderItem.objects.filter(product=product).values_list('quantity', flat=True))
+        self.assertEqual(sorted(results), ['out_of_stock'] * 9 + ['sold'] * 3)
+        self.assertEqual(sold, 3)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertEqual(OrderItem.objects.count(), 3)
@@ -6,6 +6,7 @@ app_name = 'orders'
 urlpatterns = [
     path('', views.order_list, name='order_list'),
     path('history/', views.order_history, name='order_history'),
+    path('api/', views.order_list_api, name='order_list_api'),
     path('create/', views.create_order, name='create_order'),
     
     # URLs para administradores (DEBEN IR ANTES de las rutas genéricas)
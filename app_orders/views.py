@@ -2,31 +2,50 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.core.paginator import Paginator
+from django.http import JsonResponse
+from django.urls import reverse
+from Zultech_main.pagination import paginate
 from .models import Order, OrderItem
+from .services import (
+    CheckoutError,
+    add_order_line,
+    cancel_orders,
+    place_order,
+    remove_order_line,
+    set_orders_status,
+    update_order_lines,
+)
 from app_products.models import Product
 from django.db.models import Q
-from django.utils import timezone
 
 @login_required
 def order_list(request):
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    orders = Order.objects.filter(user=request.user).with_item_preview()
     
-    # Paginación
-    page = request.GET.get('page', 1)
-    paginator = Paginator(orders, 10)
-    orders = paginator.get_page(page)
+    # Paginación por cursor
+    orders = paginate(request, orders, 10, ['-created_at'])
     
     return render(request, 'orders/order_list.html', {'orders': orders})
 
+@login_required
+def order_list_api(request):
+    """Variante JSON de los pedidos del usuario, con paginación por cursor"""
+    orders = paginate(request, Order.objects.filter(user=request.user), 10, ['-created_at'])
+    return JsonResponse(orders.to_dict(lambda order: {
+        'id': str(order.id),
+        'status': order.status,
+        'status_display': order.get_status_display(),
+        'total': str(order.total),
+        'created_at': order.created_at.isoformat(),
+        'url': reverse('orders:order_detail', kwargs={'order_id': order.id}),
+    }))
+
 @login_required
 def order_history(request):
-    orders = Order.objects.filter(user=request.user).order_by('created_at')
+    orders = Order.objects.filter(user=request.user).with_item_preview()
     
-    # Paginación
-    page = request.GET.get('page', 1)
-    paginator = Paginator(orders, 10)
-    orders = paginator.get_page(page)
+    # Paginación por cursor
+    orders = paginate(request, orders, 10, ['created_at'])
     
     return render(request, 'orders/order_history.html', {'orders': orders})
 
@@ -38,40 +57,12 @@ def create_order(request):
         messages.error(request, 'Tu carrito está vacío.')
         return redirect('cart:cart_view')
     
-    # Verificar stock antes de crear la orden
-    for product_id, quantity in cart.items():
-        product = get_object_or_404(Product, id=product_id)
-        if product.stock < quantity:
-            messages.error(request, f'No hay suficiente stock de {product.name}.')
-            return redirect('cart:cart_view')
-    
-    # Crear la orden
-    order = Order.objects.create(user=request.user, status='pending')
-    
-    # Crear los items de la orden y actualizar el stock
-    total = 0
-    for product_id, quantity in cart.items():
-        product = Product.objects.get(id=product_id)
-        price = product.price
-        subtotal = price * quantity
-        
-        OrderItem.objects.create(
-            order=order,
-            product=product,
-            quantity=quantity,
-            price=price,
-            subtotal=subtotal
-        )
-        
-        # Actualizar stock
-        product.stock -= quantity
-        product.save()
-        
-        total += subtotal
-    
-    # Actualizar el total de la orden
-    order.total = total
-    order.save()
+    # Verificar stock, crear la orden y actualizar el stock en una transacción
+    try:
+        order = place_order(request.user, cart.items())
+    except CheckoutError as e:
+        messages.error(request, str(e))
+        return redirect('cart:cart_view')
     
     # Limpiar el carrito
     request.session['cart'] = {}
@@ -99,26 +90,18 @@ def cancel_order(request, order_id):
         return redirect('orders:order_detail', order_id=order.id)
     
     try:
-        # Devolver stock de cada producto
-        items_restored = []
-        for item in order.items.all():
-            if item.product:  # Solo si el producto todavía existe
-                product = item.product
-                product.stock += item.quantity
-                product.save()
-                items_restored.append(f"{item.product.name} ({item.quantity} unidades)")
-        
-        # Actualizar el estado de la orden
-        order.status = 'cancelled'
-        order.cancelled_at = timezone.now()
-        order.save()
+        # Devolver stock y cancelar la orden en una sola transacción
+        cancelled, restored_products = cancel_orders([order])
+        if not cancelled:
+            messages.error(request, 'No se puede cancelar esta orden.')
+            return redirect('orders:order_detail', order_id=order.id)
         
         # Mensaje de éxito con detalles
-        if items_restored:
+        if restored_products:
             messages.success(
                 request, 
                 f'Orden #{str(order.id)[:8]}... cancelada exitosamente. '
-                f'Se restauró el stock de {len(items_restored)} producto(s).'
+                f'Se restauró el stock de {restored_products} producto(s).'
             )
         else:
             messages.success(request, f'Orden #{str(order.id)[:8]}... cancelada exitosamente.')
@@ -135,7 +118,7 @@ def admin_order_list(request):
     status = request.GET.get('status')
     search = request.GET.get('search')
     
-    orders = Order.objects.all().order_by('-created_at')
+    orders = Order.objects.all()
     
     if status:
         orders = orders.filter(status=status)
@@ -148,10 +131,8 @@ def admin_order_list(request):
             Q(user__last_name__icontains=search)
         )
     
-    # Paginación
-    page = request.GET.get('page', 1)
-    paginator = Paginator(orders, 20)
-    orders = paginator.get_page(page)
+    # Paginación por cursor
+    orders = paginate(request, orders, 20, ['-created_at'])
     
     return render(request, 'orders/admin/order_list.html', {
         'orders': orders,
@@ -175,20 +156,13 @@ def admin_order_update(request, order_id):
     
     if request.method == 'POST':
         new_status = request.POST.get('status')
-        if new_status and new_status != order.status:
+        if new_status == 'cancelled' and order.status != 'cancelled':
             # Si se cancela una orden, devolver stock
-            if new_status == 'cancelled' and order.status != 'cancelled':
-                for item in order.items.all():
-                    product = item.product
-                    product.stock += item.quantity
-                    product.save()
-            
-            order.status = new_status
-            if new_status == 'cancelled':
-                order.cancelled_at = timezone.now()
-            elif new_status == 'completed':
-                order.completed_at = timezone.now()
-            order.save()
+            active_statuses = [value for value, _ in Order.STATUS_CHOICES if value != 'cancelled']
+            cancel_orders([order], allowed_statuses=active_statuses)
+            messages.success(request, 'Estado de la orden actualizado.')
+        elif new_status and new_status != order.status:
+            set_orders_status([order], new_status, allowed_statuses=[order.status])
             
             messages.success(request, 'Estado de la orden actualizado.')
         
@@ -212,9 +186,10 @@ def admin_update_order_prices(request, order_id):
     try:
         # Obtener los datos del formulario
         updated_items = []
+        changed_items = []
         errors = []
         
-        for item in order.items.all():
+        for item in order.items.select_related('product'):
             # Obtener el nuevo precio del POST
             new_price_key = f'price_{item.id}'
             new_quantity_key = f'quantity_{item.id}'
@@ -239,7 +214,7 @@ def admin_update_order_prices(request, order_id):
                     item.price = new_price
                     item.quantity = new_quantity
                     item.subtotal = new_price * new_quantity
-                    item.save()
+                    changed_items.append(item)
                     
                     updated_items.append({
                         'id': str(item.id),
@@ -254,10 +229,8 @@ def admin_update_order_prices(request, order_id):
                 except (ValueError, InvalidOperation) as e:
                     errors.append(f'Error en {item.product.name if item.product else "item"}: valor inválido')
         
-        # Recalcular el total de la orden
-        new_total = sum(item.subtotal for item in order.items.all())
-        order.total = new_total
-        order.save()
+        # Guardar los cambios en bloque y recalcular el total de la orden
+        update_order_lines(order, changed_items)
         
         if errors:
             messages.warning(request, f'Algunos items no se pudieron actualizar: {", ".join(errors)}')
@@ -315,30 +288,13 @@ def admin_add_product_to_order(request, order_id):
         else:
             price = product.price
         
-        # Verificar si el producto ya existe en la orden
-        existing_item = order.items.filter(product=product).first()
+        # Si el producto ya existe en la orden se actualiza su cantidad
+        item, created = add_order_line(order, product, quantity, price)
         
-        if existing_item:
-            # Si ya existe, actualizar cantidad
-            existing_item.quantity += quantity
-            existing_item.subtotal = existing_item.price * existing_item.quantity
-            existing_item.save()
-            messages.success(request, f'Se agregaron {quantity} unidades más de {product.name} a la cotización')
-        else:
-            # Crear nuevo item
-            subtotal = price * quantity
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                quantity=quantity,
-                price=price,
-                subtotal=subtotal
-            )
+        if created:
             messages.success(request, f'Producto {product.name} agregado a la cotización')
-        
-        # Recalcular el total de la orden
-        order.total = sum(item.subtotal for item in order.items.all())
-        order.save()
+        else:
+            messages.success(request, f'Se agregaron {quantity} unidades más de {product.name} a la cotización')
         
         return redirect('orders:admin_order_detail', order_id=order.id)
         
@@ -361,11 +317,9 @@ def admin_remove_product_from_order(request, order_id, item_id):
     
     try:
         product_name = item.product.name if item.product else 'Producto eliminado'
-        item.delete()
         
-        # Recalcular el total de la orden
-        order.total = sum(item.subtotal for item in order.items.all())
-        order.save()
+        # Eliminar el item y recalcular el total de la orden
+        remove_order_line(order, item)
         
         messages.success(request, f'Producto {product_name} eliminado de la cotización')
         return redirect('orders:admin_order_detail', order_id=order.id)
@@ -2,6 +2,8 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.db.models import Count, Sum, Q
 from .models import Category, Product, ProductImage
+from .processing import enqueue
+from .renditions import rendition_url
 
 
 class ProductImageInline(admin.TabularInline):
@@ -15,7 +17,7 @@ class ProductImageInline(admin.TabularInline):
         if obj.image:
             return format_html(
                 '<img src="{}" style="max-height: 100px; max-width: 100px; object-fit: cover;" />',
-                obj.image.url
+                rendition_url(obj, 'thumb')
             )
         return "-"
     image_preview.short_description = "Vista Previa"
@@ -165,11 +167,20 @@ class ProductAdmin(admin.ModelAdmin):
     @admin.action(description='Duplicar productos seleccionados')
     def duplicate_products(self, request, queryset):
         duplicated_count = 0
-        for product in queryset:
+        for product in queryset.prefetch_related('images'):
+            images = list(product.images.all())
             product.pk = None
             product.name = f"{product.name} (Copia)"
             product.slug = f"{product.slug}-copia"
             product.save()
+            # Las copias apuntan a los mismos archivos y derivados (ver app_products.storage)
+            copies = ProductImage.objects.bulk_create([
+                ProductImage(product=product, image=image.image.name, alt_text=image.alt_text,
+                             is_main=image.is_main, renditions=image.renditions,
+                             status=ProductImage.PENDING if image.is_processing else image.status)
+                for image in images
+            ])
+            enqueue([copy.pk for copy in copies if copy.is_processing])
             duplicated_count += 1
         self.message_user(request, f'{duplicated_count} producto(s) duplicado(s).')
 
@@ -205,7 +216,7 @@ class ProductImageAdmin(admin.ModelAdmin):
         if obj.image:
             return format_html(
                 '<img src="{}" style="max-height: 50px; max-width: 50px; object-fit: cover; border-radius: 4px;" />',
-                obj.image.url
+                rendition_url(obj, 'thumb')
             )
         return "-"
     image_preview.short_description = "Imagen"
@@ -215,7 +226,7 @@ class ProductImageAdmin(admin.ModelAdmin):
         if obj.image:
             return format_html(
                 '<img src="{}" style="max-height: 300px; max-width: 500px; object-fit: contain;" />',
-                obj.image.url
+                rendition_url(obj, 'gallery')
             )
         return "-"
     image_preview_large.short_description = "Vista Previa"
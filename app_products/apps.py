@@ -1,6 +1,27 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_index(sender, using, **kwargs):
+    """
+    Vuelve a crear los triggers de búsqueda si una migración reconstruyó la
+    tabla de productos (SQLite elimina los triggers al reconstruir tablas)
+    """
+    from django.db import connections
+    from django.db.migrations.recorder import MigrationRecorder
+    from .search import install_search_index
+
+    connection = connections[using]
+    applied = MigrationRecorder(connection).applied_migrations()
+    if (sender.label, '0003_product_search') in applied:
+        install_search_index(connection)
 
 
 class AppProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app_products'
+
+    def ready(self):
+        """Importar signals cuando la app esté lista"""
+        import app_products.signals
+        post_migrate.connect(ensure_search_index, sender=self)
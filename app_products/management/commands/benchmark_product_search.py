@@ -0,0 +1,99 @@
+import random
+import statistics
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from app_products.models import Category, Product
+
+WORDS = [
+    'cámara', 'sensor', 'cable', 'control', 'acceso', 'biométrico', 'lector',
+    'tarjeta', 'alarma', 'sirena', 'detector', 'humo', 'movimiento', 'puerta',
+    'cerradura', 'magnética', 'grabador', 'disco', 'fuente', 'poder', 'batería',
+    'teclado', 'panel', 'router', 'switch', 'antena', 'monitor', 'soporte',
+    'exterior', 'interior', 'infrarrojo', 'domo', 'bala', 'huella', 'facial',
+    'torniquete', 'barrera', 'vehicular', 'intercomunicador', 'timbre',
+]
+
+# Términos que aparecen en ~0,1 % del catálogo, como un modelo o una marca:
+# con WORDS cada término coincide con más de un tercio de los productos
+RARE_WORDS = [
+    'hikvision', 'dahua', 'zkteco', 'ubiquiti', 'mikrotik', 'epcom', 'provision',
+    'axis', 'honeywell', 'bosch',
+]
+RARE_RATE = 0.001
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara la búsqueda de texto completo con icontains sobre un catálogo '
+        'sintético. Los productos se crean dentro de una transacción que se '
+        'revierte al terminar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000,
+                            help='Número de productos sintéticos (por defecto 100000)')
+        parser.add_argument('--queries', type=int, default=50,
+                            help='Número de búsquedas a medir por método')
+        parser.add_argument('--seed', type=int, default=42,
+                            help='Semilla para generar el catálogo y las búsquedas')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        with transaction.atomic():
+            self.create_catalog(rng, options['products'])
+            queries = [
+                ' '.join(rng.sample(WORDS, rng.choice([1, 2])))
+                for _ in range(options['queries'])
+            ]
+            rare_queries = [rng.choice(RARE_WORDS) for _ in range(options['queries'])]
+
+            self.stdout.write(f'Motor: {connection.vendor}')
+            for label, terms in (('términos frecuentes', queries), ('términos poco frecuentes', rare_queries)):
+                self.report(f'Texto completo, {label}', terms, lambda q: Product.objects.search(q))
+                self.report(f'icontains, {label}', terms, lambda q: Product.objects.filter(
+                    Q(name__icontains=q) | Q(description__icontains=q)
+                ))
+
+            transaction.set_rollback(True)
+
+    def create_catalog(self, rng, count):
+        category = Category.objects.create(name=f'Benchmark {uuid.uuid4().hex[:8]}')
+        batch_size = 2000
+        start = time.perf_counter()
+        for offset in range(0, count, batch_size):
+            Product.objects.bulk_create([
+                Product(
+                    category=category,
+                    name=' '.join(
+                        rng.sample(WORDS, 3) + ([rng.choice(RARE_WORDS)] if rng.random() < RARE_RATE else [])
+                    ).capitalize(),
+                    slug=f'benchmark-{uuid.uuid4().hex}',
+                    description=' '.join(rng.choices(WORDS, k=15)),
+                    stock=rng.randint(0, 50),
+                )
+                for _ in range(min(batch_size, count - offset))
+            ], batch_size=batch_size)
+        self.stdout.write(
+            f'{count} productos creados en {time.perf_counter() - start:.1f} s'
+        )
+
+    def report(self, label, queries, build_queryset):
+        """Mide la primera página (20 resultados) más el conteo, como en el listado"""
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            queryset = build_queryset(query)
+            list(queryset[:20])
+            queryset.count()
+            timings.append((time.perf_counter() - start) * 1000)
+
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: media {statistics.mean(timings):.1f} ms, '
+            f'p50 {statistics.median(timings):.1f} ms, p95 {p95:.1f} ms'
+        ))
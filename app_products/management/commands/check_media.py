@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
 from app_products.models import Product, ProductImage
+from app_products.storage import product_image_storage, rendition_files, scan_files
 import os
 
 
@@ -31,19 +32,54 @@ class Command(BaseCommand):
         self.stdout.write(f'Productos con imágenes: {products_with_images}')
         self.stdout.write(f'Total de imágenes: {total_images}\n')
         
+        # Un solo recorrido del directorio en lugar de os.path.exists por imagen
+        storage = product_image_storage()
+        directory = ProductImage._meta.get_field('image').upload_to
+        on_disk = scan_files(storage, directory)
+
         # Listar productos con sus imágenes
+        images = ProductImage.objects.select_related('product').order_by(
+            'product__name', 'product_id', '-is_main', 'created_at'
+        )
+        references = {}
+        referenced_renditions = set()
         if products_with_images > 0:
             self.stdout.write(self.style.SUCCESS('=== Productos con Imágenes ==='))
-            for product in Product.objects.filter(images__isnull=False).distinct():
-                self.stdout.write(f'\n{product.name}:')
-                for img in product.images.all():
-                    image_path = img.image.path if hasattr(img.image, 'path') else 'N/A'
-                    exists = os.path.exists(image_path) if image_path != 'N/A' else False
-                    status = '✓' if exists else '✗'
-                    main = '(Principal)' if img.is_main else ''
-                    self.stdout.write(f'  {status} {img.image.url} {main}')
-                    if not exists and image_path != 'N/A':
-                        self.stdout.write(self.style.WARNING(f'    Archivo no existe: {image_path}'))
+            current_product = None
+            for img in images.iterator():
+                if img.product_id != current_product:
+                    current_product = img.product_id
+                    self.stdout.write(f'\n{img.product.name}:')
+                references[img.image.name] = references.get(img.image.name, 0) + 1
+                referenced_renditions |= rendition_files(img.renditions)
+                exists = img.image.name in on_disk
+                status = '✓' if exists else '✗'
+                main = '(Principal)' if img.is_main else ''
+                self.stdout.write(f'  {status} {img.image.url} {main}')
+                if not exists:
+                    self.stdout.write(self.style.WARNING(f'    Archivo no existe: {storage.path(img.image.name)}'))
         else:
             self.stdout.write(self.style.WARNING('\nNo hay productos con imágenes.'))
             self.stdout.write(self.style.WARNING('Para añadir imágenes, accede al admin: /admin/'))
+
+        # Deduplicación: referencias de ProductImage por archivo guardado
+        stored = [name for name in references if name in on_disk]
+        stored_refs = sum(references[name] for name in stored)
+        saved_bytes = sum(on_disk[name] * (references[name] - 1) for name in stored)
+        self.stdout.write('\n=== Deduplicación ===')
+        self.stdout.write(f'Archivos originales: {len(stored)} para {stored_refs} imagen(es)')
+        if stored:
+            self.stdout.write(f'Ratio de deduplicación: {stored_refs / len(stored):.2f}x '
+                              f'({saved_bytes / 1024 / 1024:.1f} MB ahorrados)')
+
+        # Archivos huérfanos: en disco pero sin ninguna imagen ni derivado que los use
+        orphans = sorted(set(on_disk) - set(references) - referenced_renditions)
+        if orphans:
+            orphan_bytes = sum(on_disk[name] for name in orphans)
+            self.stdout.write(self.style.WARNING(
+                f'\n{len(orphans)} archivo(s) huérfano(s) ({orphan_bytes / 1024 / 1024:.1f} MB):'
+            ))
+            for name in orphans:
+                self.stdout.write(f'  {name}')
+        else:
+            self.stdout.write(self.style.SUCCESS('\n✓ No hay archivos huérfanos'))
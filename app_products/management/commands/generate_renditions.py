@@ -0,0 +1,53 @@
+import time
+from django.core.management.base import BaseCommand
+from app_products.models import ProductImage
+from app_products.processing import process_pending
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera los derivados (thumb, card, gallery, zoom en JPEG/PNG, WebP y '
+        'AVIF) de las imágenes de productos que todavía no los tienen, por '
+        'ejemplo las subidas antes de existir los derivados. Con --watch '
+        'procesa de forma continua la cola de imágenes subidas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Regenera también las imágenes que ya tienen derivados')
+        parser.add_argument('--watch', action='store_true',
+                            help='Procesa las imágenes pendientes de forma continua')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Segundos de espera con la cola vacía (con --watch, por defecto 2)')
+
+    def handle(self, *args, **options):
+        if options['watch']:
+            return self.watch(options['interval'])
+
+        images = ProductImage.objects.only('id', 'image', 'renditions')
+        if not options['force']:
+            images = images.filter(renditions={})
+
+        generated = failed = 0
+        for image in images.iterator():
+            if image.generate_renditions():
+                generated += 1
+            else:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f'✗ {image.image.name}: no es una imagen válida'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'¡Completado! {generated} imagen(es) con derivados, {failed} con errores.'
+        ))
+
+    def watch(self, interval):
+        self.stdout.write('Procesando la cola de imágenes (Ctrl+C para salir)...')
+        try:
+            while True:
+                processed = process_pending(limit=50)
+                if processed:
+                    self.stdout.write(f'✓ {processed} imagen(es) procesada(s)')
+                else:
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('Cola detenida.'))
@@ -0,0 +1,119 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from PIL import Image
+from app_products.models import ProductImage
+from app_products.storage import product_image_storage, scan_files
+
+
+class Command(BaseCommand):
+    help = (
+        'Audita los archivos de las imágenes de productos y sus derivados: '
+        'recorre las filas por lotes, verifica los archivos en paralelo, '
+        'opcionalmente los decodifica con Pillow y detecta archivos huérfanos. '
+        'Emite un informe JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=16,
+                            help='Hilos que verifican archivos (por defecto 16)')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Filas leídas y verificadas por lote (por defecto 2000)')
+        parser.add_argument('--decode', action='store_true',
+                            help='Valida además que cada archivo sea una imagen válida y sus dimensiones')
+        parser.add_argument('--output', help='Archivo donde escribir el informe (por defecto la salida estándar)')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        self.decode = options['decode']
+        storage = product_image_storage()
+        directory = ProductImage._meta.get_field('image').upload_to
+
+        report = {'images': 0, 'files_checked': 0, 'missing': [], 'invalid': [], 'orphans': []}
+        referenced = set()
+        rows = ProductImage.objects.values_list('id', 'image', 'renditions').iterator(
+            chunk_size=options['chunk_size']
+        )
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            # Por lotes: executor.map sobre todo el iterador encolaría todas las filas a la vez
+            for chunk in self.chunks(rows, options['chunk_size']):
+                checks = []
+                for image_id, name, renditions in chunk:
+                    report['images'] += 1
+                    for check in self.file_checks(image_id, name, renditions, storage):
+                        if check['file'] not in referenced:
+                            referenced.add(check['file'])
+                            checks.append(check)
+                for check, problem in zip(checks, executor.map(self.verify, checks)):
+                    report['files_checked'] += 1
+                    if problem == 'missing':
+                        report['missing'].append(self.entry(check))
+                    elif problem:
+                        report['invalid'].append({**self.entry(check), 'error': problem})
+
+        on_disk = scan_files(storage, directory)
+        orphans = sorted(set(on_disk) - referenced)
+        report['orphans'] = orphans
+        report['orphan_bytes'] = sum(on_disk[name] for name in orphans)
+        report['elapsed_seconds'] = round(time.monotonic() - started, 2)
+
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+            summary = (f"{report['images']} imagen(es), {report['files_checked']} archivo(s): "
+                       f"{len(report['missing'])} faltante(s), {len(report['invalid'])} inválido(s), "
+                       f"{len(orphans)} huérfano(s)")
+            problems = report['missing'] or report['invalid'] or orphans
+            self.stdout.write((self.style.WARNING if problems else self.style.SUCCESS)(summary))
+        else:
+            self.stdout.write(output)
+
+    @staticmethod
+    def chunks(rows, size):
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def file_checks(image_id, name, renditions, storage):
+        """El original y cada derivado de una fila, con las dimensiones esperadas de los derivados"""
+        if name:
+            yield {'image': str(image_id), 'file': name, 'path': storage.path(name), 'size': None}
+        for rendition_name, rendition in (renditions or {}).get('sizes', {}).items():
+            for file in rendition['files'].values():
+                yield {'image': str(image_id), 'file': file, 'path': default_storage.path(file),
+                       'rendition': rendition_name, 'size': (rendition['width'], rendition['height'])}
+
+    @staticmethod
+    def entry(check):
+        entry = {'image': check['image'], 'file': check['file']}
+        if 'rendition' in check:
+            entry['rendition'] = check['rendition']
+        return entry
+
+    def verify(self, check):
+        """Retorna None si el archivo está bien, 'missing' o la descripción del problema"""
+        try:
+            os.stat(check['path'])
+        except FileNotFoundError:
+            return 'missing'
+        if not self.decode:
+            return None
+        try:
+            with Image.open(check['path']) as image:
+                size = image.size
+                image.verify()
+        except (OSError, SyntaxError, Image.DecompressionBombError) as error:
+            return f'no es una imagen válida: {error}'
+        if check['size'] and size != tuple(check['size']):
+            return f'dimensiones {size[0]}x{size[1]}, se esperaban {check["size"][0]}x{check["size"][1]}'
+        return None
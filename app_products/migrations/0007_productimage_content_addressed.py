@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:50
+
+import app_products.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_products', '0006_productimage_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=app_products.storage.product_image_storage, upload_to='products/'),
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=models.Index(fields=['image'], name='productimage_image_idx'),
+        ),
+    ]
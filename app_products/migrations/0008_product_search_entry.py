@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 21:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+from app_products.search import install_search_index, uninstall_search_index
+
+
+def rebuild_sqlite_search_index(apps, schema_editor):
+    """Recrea la tabla FTS con la columna product_id en lugar de usar el rowid del producto"""
+    if schema_editor.connection.vendor == 'sqlite':
+        uninstall_search_index(schema_editor.connection)
+        install_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_products', '0007_productimage_content_addressed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchEntry',
+            fields=[
+                ('rowid', models.IntegerField(primary_key=True, serialize=False)),
+                ('product', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='search_entry', to='app_products.product')),
+                ('name', models.TextField()),
+                ('description', models.TextField()),
+            ],
+            options={
+                'db_table': 'app_products_product_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(rebuild_sqlite_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from app_products.search import install_search_index, uninstall_search_index
+
+
+def rebuild_sqlite_search_index(apps, schema_editor):
+    """Recrea la tabla FTS con rowid propio y la tabla de ids que la une con productos"""
+    if schema_editor.connection.vendor == 'sqlite':
+        uninstall_search_index(schema_editor.connection)
+        install_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_products', '0008_product_search_entry'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='ProductSearchEntry',
+        ),
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('rowid', models.IntegerField(primary_key=True, serialize=False)),
+                ('match', models.TextField(db_column='app_products_product_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'app_products_product_fts',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductSearchEntry',
+            fields=[
+                ('document', models.OneToOneField(db_column='id', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='entry', serialize=False, to='app_products.productsearchdocument')),
+                ('product', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='search_entry', to='app_products.product')),
+            ],
+            options={
+                'db_table': 'app_products_product_fts_ids',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(rebuild_sqlite_search_index, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,14 @@
-from django.db import models
+from django.db import connections, models, transaction
+from django.utils import timezone
 from django.utils.text import slugify
+from PIL import Image
+import logging
 import uuid
+from .renditions import build_renditions, strip_metadata
+from .search import FTS_IDS_TABLE, FTS_TABLE, search_products
+from .storage import file_transaction, product_image_storage, release_files
+
+logger = logging.getLogger(__name__)
 
 class Category(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -22,6 +30,23 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+class ProductQuerySet(models.QuerySet):
+    def for_catalog(self):
+        """
+        Carga la categoría con JOIN y todas las imágenes en una sola consulta
+        adicional, para que get_main_image, get_image_count y
+        has_multiple_images no consulten la base de datos por cada producto
+        """
+        return self.select_related('category').prefetch_related('images')
+
+    def search(self, query):
+        """
+        Búsqueda de texto completo por nombre y descripción, ordenada por
+        relevancia (anotación `search_rank`). Ver app_products.search.
+        """
+        return search_products(self, query, connections[self.db].vendor)
+
+
 class Product(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     category = models.ForeignKey(Category, related_name='products', on_delete=models.CASCADE)
@@ -34,16 +59,37 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         ordering = ['name']
+        indexes = [
+            # Catálogo (stock > 0) paginado por nombre, con y sin categoría;
+            # también sirve a los productos relacionados
+            models.Index(fields=['name', 'id'], condition=models.Q(stock__gt=0),
+                         name='product_instock_name_idx'),
+            models.Index(fields=['category', 'name', 'id'], condition=models.Q(stock__gt=0),
+                         name='product_instock_cat_name_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
         super().save(*args, **kwargs)
 
+    def _get_prefetched_images(self):
+        """Retorna las imágenes precargadas con prefetch_related o None"""
+        return getattr(self, '_prefetched_objects_cache', {}).get('images')
+
     def get_main_image(self):
         """Retorna la imagen principal del producto o la primera imagen disponible"""
+        images = self._get_prefetched_images()
+        if images is not None:
+            for image in images:
+                if image.is_main:
+                    return image
+            return images[0] if images else None
+
         main_image = self.images.filter(is_main=True).first()
         if main_image:
             return main_image
@@ -51,25 +97,155 @@ class Product(models.Model):
 
     def get_image_count(self):
         """Retorna el número total de imágenes del producto"""
+        images = self._get_prefetched_images()
+        if images is not None:
+            return len(images)
         return self.images.count()
 
     def has_multiple_images(self):
         """Verifica si el producto tiene múltiples imágenes"""
-        return self.images.count() > 1
+        return self.get_image_count() > 1
 
     def __str__(self):
         return self.name
 
+
+class ProductSearchDocument(models.Model):
+    """
+    Documento de la tabla FTS5 de búsqueda en SQLite (ver app_products.search).
+    No es gestionada por Django: `match` es la columna oculta con el nombre
+    de la tabla (compararla por igualdad es un MATCH) y `rank` la relevancia
+    bm25 configurada en la tabla.
+    """
+    rowid = models.IntegerField(primary_key=True)
+    match = models.TextField(db_column=FTS_TABLE)
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = FTS_TABLE
+
+
+class ProductSearchEntry(models.Model):
+    """
+    Fila de la tabla de ids de la búsqueda en SQLite: une cada producto con
+    el rowid de su documento FTS. No es gestionada por Django.
+    """
+    document = models.OneToOneField(ProductSearchDocument, primary_key=True, db_column='id',
+                                    related_name='entry', on_delete=models.DO_NOTHING, db_constraint=False)
+    product = models.OneToOneField(Product, related_name='search_entry', on_delete=models.DO_NOTHING,
+                                   db_constraint=False)
+
+    class Meta:
+        managed = False
+        db_table = FTS_IDS_TABLE
+
+
+class ProductImageQuerySet(models.QuerySet):
+    def add_uploads(self, product, files, main=False):
+        """
+        Crea un ProductImage por cada archivo subido con un único INSERT y
+        deja sus derivados en la cola de procesamiento (ver
+        app_products.processing). Con `main=True` la primera imagen queda
+        como principal si el producto todavía no tiene una.
+        """
+        main = main and not product.images.filter(is_main=True).exists()
+        with file_transaction():
+            images = self.bulk_create([
+                ProductImage(product=product, image=strip_metadata(file), is_main=(main and index == 0),
+                             status=ProductImage.PENDING)
+                for index, file in enumerate(files)
+            ])
+        from .processing import enqueue
+        enqueue([image.pk for image in images])
+        return images
+
+
 class ProductImage(models.Model):
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pendiente'),
+        (PROCESSING, 'Procesando'),
+        (READY, 'Lista'),
+        (FAILED, 'Error'),
+    ]
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='products/')
+    # Un archivo por contenido, compartido entre imágenes (ver app_products.storage)
+    image = models.ImageField(upload_to='products/', storage=product_image_storage)
     alt_text = models.CharField(max_length=200, blank=True)
     is_main = models.BooleanField(default=False)
+    # Derivados de tamaño fijo y formatos modernos (ver app_products.renditions)
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
+    # Estado de la generación de derivados en segundo plano (ver app_products.processing)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=READY, editable=False)
+    status_updated_at = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ProductImageQuerySet.as_manager()
+
     class Meta:
         ordering = ['-is_main', 'created_at']
+        indexes = [
+            # Imágenes de un producto en el orden de Meta.ordering (principal primero)
+            models.Index(fields=['product', '-is_main', 'created_at'], name='productimage_main_idx'),
+            # Cola de procesamiento: solo las filas pendientes o en curso
+            models.Index(fields=['status', 'created_at'], condition=models.Q(status__in=['pending', 'processing']),
+                         name='productimage_queue_idx'),
+            # Referencias a cada archivo, para liberarlo al borrar la última
+            models.Index(fields=['image'], name='productimage_image_idx'),
+        ]
 
     def __str__(self):
         return f"Image for {self.product.name}"
+
+    @property
+    def is_processing(self):
+        return self.status in (self.PENDING, self.PROCESSING)
+
+    def save(self, *args, **kwargs):
+        # Un archivo recién subido (aún no guardado) queda en la cola de derivados
+        uploaded = bool(self.image) and not self.image._committed
+        previous = None
+        if uploaded:
+            self.image = strip_metadata(self.image)
+            self.status = self.PENDING
+            # Los derivados del archivo anterior ya no corresponden: hasta que
+            # terminen los nuevos las plantillas usan el original
+            if not self._state.adding:
+                previous = ProductImage.objects.filter(pk=self.pk).values('image', 'renditions').first()
+            self.renditions = {}
+            # El archivo y la fila se confirman juntos (ver app_products.storage)
+            with file_transaction():
+                super().save(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+        if previous and previous['image'] != self.image.name:
+            transaction.on_commit(lambda: release_files(previous['image'], previous['renditions']))
+        if uploaded:
+            from .processing import enqueue
+            enqueue([self.pk])
+
+    def generate_renditions(self):
+        """
+        Genera los derivados de la imagen, los registra en `renditions` y
+        deja la imagen en READY. Retorna False (y la deja en FAILED) si el
+        archivo no es una imagen válida; en ese caso las plantillas siguen
+        usando el original.
+        """
+        try:
+            self.renditions = build_renditions(self.image)
+        except (OSError, Image.DecompressionBombError):
+            logger.warning('No se pudieron generar los derivados de %s', self.image.name, exc_info=True)
+            self.status = self.FAILED
+        else:
+            self.status = self.READY
+        self.status_updated_at = timezone.now()
+        ProductImage.objects.filter(pk=self.pk).update(
+            renditions=self.renditions, status=self.status, status_updated_at=self.status_updated_at
+        )
+        return self.status == self.READY
@@ -0,0 +1,98 @@
+"""
+Generación de derivados de imágenes fuera del request.
+
+La subida solo guarda el archivo original y crea el ProductImage en estado
+PENDING: la propia fila es el trabajo, así que la cola vive en la base de
+datos y sobrevive a reinicios. Un worker reclama cada imagen con un UPDATE
+condicional (PENDING → PROCESSING, solo uno gana), decodifica, corrige la
+orientación, redimensiona y recodifica sin metadatos EXIF (ver
+app_products.renditions) y la deja en READY o FAILED.
+
+Hay dos workers, que pueden convivir:
+
+- Con PRODUCT_IMAGE_WORKERS > 0, un pool de hilos del propio proceso web
+  recibe las imágenes al confirmarse la transacción de la subida. Pillow
+  libera el GIL mientras decodifica, redimensiona y codifica.
+- `manage.py generate_renditions --watch` procesa la cola desde un proceso
+  aparte; con PRODUCT_IMAGE_WORKERS=0 es el único worker.
+
+Si un proceso muere con imágenes en PROCESSING, vuelven a la cola pasados
+PRODUCT_IMAGE_STALE_AFTER segundos.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import ProductImage
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.PRODUCT_IMAGE_WORKERS,
+                                       thread_name_prefix='product-images')
+    return _executor
+
+
+def enqueue(image_ids):
+    """
+    Entrega las imágenes al pool de hilos cuando se confirme la transacción
+    actual. Sin pool (PRODUCT_IMAGE_WORKERS=0) quedan en la cola para
+    `generate_renditions --watch`.
+    """
+    if not image_ids or settings.PRODUCT_IMAGE_WORKERS <= 0:
+        return
+
+    def submit():
+        executor = _get_executor()
+        for image_id in image_ids:
+            executor.submit(_run, image_id)
+
+    transaction.on_commit(submit)
+
+
+def _run(image_id):
+    try:
+        process_image(image_id)
+    except Exception:
+        logger.exception('Error inesperado al procesar la imagen %s', image_id)
+    finally:
+        # Cada hilo del pool tiene su propia conexión
+        connection.close()
+
+
+def process_image(image_id):
+    """
+    Reclama una imagen pendiente y genera sus derivados. Retorna False si
+    otro worker ya la tomó (o ya no está pendiente).
+    """
+    claimed = ProductImage.objects.filter(pk=image_id, status=ProductImage.PENDING).update(
+        status=ProductImage.PROCESSING, status_updated_at=timezone.now()
+    )
+    if not claimed:
+        return False
+    image = ProductImage.objects.only('id', 'image', 'renditions').get(pk=image_id)
+    image.generate_renditions()
+    return True
+
+
+def requeue_stale():
+    """Devuelve a la cola las imágenes en PROCESSING de un worker que murió"""
+    limit = timezone.now() - timedelta(seconds=settings.PRODUCT_IMAGE_STALE_AFTER)
+    return ProductImage.objects.filter(
+        status=ProductImage.PROCESSING, status_updated_at__lt=limit
+    ).update(status=ProductImage.PENDING)
+
+
+def process_pending(limit=None):
+    """Procesa las imágenes pendientes, las más antiguas primero. Retorna cuántas tomó."""
+    requeue_stale()
+    pending = ProductImage.objects.filter(status=ProductImage.PENDING).order_by('created_at')
+    image_ids = list(pending.values_list('id', flat=True)[:limit])
+    return sum(process_image(image_id) for image_id in image_ids)
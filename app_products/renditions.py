@@ -0,0 +1,188 @@
+"""
+Derivados (renditions) de las imágenes de productos.
+
+Al subir una imagen se generan versiones de tamaño fijo (RENDITIONS, el lado
+mayor en píxeles, sin ampliar nunca el original) en el formato de respaldo
+(JPEG, o PNG si la imagen tiene transparencia) y en WebP y AVIF cuando
+Pillow los soporta. Se guardan junto al original con el hash de su contenido
+en el nombre (`products/foto.3f2a9c1b7e4d.webp`), así que un derivado nunca
+cambia bajo la misma URL y dos derivados idénticos (por ejemplo "gallery" y
+"zoom" de una foto pequeña) comparten archivo.
+
+El original también se publica (serve_media y el respaldo de rendition_url),
+así que al recibirlo `strip_metadata` lo reescribe sin EXIF (que puede
+incluir la ubicación GPS), XMP ni comentarios.
+
+Los nombres quedan en ProductImage.renditions para que las plantillas armen
+`srcset` y `<source>` sin consultar el almacenamiento:
+
+    {'source': 'products/foto.jpg', 'fallback': 'jpeg',
+     'sizes': {'thumb': {'width': 160, 'height': 120,
+                         'files': {'jpeg': ..., 'webp': ..., 'avif': ...}}, ...}}
+"""
+import hashlib
+import os
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import ExifTags, Image, ImageOps, features
+
+# Lado mayor de cada derivado, de menor a mayor
+RENDITIONS = {
+    'thumb': 160,
+    'card': 480,
+    'gallery': 960,
+    'zoom': 1600,
+}
+
+# Formatos modernos en orden de preferencia para <picture>
+MODERN_FORMATS = ['avif', 'webp']
+
+FORMATS = {
+    'jpeg': {'format': 'JPEG', 'extension': 'jpg', 'mime': 'image/jpeg',
+             'options': {'quality': 82, 'optimize': True, 'progressive': True}},
+    'png': {'format': 'PNG', 'extension': 'png', 'mime': 'image/png',
+            'options': {'optimize': True}},
+    'webp': {'format': 'WEBP', 'extension': 'webp', 'mime': 'image/webp',
+             'options': {'quality': 80, 'method': 4}},
+    'avif': {'format': 'AVIF', 'extension': 'avif', 'mime': 'image/avif',
+             'options': {'quality': 60, 'speed': 8}},
+}
+
+
+# Formatos del original que se reescriben sin metadatos (MPO, el JPEG de
+# varias cámaras de teléfonos, se guarda como JPEG)
+STRIP_FORMATS = {'JPEG': 'JPEG', 'MPO': 'JPEG', 'PNG': 'PNG', 'WEBP': 'WEBP'}
+METADATA_KEYS = ('exif', 'xmp', 'XML:com.adobe.xmp', 'comment', 'photoshop')
+# Lo único de image.info que se conserva al reescribir
+KEEP_INFO = ('icc_profile', 'transparency', 'dpi', 'gamma')
+
+
+def available_formats():
+    """Formatos modernos que soporta el Pillow instalado"""
+    return [name for name in MODERN_FORMATS if features.check(name)]
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def _encode(image, fmt):
+    spec = FORMATS[fmt]
+    buffer = BytesIO()
+    image.save(buffer, spec['format'], **spec['options'])
+    return buffer.getvalue()
+
+
+def _store(data, fmt, directory, stem, storage):
+    """Guarda `data` con el hash de su contenido en el nombre y retorna el nombre"""
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    name = f"{directory}/{stem}.{digest}.{FORMATS[fmt]['extension']}".lstrip('/')
+    if not storage.exists(name):
+        name = storage.save(name, ContentFile(data))
+    return name
+
+
+def strip_metadata(file):
+    """
+    Reescribe el archivo subido `file` (JPEG, PNG o WebP) sin metadatos,
+    con la orientación EXIF ya aplicada a los píxeles. Un JPEG que no hay
+    que rotar conserva su cuantización. Retorna `file` sin cambios si no
+    tiene metadatos o no es una imagen que se pueda reescribir.
+    """
+    try:
+        file.seek(0)
+        with Image.open(file) as image:
+            fmt = STRIP_FORMATS.get(image.format)
+            if fmt is None or getattr(image, 'n_frames', 1) > 1 and image.format != 'MPO':
+                return file
+            image.load()
+            if not any(key in image.info for key in METADATA_KEYS):
+                return file
+            options = {'icc_profile': image.info.get('icc_profile')}
+            rotated = image.getexif().get(ExifTags.Base.Orientation, 1) != 1
+            if fmt == 'JPEG':
+                options.update({'quality': 95} if rotated else {'quality': 'keep', 'subsampling': 'keep'})
+            elif fmt == 'WEBP':
+                options['quality'] = 90
+            if rotated:
+                image = ImageOps.exif_transpose(image)
+            image.info = {key: value for key, value in image.info.items() if key in KEEP_INFO}
+            buffer = BytesIO()
+            image.save(buffer, fmt, **options)
+    except (OSError, Image.DecompressionBombError):
+        return file
+    finally:
+        file.seek(0)
+    return ContentFile(buffer.getvalue(), name=file.name)
+
+
+def build_renditions(field_file, storage=None):
+    """
+    Genera y guarda los derivados del archivo `field_file` (el FieldFile de
+    ProductImage.image). Retorna el diccionario para ProductImage.renditions.
+    Lanza OSError (o Image.DecompressionBombError) si el archivo no es una
+    imagen válida.
+    """
+    storage = storage or default_storage
+    largest = max(RENDITIONS.values())
+    with field_file.open('rb'):
+        image = Image.open(field_file)
+        # Los JPEG grandes se decodifican directamente a una escala reducida
+        image.draft('RGB', (largest, largest))
+        image.load()
+
+    image = ImageOps.exif_transpose(image)
+    fallback = 'png' if _has_alpha(image) else 'jpeg'
+    image = image.convert('RGBA' if fallback == 'png' else 'RGB')
+    formats = [fallback, *available_formats()]
+
+    directory, filename = os.path.split(field_file.name)
+    stem = os.path.splitext(filename)[0]
+
+    sizes = {}
+    # De mayor a menor: cada derivado se reduce desde el anterior
+    for name, size in sorted(RENDITIONS.items(), key=lambda item: -item[1]):
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        sizes[name] = {
+            'width': image.width,
+            'height': image.height,
+            'files': {fmt: _store(_encode(image, fmt), fmt, directory, stem, storage) for fmt in formats},
+        }
+
+    return {
+        'source': field_file.name,
+        'fallback': fallback,
+        'sizes': {name: sizes[name] for name in RENDITIONS},
+    }
+
+
+def rendition_url(image, name, fmt=None, storage=None):
+    """
+    URL del derivado `name` de un ProductImage en el formato `fmt` (por
+    defecto el de respaldo). Sin derivados retorna la URL del original.
+    """
+    renditions = image.renditions or {}
+    rendition = renditions.get('sizes', {}).get(name)
+    if rendition is None:
+        return image.image.url
+    fmt = fmt or renditions['fallback']
+    if fmt not in rendition['files']:
+        return image.image.url
+    return (storage or default_storage).url(rendition['files'][fmt])
+
+
+def srcset(image, fmt=None, storage=None):
+    """
+    Valor de `srcset` con todos los derivados de un formato ("url 160w,
+    url 480w, ..."). Retorna '' si la imagen no tiene derivados en ese formato.
+    """
+    renditions = image.renditions or {}
+    fmt = fmt or renditions.get('fallback')
+    storage = storage or default_storage
+    candidates = {}
+    for rendition in renditions.get('sizes', {}).values():
+        if fmt in rendition['files']:
+            # Los derivados que comparten archivo aparecen una sola vez
+            candidates[rendition['files'][fmt]] = rendition['width']
+    return ', '.join(f'{storage.url(name)} {width}w' for name, width in candidates.items())
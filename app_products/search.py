@@ -0,0 +1,181 @@
+"""
+Búsqueda de texto completo de productos con ranking.
+
+- PostgreSQL: columna generada `search_vector` (nombre con peso A y
+  descripción con peso B) con índice GIN, ordenada con ts_rank.
+- SQLite: tabla virtual FTS5 sincronizada con triggers, ordenada con bm25.
+  El rowid de una tabla con clave UUID no es estable (VACUUM puede
+  renumerarlo), así que una tabla de ids propia (`id INTEGER PRIMARY KEY`,
+  `product_id` único) asigna a cada producto el rowid de su documento FTS.
+  Buscar, actualizar y borrar van siempre por rowid o por índice.
+- Otros motores: icontains por término, sin ranking.
+
+La base de datos mantiene el índice en cada INSERT, UPDATE o DELETE de
+productos (Product.save, bulk_create, update(), delete()), sin consultas
+adicionales desde Python.
+"""
+import re
+from django.db.models import BooleanField, ExpressionWrapper, F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+PRODUCT_TABLE = 'app_products_product'
+FTS_TABLE = 'app_products_product_fts'
+FTS_IDS_TABLE = 'app_products_product_fts_ids'
+SEARCH_CONFIG = 'spanish'
+MAX_SEARCH_TERMS = 8
+
+POSTGRES_INSTALL = [
+    f"""
+    ALTER TABLE {PRODUCT_TABLE} ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    f'CREATE INDEX IF NOT EXISTS {PRODUCT_TABLE}_search_idx '
+    f'ON {PRODUCT_TABLE} USING GIN (search_vector)',
+]
+
+POSTGRES_UNINSTALL = [
+    f'ALTER TABLE {PRODUCT_TABLE} DROP COLUMN IF EXISTS search_vector',
+]
+
+SQLITE_CREATE = [
+    f'CREATE TABLE IF NOT EXISTS {FTS_IDS_TABLE} ('
+    f'id INTEGER PRIMARY KEY, product_id char(32) NOT NULL UNIQUE)',
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+    f"name, description, tokenize = 'unicode61 remove_diacritics 2')",
+    # La columna `rank` de la tabla: el nombre pesa más que la descripción
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+]
+
+# El documento FTS de un producto se ubica por su rowid, tomado de la tabla
+# de ids por su índice único; guardar un producto sin cambiar el nombre ni
+# la descripción no toca el índice
+SQLITE_TRIGGERS = {
+    f'{FTS_TABLE}_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {PRODUCT_TABLE} BEGIN
+            INSERT INTO {FTS_IDS_TABLE}(product_id) VALUES (new.id);
+            INSERT INTO {FTS_TABLE}(rowid, name, description)
+            VALUES (last_insert_rowid(), new.name, new.description);
+        END
+    """,
+    f'{FTS_TABLE}_au': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+        AFTER UPDATE OF id, name, description ON {PRODUCT_TABLE}
+        WHEN old.id IS NOT new.id OR old.name IS NOT new.name
+            OR old.description IS NOT new.description
+        BEGIN
+            UPDATE {FTS_IDS_TABLE} SET product_id = new.id WHERE product_id = old.id;
+            UPDATE {FTS_TABLE} SET name = new.name, description = new.description
+            WHERE rowid = (SELECT id FROM {FTS_IDS_TABLE} WHERE product_id = new.id);
+        END
+    """,
+    f'{FTS_TABLE}_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {PRODUCT_TABLE} BEGIN
+            DELETE FROM {FTS_TABLE}
+            WHERE rowid = (SELECT id FROM {FTS_IDS_TABLE} WHERE product_id = old.id);
+            DELETE FROM {FTS_IDS_TABLE} WHERE product_id = old.id;
+        END
+    """,
+}
+
+
+def _sqlite_installed(cursor):
+    """Cuántos de los triggers y la tabla de ids existen"""
+    names = [*SQLITE_TRIGGERS, FTS_IDS_TABLE]
+    cursor.execute(
+        f"SELECT COUNT(*) FROM sqlite_master WHERE name IN ({', '.join(['%s'] * len(names))})",
+        names
+    )
+    return cursor.fetchone()[0]
+
+
+def install_search_index(connection):
+    """
+    Crea (si no existen) las estructuras de búsqueda del motor de
+    `connection`. Es idempotente: en SQLite, si faltan triggers (por ejemplo
+    porque una migración reconstruyó la tabla de productos) se vuelven a
+    crear y se reconstruye el índice FTS completo.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for statement in POSTGRES_INSTALL:
+                cursor.execute(statement)
+        elif connection.vendor == 'sqlite':
+            if _sqlite_installed(cursor) == len(SQLITE_TRIGGERS) + 1:
+                return
+            for statement in SQLITE_CREATE:
+                cursor.execute(statement)
+            for statement in SQLITE_TRIGGERS.values():
+                cursor.execute(statement)
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(f'DELETE FROM {FTS_IDS_TABLE}')
+            cursor.execute(f'INSERT INTO {FTS_IDS_TABLE}(product_id) SELECT id FROM {PRODUCT_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE}(rowid, name, description) '
+                f'SELECT ids.id, product.name, product.description '
+                f'FROM {FTS_IDS_TABLE} ids JOIN {PRODUCT_TABLE} product ON product.id = ids.product_id'
+            )
+
+
+def uninstall_search_index(connection):
+    """Elimina las estructuras de búsqueda creadas por install_search_index"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for statement in POSTGRES_UNINSTALL:
+                cursor.execute(statement)
+        elif connection.vendor == 'sqlite':
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_IDS_TABLE}')
+
+
+def get_search_terms(query):
+    """
+    Separa la búsqueda en palabras. Solo se conservan caracteres de palabra,
+    así la entrada del usuario nunca llega como sintaxis de tsquery o FTS5.
+    """
+    return re.findall(r'\w+', query.lower())[:MAX_SEARCH_TERMS]
+
+
+def search_products(queryset, query, vendor):
+    """
+    Filtra `queryset` por los productos que contienen todas las palabras de
+    `query` (como prefijo) y lo anota con `search_rank`, de mayor a menor
+    relevancia. Las coincidencias en el nombre pesan más que en la
+    descripción.
+    """
+    terms = get_search_terms(query)
+    if not terms:
+        return queryset.none()
+
+    if vendor == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        matches = RawSQL(
+            f'"{PRODUCT_TABLE}"."search_vector" @@ to_tsquery(\'{SEARCH_CONFIG}\', %s)',
+            (tsquery,),
+            output_field=BooleanField()
+        )
+        rank = RawSQL(
+            f'ts_rank("{PRODUCT_TABLE}"."search_vector", to_tsquery(\'{SEARCH_CONFIG}\', %s))',
+            (tsquery,),
+            output_field=FloatField()
+        )
+    elif vendor == 'sqlite':
+        # JOIN producto -> tabla de ids -> tabla FTS (relación
+        # search_entry__document): la igualdad sobre la columna oculta es un
+        # MATCH y `rank` (bm25) se evalúa una sola vez por coincidencia. bm25
+        # es negativo y menor cuanto más relevante.
+        fts_query = ' '.join(f'"{term}"*' for term in terms)
+        matches = Q(search_entry__document__match=fts_query)
+        rank = ExpressionWrapper(-F('search_entry__document__rank'), output_field=FloatField())
+    else:
+        condition = Q()
+        for term in terms:
+            condition &= Q(name__icontains=term) | Q(description__icontains=term)
+        matches = condition
+        rank = Value(0.0, output_field=FloatField())
+
+    return queryset.filter(matches).annotate(search_rank=rank).order_by('-search_rank', 'name')
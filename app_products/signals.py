@@ -0,0 +1,19 @@
+"""
+Signals para liberar los archivos de las imágenes de productos
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import ProductImage
+from .storage import release_files
+
+
+@receiver(post_delete, sender=ProductImage)
+def release_image_files(sender, instance, **kwargs):
+    """
+    Al borrar una imagen (también en cascada con su producto) elimina el
+    archivo y sus derivados cuando ninguna otra imagen los usa. Se espera a
+    que se confirme la transacción para no borrar archivos de un rollback.
+    """
+    name, renditions = instance.image.name, instance.renditions
+    transaction.on_commit(lambda: release_files(name, renditions))
@@ -0,0 +1,153 @@
+"""
+Almacenamiento direccionado por contenido para las imágenes de productos.
+
+Cada archivo subido se guarda con el hash SHA-256 de su contenido como nombre
+(`products/<sha256>.jpg`), así que la misma foto subida para varios productos,
+o copiada al duplicar un producto, ocupa un solo archivo en disco. Como los
+derivados toman el nombre del original como prefijo (ver
+app_products.renditions), también se comparten.
+
+Las referencias de un archivo son las filas de ProductImage que lo usan: se
+cuentan con el índice sobre `image` en lugar de mantener un contador aparte
+que podría desincronizarse. Al borrar una imagen (también en cascada al
+borrar el producto), `release_files` elimina el original y sus derivados si
+ya ninguna fila los referencia.
+
+Borrar y deduplicar se excluyen mutuamente: una subida que encuentra el
+archivo ya guardado no lo vuelve a escribir, así que si el borrado corriera
+entre esa comprobación y el commit de la nueva fila, la fila apuntaría a un
+archivo eliminado. Ambos caminos toman `lock_file(name)` dentro de la
+transacción de `file_transaction()`: en PostgreSQL un advisory lock por
+archivo que dura hasta el commit; en otros motores (SQLite en desarrollo) un
+lock del proceso durante toda la transacción.
+"""
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import connection, transaction
+
+_process_lock = threading.RLock()
+
+
+@contextmanager
+def file_transaction():
+    """
+    Transacción en la que se guardan o liberan archivos de imágenes: los
+    locks de `lock_file` se mantienen hasta que termina
+    """
+    if connection.vendor == 'postgresql':
+        with transaction.atomic():
+            yield
+    else:
+        with _process_lock, transaction.atomic():
+            yield
+
+
+def lock_file(name):
+    """
+    Bloquea `name` hasta el fin de la transacción actual (ver
+    file_transaction). Sin PostgreSQL el lock del proceso ya lo cubre.
+    """
+    if connection.vendor == 'postgresql':
+        key = int.from_bytes(hashlib.sha256(name.encode()).digest()[:8], 'big', signed=True)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [key])
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage que nombra cada archivo por el hash de su contenido"""
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return f'{directory}/{digest.hexdigest()}{extension}'.lstrip('/')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        # Hasta el commit de la fila, release_files no puede borrar el archivo
+        lock_file(name)
+        # Mismo nombre, mismo contenido: el archivo ya está guardado
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+
+_product_image_storage = ContentAddressedStorage()
+
+
+def product_image_storage():
+    """Storage de ProductImage.image (callable para no serializarlo en las migraciones)"""
+    return _product_image_storage
+
+
+def rendition_files(renditions):
+    """Nombres de los archivos de los derivados de un ProductImage.renditions"""
+    return {
+        name
+        for rendition in (renditions or {}).get('sizes', {}).values()
+        for name in rendition['files'].values()
+    }
+
+
+def release_files(name, renditions):
+    """
+    Elimina el archivo `name` de una imagen borrada y sus derivados si
+    ninguna otra fila de ProductImage los referencia, comprobándolo con el
+    archivo bloqueado. Retorna los nombres eliminados.
+    """
+    if not name:
+        return []
+    with file_transaction():
+        lock_file(name)
+        return _release_unreferenced(name, renditions)
+
+
+def _release_unreferenced(name, renditions):
+    from .models import ProductImage
+
+    images = ProductImage.objects.all()
+    if images.filter(image=name).exists():
+        return []
+    # Los derivados llevan el nombre del original como prefijo; otro
+    # original con el mismo prefijo podría compartirlos
+    stem = os.path.splitext(name)[0]
+    if images.filter(image__startswith=f'{stem}.').exists():
+        candidates = [name]
+    else:
+        candidates = [name, *sorted(rendition_files(renditions))]
+
+    storage = product_image_storage()
+    deleted = []
+    for candidate in candidates:
+        file_storage = storage if candidate == name else default_storage
+        if file_storage.exists(candidate):
+            file_storage.delete(candidate)
+            deleted.append(candidate)
+    return deleted
+
+
+def scan_files(storage, directory):
+    """
+    Recorre `directory` del storage una sola vez y retorna {nombre: tamaño}
+    de todos sus archivos, con los nombres tal como se guardan en la base de
+    datos
+    """
+    root = storage.path(directory)
+    files = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            files[name] = os.path.getsize(path)
+    return files
@@ -0,0 +1,46 @@
+from django import template
+from django.utils.html import format_html_join
+from app_products import renditions
+
+register = template.Library()
+
+
+@register.simple_tag
+def rendition_url(image, name, fmt=None):
+    """
+    URL del derivado `name` (thumb, card, gallery, zoom) de un ProductImage;
+    la del original si todavía no tiene derivados.
+
+    Uso: <img src="{% rendition_url main_image 'card' %}">
+    """
+    return renditions.rendition_url(image, name, fmt)
+
+
+@register.simple_tag
+def rendition_srcset(image, fmt=None):
+    """
+    `srcset` con todos los derivados en el formato de respaldo (o `fmt`).
+
+    Uso: <img srcset="{% rendition_srcset main_image %}" sizes="...">
+    """
+    return renditions.srcset(image, fmt)
+
+
+@register.simple_tag
+def rendition_sources(image, sizes):
+    """
+    Elementos <source> de AVIF y WebP para un <picture>; el navegador usa el
+    primero que soporte y, si ninguno, el <img> que sigue.
+
+    Uso:
+        <picture>
+            {% rendition_sources main_image "(min-width: 992px) 25vw, 100vw" %}
+            <img src="{% rendition_url main_image 'card' %}" ...>
+        </picture>
+    """
+    sources = []
+    for fmt in renditions.MODERN_FORMATS:
+        value = renditions.srcset(image, fmt)
+        if value:
+            sources.append((renditions.FORMATS[fmt]['mime'], value, sizes))
+    return format_html_join('\n', '<source type="{}" srcset="{}" sizes="{}">', sources)
@@ -1,3 +1,817 @@
-from django.test import TestCase
+from django.test import AsyncClient, TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.urls import reverse
+from django.utils import timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from datetime import timedelta
+from unittest import mock, skipUnless
+from PIL import ExifTags, Image
+import json
+import os
+import shutil
+import tempfile
+import threading
+import warnings
+from .models import Category, Product, ProductImage
+from .admin import ProductAdmin
+from .processing import process_image, process_pending, requeue_stale
+from .renditions import RENDITIONS, available_formats, rendition_url
+from .search import FTS_IDS_TABLE, FTS_TABLE
+from .storage import file_transaction, release_files, rendition_files
 
-# Create your tests here.
+User = get_user_model()
+
+
+def create_products(category, count, start=0, images_per_product=2):
+    """Crea productos con varias imágenes, la segunda marcada como principal"""
+    products = []
+    for i in range(start, start + count):
+        product = Product.objects.create(
+            category=category,
+            name=f'Producto {i:03d}',
+            description='Producto de prueba',
+            price=Decimal('10.00'),
+            stock=10
+        )
+        for j in range(images_per_product):
+            ProductImage.objects.create(
+                product=product,
+                image=f'products/producto-{i}-{j}.jpg',
+                is_main=(j == 1)
+            )
+        products.append(product)
+    return products
+
+
+class ProductImageHelpersTest(TestCase):
+    """Tests para los helpers de imágenes del modelo Product"""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Test Category')
+        self.product = create_products(self.category, 1)[0]
+
+    def test_get_main_image_without_prefetch(self):
+        """Test la imagen principal se resuelve sin datos precargados"""
+        main_image = self.product.get_main_image()
+        self.assertTrue(main_image.is_main)
+        self.assertEqual(self.product.get_image_count(), 2)
+        self.assertTrue(self.product.has_multiple_images())
+
+    def test_get_main_image_with_prefetch(self):
+        """Test los helpers usan las imágenes precargadas sin consultas extra"""
+        product = Product.objects.for_catalog().get(id=self.product.id)
+        with self.assertNumQueries(0):
+            main_image = product.get_main_image()
+            self.assertTrue(main_image.is_main)
+            self.assertEqual(product.get_image_count(), 2)
+            self.assertTrue(product.has_multiple_images())
+
+    def test_get_main_image_falls_back_to_first_image(self):
+        """Test sin imagen principal se usa la primera imagen"""
+        self.product.images.update(is_main=False)
+        product = Product.objects.for_catalog().get(id=self.product.id)
+        self.assertEqual(product.get_main_image(), self.product.images.first())
+
+    def test_get_main_image_without_images(self):
+        """Test un producto sin imágenes no tiene imagen principal"""
+        self.product.images.all().delete()
+        product = Product.objects.for_catalog().get(id=self.product.id)
+        self.assertIsNone(product.get_main_image())
+        self.assertFalse(product.has_multiple_images())
+
+
+def image_upload(name='foto.jpg', size=(1200, 800), fmt='JPEG', mode='RGB'):
+    """Archivo de imagen subido, generado en memoria"""
+    buffer = BytesIO()
+    Image.new(mode, size, 'red').save(buffer, fmt)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{fmt.lower()}')
+
+
+class ProductImageRenditionsTest(TestCase):
+    """Tests para los derivados de las imágenes de productos"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        # Sin pool de hilos: cada test procesa la cola explícitamente
+        settings_override = override_settings(MEDIA_ROOT=media_root, PRODUCT_IMAGE_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        category = Category.objects.create(name='Test Category')
+        self.product = Product.objects.create(category=category, name='Cámara', description='Test',
+                                              price=Decimal('10.00'), stock=5)
+
+    def upload(self, file=None):
+        """Sube una imagen y procesa la cola como lo haría el worker"""
+        image = ProductImage.objects.create(product=self.product, image=file or image_upload())
+        process_pending()
+        image.refresh_from_db()
+        return image
+
+    def test_upload_generates_renditions(self):
+        """Test subir una imagen genera cada tamaño en todos los formatos, sin ampliar"""
+        image = self.upload()
+        self.assertEqual(image.status, ProductImage.READY)
+        sizes = image.renditions['sizes']
+        self.assertEqual(list(sizes), list(RENDITIONS))
+        self.assertEqual(image.renditions['fallback'], 'jpeg')
+        self.assertEqual((sizes['thumb']['width'], sizes['thumb']['height']), (160, 107))
+        self.assertEqual(sizes['zoom']['width'], 1200)
+        for rendition in sizes.values():
+            self.assertEqual(set(rendition['files']), {'jpeg', *available_formats()})
+            for name in rendition['files'].values():
+                self.assertTrue(name.startswith(f'{os.path.splitext(image.image.name)[0]}.'))
+                self.assertTrue(default_storage.exists(name))
+        with default_storage.open(sizes['card']['files']['jpeg']) as file:
+            self.assertEqual(Image.open(file).size, (480, 320))
+
+    def test_identical_renditions_share_files(self):
+        """Test los derivados con el mismo contenido usan el mismo archivo"""
+        image = self.upload(image_upload(size=(300, 200)))
+        sizes = image.renditions['sizes']
+        self.assertEqual(sizes['card']['files'], sizes['zoom']['files'])
+        self.assertNotEqual(sizes['thumb']['files'], sizes['card']['files'])
+
+    def test_transparent_images_keep_png(self):
+        """Test las imágenes con transparencia usan PNG como respaldo"""
+        image = self.upload(image_upload('logo.png', fmt='PNG', mode='RGBA'))
+        self.assertEqual(image.renditions['fallback'], 'png')
+        self.assertTrue(image.renditions['sizes']['thumb']['files']['png'].endswith('.png'))
+
+    def test_saving_without_new_upload_keeps_renditions(self):
+        """Test editar la imagen sin subir otro archivo no regenera los derivados"""
+        image = self.upload()
+        renditions = image.renditions
+        image = ProductImage.objects.get(pk=image.pk)
+        image.alt_text = 'Frente'
+        with self.assertNumQueries(1):
+            image.save()
+        self.assertEqual(ProductImage.objects.get(pk=image.pk).renditions, renditions)
+
+    def test_replacing_file_clears_renditions(self):
+        """Test subir otro archivo descarta los derivados anteriores y libera sus archivos"""
+        image = self.upload()
+        old_files = rendition_files(image.renditions)
+        image.image = image_upload(size=(300, 200))
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        saved = ProductImage.objects.get(pk=image.pk)
+        self.assertEqual(saved.renditions, {})
+        self.assertEqual(saved.status, ProductImage.PENDING)
+        for name in old_files:
+            self.assertFalse(default_storage.exists(name))
+
+    def test_upload_strips_metadata(self):
+        """Test el original se guarda sin EXIF (ubicación GPS incluida) y con la orientación aplicada"""
+        exif = Image.Exif()
+        exif[ExifTags.Base.Orientation] = 6
+        exif[ExifTags.Base.Make] = 'Cámara'
+        exif.get_ifd(ExifTags.IFD.GPSInfo)[ExifTags.GPS.GPSLatitude] = (19.0, 25.0, 0.0)
+        buffer = BytesIO()
+        Image.new('RGB', (1200, 800), 'red').save(buffer, 'JPEG', exif=exif, comment='Casa')
+        upload = SimpleUploadedFile('foto.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+        for image in (self.upload(upload), ProductImage.objects.add_uploads(self.product, [upload])[0]):
+            with image.image.open('rb'):
+                original = Image.open(image.image)
+                self.assertEqual(original.size, (800, 1200))
+                self.assertFalse(original.getexif())
+                self.assertNotIn('comment', original.info)
+
+    def test_invalid_upload_falls_back_to_original(self):
+        """Test un archivo que no es imagen se guarda sin derivados"""
+        upload = SimpleUploadedFile('roto.jpg', b'no es una imagen', content_type='image/jpeg')
+        with self.assertLogs('app_products.models', 'WARNING'):
+            image = self.upload(upload)
+        self.assertEqual(image.renditions, {})
+        self.assertEqual(image.status, ProductImage.FAILED)
+
+    def test_template_tags(self):
+        """Test las plantillas usan los derivados y, sin ellos, el original"""
+        template = Template(
+            "{% load product_images %}{% rendition_sources image '50vw' %}"
+            "<img src=\"{% rendition_url image 'card' %}\" srcset=\"{% rendition_srcset image %}\">"
+        )
+        image = self.upload()
+        html = template.render(Context({'image': image}))
+        card = image.renditions['sizes']['card']['files']
+        self.assertIn(f'src="{default_storage.url(card["jpeg"])}"', html)
+        self.assertIn(f'{default_storage.url(card["jpeg"])} 480w', html)
+        for fmt in available_formats():
+            self.assertIn(f'<source type="image/{fmt}" srcset="', html)
+            self.assertIn(f'{default_storage.url(card[fmt])} 480w', html)
+
+        legacy = ProductImage.objects.create(product=self.product, image='products/antigua.jpg')
+        html = template.render(Context({'image': legacy}))
+        self.assertEqual(html, f'<img src="{legacy.image.url}" srcset="">')
+
+    def test_generate_renditions_command(self):
+        """Test el comando genera los derivados de las imágenes existentes"""
+        name = default_storage.save('products/antigua.jpg', image_upload())
+        image = ProductImage.objects.create(product=self.product, image=name)
+        ProductImage.objects.create(product=self.product, image='products/no-existe.jpg')
+        out = StringIO()
+        with self.assertLogs('app_products.models', 'WARNING'):
+            call_command('generate_renditions', stdout=out)
+        self.assertIn('1 imagen(es) con derivados, 1 con errores', out.getvalue())
+        image.refresh_from_db()
+        self.assertEqual(image.renditions['source'], name)
+
+
+class ProductImageProcessingTest(TestCase):
+    """Tests para la generación de derivados en segundo plano"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, PRODUCT_IMAGE_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        category = Category.objects.create(name='Test Category')
+        self.product = Product.objects.create(category=category, name='Cámara', description='Test',
+                                              price=Decimal('10.00'), stock=5)
+        self.client = Client()
+        self.client.force_login(User.objects.create_user(username='staff', password='testpass123', is_staff=True))
+
+    def test_upload_returns_before_processing(self):
+        """Test la subida guarda los originales con un INSERT y deja los derivados en la cola"""
+        files = [image_upload(f'foto-{i}.jpg') for i in range(3)]
+        url = reverse('products:admin_product_images_upload', kwargs={'product_id': self.product.id})
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(url, {'images': files})
+        self.assertEqual(response.status_code, 302)
+        inserts = [q for q in context.captured_queries if q['sql'].startswith('INSERT INTO "app_products_productimage"')]
+        self.assertEqual(len(inserts), 1)
+
+        images = list(self.product.images.all())
+        self.assertEqual(len(images), 3)
+        for image in images:
+            self.assertEqual(image.status, ProductImage.PENDING)
+            self.assertEqual(image.renditions, {})
+            self.assertTrue(default_storage.exists(image.image.name))
+
+        self.assertEqual(process_pending(), 3)
+        self.assertFalse(self.product.images.exclude(status=ProductImage.READY).exists())
+
+    def test_add_uploads_sets_main_image(self):
+        """Test la primera imagen subida es la principal solo si el producto no tiene una"""
+        first = ProductImage.objects.add_uploads(self.product, [image_upload(), image_upload()], main=True)
+        self.assertEqual([image.is_main for image in first], [True, False])
+        second = ProductImage.objects.add_uploads(self.product, [image_upload()], main=True)
+        self.assertFalse(second[0].is_main)
+
+    def test_enqueue_submits_after_commit(self):
+        """Test con pool de hilos las imágenes se entregan al confirmarse la transacción"""
+        executor = mock.Mock()
+        with override_settings(PRODUCT_IMAGE_WORKERS=2), \
+                mock.patch('app_products.processing._get_executor', return_value=executor):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                images = ProductImage.objects.add_uploads(self.product, [image_upload(), image_upload()])
+                executor.submit.assert_not_called()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual([call.args[1] for call in executor.submit.call_args_list], [image.pk for image in images])
+
+    def test_image_is_processed_once(self):
+        """Test un worker no procesa una imagen que otro ya tomó"""
+        image = ProductImage.objects.add_uploads(self.product, [image_upload()])[0]
+        self.assertTrue(process_image(image.pk))
+        self.assertFalse(process_image(image.pk))
+        image.refresh_from_db()
+        self.assertEqual(image.status, ProductImage.READY)
+        self.assertIsNotNone(image.status_updated_at)
+
+    def test_stale_images_are_requeued(self):
+        """Test las imágenes de un worker caído vuelven a la cola"""
+        stale, recent = ProductImage.objects.add_uploads(self.product, [image_upload(), image_upload()])
+        ProductImage.objects.filter(pk=stale.pk).update(
+            status=ProductImage.PROCESSING, status_updated_at=timezone.now() - timedelta(hours=1)
+        )
+        ProductImage.objects.filter(pk=recent.pk).update(
+            status=ProductImage.PROCESSING, status_updated_at=timezone.now()
+        )
+        self.assertEqual(requeue_stale(), 1)
+        self.assertEqual(ProductImage.objects.get(pk=stale.pk).status, ProductImage.PENDING)
+        self.assertEqual(ProductImage.objects.get(pk=recent.pk).status, ProductImage.PROCESSING)
+
+    def test_status_view(self):
+        """Test el estado de las imágenes se consulta sin recargar la página"""
+        image = ProductImage.objects.add_uploads(self.product, [image_upload()])[0]
+        url = reverse('products:admin_product_images_status', kwargs={'product_id': self.product.id})
+        data = self.client.get(url).json()
+        self.assertEqual(data['images'], [{
+            'id': str(image.id), 'status': 'pending', 'status_display': 'Pendiente', 'url': image.image.url,
+        }])
+
+        process_pending()
+        image.refresh_from_db()
+        data = self.client.get(url).json()
+        self.assertEqual(data['images'][0]['status'], 'ready')
+        self.assertEqual(data['images'][0]['url'],
+                         default_storage.url(image.renditions['sizes']['card']['files']['jpeg']))
+
+        response = self.client.get(reverse('products:admin_product_images', kwargs={'product_id': self.product.id}))
+        self.assertNotContains(response, 'js-image-status"')
+
+
+class ProductImageStorageTest(TestCase):
+    """Tests para el almacenamiento direccionado por contenido de las imágenes"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, PRODUCT_IMAGE_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.category = Category.objects.create(name='Test Category')
+        self.products = [
+            Product.objects.create(category=self.category, name=f'Cámara {i}', description='Test',
+                                   price=Decimal('10.00'), stock=5)
+            for i in range(2)
+        ]
+
+    def upload(self, product, file=None):
+        image = ProductImage.objects.create(product=product, image=file or image_upload())
+        process_pending()
+        image.refresh_from_db()
+        return image
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(path, name), default_storage.location)
+            for path, _, names in os.walk(default_storage.location) for name in names
+        )
+
+    def test_identical_uploads_share_file(self):
+        """Test la misma foto subida para dos productos se guarda una sola vez"""
+        first = self.upload(self.products[0])
+        second = self.upload(self.products[1], image_upload('otra-foto.JPG'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^products/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(first.renditions, second.renditions)
+        self.assertEqual(len(self.stored_files()), 1 + len(rendition_files(first.renditions)))
+
+        third = self.upload(self.products[1], image_upload(size=(640, 480)))
+        self.assertNotEqual(third.image.name, first.image.name)
+
+    def test_delete_releases_unreferenced_files(self):
+        """Test el archivo y sus derivados se borran con la última imagen que los usa"""
+        first = self.upload(self.products[0])
+        second = self.upload(self.products[1])
+        files = self.stored_files()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(self.stored_files(), files)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(self.stored_files(), [])
+
+    def test_product_delete_releases_files(self):
+        """Test borrar el producto libera los archivos de sus imágenes"""
+        self.upload(self.products[0])
+        self.upload(self.products[0], image_upload(size=(640, 480)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].delete()
+        self.assertEqual(self.stored_files(), [])
+
+    def test_duplicate_products_share_files(self):
+        """Test duplicar un producto copia sus imágenes sin copiar archivos"""
+        image = self.upload(self.products[0])
+        files = self.stored_files()
+        model_admin = ProductAdmin(Product, None)
+        with mock.patch.object(model_admin, 'message_user'):
+            model_admin.duplicate_products(None, Product.objects.filter(pk=self.products[0].pk))
+
+        copy = Product.objects.get(name='Cámara 0 (Copia)')
+        copied = copy.images.get()
+        self.assertEqual(copied.image.name, image.image.name)
+        self.assertEqual(copied.renditions, image.renditions)
+        self.assertEqual(copied.is_main, image.is_main)
+        self.assertEqual(self.stored_files(), files)
+
+    def test_check_media_reports_dedup_and_orphans(self):
+        """Test check_media informa el ratio de deduplicación y los archivos huérfanos"""
+        self.upload(self.products[0])
+        self.upload(self.products[1])
+        default_storage.save('products/huerfano.jpg', image_upload())
+        out = StringIO()
+        with CaptureQueriesContext(connection) as context:
+            call_command('check_media', stdout=out)
+        output = out.getvalue()
+        self.assertIn('Archivos originales: 1 para 2 imagen(es)', output)
+        self.assertIn('Ratio de deduplicación: 2.00x', output)
+        self.assertIn('1 archivo(s) huérfano(s)', output)
+        self.assertIn('products/huerfano.jpg', output)
+        self.assertNotIn('Archivo no existe', output)
+        self.assertEqual(len(context.captured_queries), 4)
+
+
+class ProductImageStorageRaceTest(TransactionTestCase):
+    """Liberar un archivo y subirlo otra vez al mismo tiempo"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, PRODUCT_IMAGE_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        category = Category.objects.create(name='Test Category')
+        self.product = Product.objects.create(category=category, name='Cámara', description='Test',
+                                              price=Decimal('10.00'), stock=5)
+
+    def test_release_waits_for_pending_upload(self):
+        """Test el borrado espera a que se confirme una subida del mismo archivo y la respeta"""
+        image = ProductImage.objects.create(product=self.product, image=image_upload())
+        name = image.image.name
+        # Sin referencias, pero el archivo sigue en disco (como antes del borrado diferido)
+        ProductImage.objects.filter(pk=image.pk).update(image='products/otra.jpg')
+        uploaded, proceed = threading.Event(), threading.Event()
+        released = []
+
+        def upload():
+            try:
+                with file_transaction():
+                    # Encuentra el archivo ya guardado y no lo reescribe
+                    ProductImage.objects.create(product=self.product, image=image_upload())
+                    uploaded.set()
+                    proceed.wait(5)
+            finally:
+                connection.close()
+
+        def release():
+            try:
+                released.extend(release_files(name, {}))
+            finally:
+                connection.close()
+
+        uploader = threading.Thread(target=upload)
+        uploader.start()
+        self.assertTrue(uploaded.wait(5))
+        releaser = threading.Thread(target=release)
+        releaser.start()
+        releaser.join(0.2)
+        self.assertTrue(releaser.is_alive())
+
+        proceed.set()
+        uploader.join()
+        releaser.join()
+        self.assertEqual(released, [])
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(ProductImage.objects.filter(image=name).count(), 1)
+
+
+class MediaAuditTest(TestCase):
+    """Tests para el comando media_audit"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, PRODUCT_IMAGE_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        category = Category.objects.create(name='Test Category')
+        self.product = Product.objects.create(category=category, name='Cámara', description='Test',
+                                              price=Decimal('10.00'), stock=5)
+        self.image = ProductImage.objects.create(product=self.product, image=image_upload())
+        process_pending()
+        self.image.refresh_from_db()
+
+    def audit(self, *args):
+        out = StringIO()
+        call_command('media_audit', *args, '--chunk-size', '2', stdout=out)
+        return json.loads(out.getvalue())
+
+    def test_clean_media(self):
+        """Test sin problemas el informe solo cuenta imágenes y archivos"""
+        report = self.audit('--decode')
+        self.assertEqual(report['images'], 1)
+        self.assertEqual(report['files_checked'], 1 + len(rendition_files(self.image.renditions)))
+        self.assertEqual((report['missing'], report['invalid'], report['orphans']), ([], [], []))
+
+    def test_reports_missing_invalid_and_orphans(self):
+        """Test el informe lista archivos faltantes, corruptos y huérfanos"""
+        missing = ProductImage.objects.create(product=self.product, image='products/no-existe.jpg')
+        broken_name = default_storage.save('products/roto.jpg', SimpleUploadedFile('roto.jpg', b'no es imagen'))
+        broken = ProductImage.objects.create(product=self.product, image=broken_name)
+        card = self.image.renditions['sizes']['card']['files']['jpeg']
+        default_storage.delete(card)
+        default_storage.save(card, image_upload(size=(50, 50)))
+        orphan = default_storage.save('products/huerfano.jpg', image_upload())
+
+        report = self.audit()
+        self.assertEqual(report['images'], 3)
+        self.assertEqual(report['missing'], [{'image': str(missing.id), 'file': 'products/no-existe.jpg'}])
+        self.assertEqual(report['invalid'], [])
+        self.assertEqual(report['orphans'], [orphan])
+
+        report = self.audit('--decode')
+        invalid = {entry['file']: entry for entry in report['invalid']}
+        self.assertEqual(set(invalid), {broken_name, card})
+        self.assertEqual(invalid[broken_name]['image'], str(broken.id))
+        self.assertEqual(invalid[card]['rendition'], 'card')
+        self.assertIn('se esperaban 480x320', invalid[card]['error'])
+
+    def test_output_file(self):
+        """Test con --output el informe se escribe en un archivo y se muestra un resumen"""
+        path = os.path.join(default_storage.location, 'audit.json')
+        out = StringIO()
+        call_command('media_audit', '--output', path, stdout=out)
+        self.assertIn('1 imagen(es)', out.getvalue())
+        with open(path, encoding='utf-8') as file:
+            self.assertEqual(json.load(file)['images'], 1)
+
+
+class MediaServingTest(TestCase):
+    """Tests para el servicio de archivos media con cache, ETag y Range"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, PRODUCT_IMAGE_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        category = Category.objects.create(name='Test Category')
+        product = Product.objects.create(category=category, name='Cámara', description='Test',
+                                         price=Decimal('10.00'), stock=5)
+        self.image = ProductImage.objects.create(product=product, image=image_upload())
+        with self.image.image.open('rb') as file:
+            self.content = file.read()
+        self.url = self.image.image.url
+
+    def get(self, url=None, **headers):
+        response = self.client.get(url or self.url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, body
+
+    def test_fingerprinted_files_are_immutable(self):
+        """Test los archivos con el hash en el nombre se cachean como immutable"""
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        process_pending()
+        self.image.refresh_from_db()
+        response, _ = self.get(rendition_url(self.image, 'thumb'))
+        self.assertIn('immutable', response['Cache-Control'])
+
+    @override_settings(MEDIA_CACHE_MAX_AGE=600)
+    def test_other_files_are_revalidated(self):
+        """Test los archivos sin hash en el nombre usan MEDIA_CACHE_MAX_AGE"""
+        name = default_storage.save('profile_pics/foto.jpg', image_upload())
+        response, _ = self.get(default_storage.url(name))
+        self.assertEqual(response['Cache-Control'], 'public, max-age=600')
+        self.assertTrue(response['ETag'])
+
+    def test_if_none_match(self):
+        """Test con el mismo ETag la respuesta es 304 sin cuerpo"""
+        response, _ = self.get()
+        response, body = self.get(if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(body, b'')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response, _ = self.get(if_none_match='"otro"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_range_requests(self):
+        """Test las peticiones Range devuelven solo los bytes pedidos"""
+        size = len(self.content)
+        response, body = self.get(range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[10:20])
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{size}')
+
+        response, body = self.get(range='bytes=-5')
+        self.assertEqual(body, self.content[-5:])
+        response, body = self.get(range=f'bytes={size - 3}-')
+        self.assertEqual(body, self.content[-3:])
+
+        response, _ = self.get(range=f'bytes={size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{size}')
+
+        # Varios rangos o un If-Range que no coincide: archivo completo
+        response, body = self.get(range='bytes=0-1,5-6')
+        self.assertEqual((response.status_code, body), (200, self.content))
+        response, body = self.get(range='bytes=0-1', if_range='"otro"')
+        self.assertEqual((response.status_code, body), (200, self.content))
+
+    async def test_asgi_streams_without_sync_iterator(self):
+        """Test bajo ASGI el archivo se transmite con un iterador asíncrono, por bloques"""
+        client = AsyncClient()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('error', message='StreamingHttpResponse must consume synchronous iterators')
+            with mock.patch('Zultech_main.media.ASYNC_BLOCK_SIZE', 100):
+                response = await client.get(self.url)
+                self.assertTrue(response.is_async)
+                chunks = [chunk async for chunk in response.streaming_content]
+                self.assertEqual(b''.join(chunks), self.content)
+                self.assertEqual(len(chunks[0]), 100)
+                self.assertEqual(response['Content-Type'], 'image/jpeg')
+                self.assertEqual(response['Content-Length'], str(len(self.content)))
+
+                response = await client.get(self.url, headers={'range': 'bytes=10-249'})
+                self.assertEqual(response.status_code, 206)
+                body = b''.join([chunk async for chunk in response.streaming_content])
+                self.assertEqual(body, self.content[10:250])
+        response.close()
+
+    def test_missing_and_unsafe_paths(self):
+        """Test los archivos inexistentes o fuera de MEDIA_ROOT dan 404"""
+        self.assertEqual(self.client.get('/media/products/no-existe.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/media/products/').status_code, 404)
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+
+class CatalogQueryCountTest(TestCase):
+    """
+    Tests de regresión: el número de consultas de las páginas del catálogo
+    no debe crecer con el número de productos mostrados
+    """
+
+    def setUp(self):
+        self.client = Client()
+        self.category = Category.objects.create(name='Test Category')
+        self.staff = User.objects.create_user(
+            username='staff',
+            password='testpass123',
+            is_staff=True
+        )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, url, grow):
+        """Compara las consultas antes y después de agregar más productos"""
+        self.client.get(url)  # Calienta las cachés de los context processors
+        baseline = self.count_queries(url)
+        grow()
+        self.assertEqual(self.count_queries(url), baseline)
+
+    def test_product_list_queries(self):
+        """Test el listado de productos usa un número fijo de consultas"""
+        create_products(self.category, 2)
+        self.assertConstantQueries(
+            reverse('products:product_list'),
+            lambda: create_products(self.category, 8, start=2)
+        )
+
+    def test_product_detail_queries(self):
+        """Test el detalle y los productos relacionados no generan N+1"""
+        product = create_products(self.category, 2)[0]
+        self.assertConstantQueries(
+            reverse('products:product_detail', kwargs={'slug': product.slug}),
+            lambda: create_products(self.category, 3, start=2, images_per_product=3)
+        )
+
+    def test_product_list_cursor_pages(self):
+        """Test el catálogo pagina por nombre con cursores y conserva los filtros"""
+        create_products(self.category, 15, images_per_product=0)
+        other = Category.objects.create(name='Other Category')
+        create_products(other, 2, start=15, images_per_product=0)
+        url = reverse('products:product_list')
+
+        page = self.client.get(url, {'category': self.category.slug}).context['products']
+        names = [product.name for product in page]
+        self.assertTrue(page.has_next)
+        self.assertFalse(page.has_previous)
+
+        page = self.client.get(f'{url}?{page.next_querystring}').context['products']
+        names += [product.name for product in page]
+        self.assertFalse(page.has_next)
+        self.assertEqual(names, [f'Producto {i:03d}' for i in range(15)])
+
+    def test_admin_product_list_queries(self):
+        """Test el listado de administración usa un número fijo de consultas"""
+        self.client.force_login(self.staff)
+        create_products(self.category, 2)
+        self.assertConstantQueries(
+            reverse('products:admin_product_list'),
+            lambda: create_products(self.category, 6, start=2)
+        )
+
+
+class ProductSearchTest(TestCase):
+    """Tests para la búsqueda de texto completo de productos"""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Test Category')
+        self.camera = Product.objects.create(
+            category=self.category,
+            name='Cámara domo exterior',
+            description='Visión nocturna infrarroja',
+            price=Decimal('100.00'),
+            stock=5
+        )
+        self.recorder = Product.objects.create(
+            category=self.category,
+            name='Grabador de video',
+            description='Compatible con cámaras IP',
+            price=Decimal('200.00'),
+            stock=5
+        )
+        self.lock = Product.objects.create(
+            category=self.category,
+            name='Cerradura magnética',
+            description='Control de acceso',
+            price=Decimal('50.00'),
+            stock=0
+        )
+
+    def test_search_ranks_name_matches_first(self):
+        """Test las coincidencias en el nombre tienen más relevancia"""
+        results = list(Product.objects.search('camara'))
+        self.assertEqual(results, [self.camera, self.recorder])
+        self.assertGreater(results[0].search_rank, results[1].search_rank)
+
+    def test_search_requires_all_terms(self):
+        """Test todas las palabras deben aparecer, como prefijo"""
+        self.assertEqual(list(Product.objects.search('grab cámaras')), [self.recorder])
+        self.assertFalse(Product.objects.search('cámara cerradura').exists())
+
+    def test_search_index_follows_save_and_delete(self):
+        """Test el índice se actualiza al guardar y al eliminar productos"""
+        self.lock.name = 'Lector biométrico'
+        self.lock.save()
+        self.assertEqual(list(Product.objects.search('biometrico')), [self.lock])
+        self.assertFalse(Product.objects.search('cerradura').exists())
+
+        self.lock.delete()
+        self.assertFalse(Product.objects.search('biometrico').exists())
+
+    @skipUnless(connection.vendor == 'sqlite', 'El índice FTS5 solo existe en SQLite')
+    def test_search_survives_renumbered_rowids(self):
+        """Test la búsqueda no depende del rowid de los productos (VACUUM puede renumerarlo)"""
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE app_products_product SET rowid = rowid + 1000')
+        self.assertEqual(list(Product.objects.search('camara')), [self.camera, self.recorder])
+        self.lock.name = 'Lector biométrico'
+        self.lock.save()
+        self.assertEqual(list(Product.objects.search('biometrico')), [self.lock])
+
+    @skipUnless(connection.vendor == 'sqlite', 'El índice FTS5 solo existe en SQLite')
+    def test_search_ids_follow_products(self):
+        """Test la tabla de ids y la tabla FTS tienen una fila por producto"""
+        def counts():
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT COUNT(*) FROM {FTS_IDS_TABLE}')
+                ids = cursor.fetchone()[0]
+                cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+                return ids, cursor.fetchone()[0]
+
+        self.assertEqual(counts(), (3, 3))
+        Product.objects.filter(pk=self.camera.pk).update(stock=10)
+        self.lock.delete()
+        self.assertEqual(counts(), (2, 2))
+        self.assertEqual(list(Product.objects.search('camara')), [self.camera, self.recorder])
+
+    def test_search_ignores_query_syntax(self):
+        """Test comillas y operadores del usuario no rompen la consulta"""
+        self.assertEqual(list(Product.objects.search('"domo" (ext*')), [self.camera])
+        self.assertFalse(Product.objects.search('"()*').exists())
+
+    def test_product_list_search(self):
+        """Test el catálogo filtra por la búsqueda y oculta productos sin stock"""
+        response = self.client.get(reverse('products:product_list'), {'q': 'cámara'})
+        self.assertEqual(list(response.context['products']), [self.camera, self.recorder])
+
+        response = self.client.get(reverse('products:product_list'), {'q': 'cerradura'})
+        self.assertEqual(list(response.context['products']), [])
+
+    def test_admin_product_list_search(self):
+        """Test el listado de administración usa la búsqueda con ranking"""
+        staff = User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('products:admin_product_list'), {'search': 'acceso'})
+        self.assertEqual(list(response.context['products']), [self.lock])
+
+    def test_benchmark_command_rolls_back(self):
+        """Test el benchmark no deja productos sintéticos en la base de datos"""
+        out = StringIO()
+        call_command('benchmark_product_search', products=300, queries=3, stdout=out)
+        self.assertIn('Texto completo', out.getvalue())
+        self.assertEqual(Product.objects.count(), 3)
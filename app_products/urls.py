@@ -6,6 +6,7 @@ app_name = 'products'
 urlpatterns = [
     # URLs para clientes
     path('', views.product_list, name='product_list'),
+    path('api/products/', views.product_list_api, name='product_list_api'),
     path('<slug:slug>/', views.product_detail, name='product_detail'),
     
     # URLs para administradores
@@ -15,6 +16,7 @@ urlpatterns = [
     path('admin/products/<uuid:product_id>/delete/', views.admin_product_delete, name='admin_product_delete'),
     path('admin/products/<uuid:product_id>/images/', views.admin_product_images, name='admin_product_images'),
     path('admin/products/<uuid:product_id>/images/upload/', views.admin_product_images_upload, name='admin_product_images_upload'),
+    path('admin/products/<uuid:product_id>/images/status/', views.admin_product_images_status, name='admin_product_images_status'),
     path('admin/products/<uuid:product_id>/images/<uuid:image_id>/update/', views.admin_product_image_update, name='admin_product_image_update'),
     path('admin/products/<uuid:product_id>/images/<uuid:image_id>/delete/', views.admin_product_image_delete, name='admin_product_image_delete'),
 ]
\ No newline at end of file
@@ -2,42 +2,74 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.core.paginator import Paginator
+from django.urls import reverse
+from Zultech_main.pagination import paginate
 from .models import Category, Product, ProductImage
 from .forms import ProductForm
+from .renditions import rendition_url
 from django.http import JsonResponse
-from django.db.models import Q
 
-# Vistas para clientes
-def product_list(request):
+def paginate_products(request, products, per_page, search_query):
+    """
+    Paginación por cursor del catálogo: por nombre, o por relevancia cuando
+    hay una búsqueda (los resultados ya vienen ordenados por search_rank)
+    """
+    ordering = None if search_query else ['name']
+    return paginate(request, products, per_page, ordering)
+
+def get_catalog_products(request):
+    """Productos con stock del catálogo, filtrados por categoría y búsqueda"""
     category_slug = request.GET.get('category')
-    categories = Category.objects.all()
-    products = Product.objects.filter(stock__gt=0)  # Mostrar productos con stock > 0
+    search_query = request.GET.get('q', '').strip()
+    products = Product.objects.for_catalog().filter(stock__gt=0)  # Mostrar productos con stock > 0
     
     if category_slug:
         category = get_object_or_404(Category, slug=category_slug)
         products = products.filter(category=category)
+    
+    if search_query:
+        products = products.search(search_query)
+    
+    return products, category_slug, search_query
+
+# Vistas para clientes
+def product_list(request):
+    categories = Category.objects.all()
+    products, category_slug, search_query = get_catalog_products(request)
         
-    # Paginación
-    page = request.GET.get('page', 1)
-    paginator = Paginator(products, 12)  # 12 productos por página
-    products = paginator.get_page(page)
+    # Paginación por cursor
+    products = paginate_products(request, products, 12, search_query)  # 12 productos por página
     
     context = {
         'categories': categories,
         'products': products,
-        'selected_category': category_slug
+        'selected_category': category_slug,
+        'search_query': search_query
     }
     return render(request, 'products/product_list.html', context)
 
+def product_list_api(request):
+    """Variante JSON del catálogo, con la misma paginación por cursor"""
+    products, _, search_query = get_catalog_products(request)
+    products = paginate_products(request, products, 12, search_query)
+    return JsonResponse(products.to_dict(lambda product: {
+        'id': str(product.id),
+        'name': product.name,
+        'slug': product.slug,
+        'category': product.category.name,
+        'price': str(product.price),
+        'stock': product.stock,
+        'url': reverse('products:product_detail', kwargs={'slug': product.slug}),
+    }))
+
 def product_detail(request, slug):
     """Vista detallada de un producto con galería de imágenes"""
-    product = get_object_or_404(Product, slug=slug)
+    product = get_object_or_404(Product.objects.for_catalog(), slug=slug)
     images = product.images.all()
     main_image = product.get_main_image()
     
     # Productos relacionados de la misma categoría
-    related_products = Product.objects.filter(
+    related_products = Product.objects.for_catalog().filter(
         category=product.category,
         available=True,
         stock__gt=0
@@ -54,28 +86,26 @@ def product_detail(request, slug):
 # Vistas para administradores
 @staff_member_required
 def admin_product_list(request):
-    search_query = request.GET.get('search', '')
+    search_query = request.GET.get('search', '').strip()
     category_id = request.GET.get('category')
-    products = Product.objects.all()
+    products = Product.objects.for_catalog()
     
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query)
-        )
+        products = products.search(search_query)
     
     if category_id:
         products = products.filter(category_id=category_id)
     
-    # Paginación
-    page = request.GET.get('page', 1)
-    paginator = Paginator(products, 10)  # 10 productos por página
-    products = paginator.get_page(page)
+    product_count = products.count()
+    
+    # Paginación por cursor
+    products = paginate_products(request, products, 10, search_query)  # 10 productos por página
     
     categories = Category.objects.all()
     
     return render(request, 'products/admin/product_list.html', {
         'products': products,
+        'product_count': product_count,
         'categories': categories,
         'search_query': search_query,
         'selected_category': category_id
@@ -91,14 +121,8 @@ def admin_product_create(request):
             # Procesar imágenes si se subieron
             images = request.FILES.getlist('product_images')
             if images:
-                for idx, image in enumerate(images):
-                    # La primera imagen será la principal
-                    is_main = (idx == 0)
-                    ProductImage.objects.create(
-                        product=product,
-                        image=image,
-                        is_main=is_main
-                    )
+                # La primera imagen será la principal; los derivados se generan en segundo plano
+                ProductImage.objects.add_uploads(product, images, main=True)
                 messages.success(request, f'Producto "{product.name}" creado exitosamente con {len(images)} imagen(es).')
             else:
                 messages.success(request, f'Producto "{product.name}" creado exitosamente.')
@@ -119,14 +143,8 @@ def admin_product_edit(request, product_id):
             # Procesar imágenes nuevas si se subieron
             images = request.FILES.getlist('product_images')
             if images:
-                for image in images:
-                    # Si no hay imágenes principales, hacer la primera como principal
-                    is_main = not product.images.filter(is_main=True).exists()
-                    ProductImage.objects.create(
-                        product=product,
-                        image=image,
-                        is_main=is_main
-                    )
+                # Si no hay imágenes principales, hacer la primera como principal
+                ProductImage.objects.add_uploads(product, images, main=True)
                 messages.success(request, f'Producto "{product.name}" actualizado exitosamente con {len(images)} nueva(s) imagen(es).')
             else:
                 messages.success(request, f'Producto "{product.name}" actualizado exitosamente.')
@@ -157,11 +175,24 @@ def admin_product_images(request, product_id):
 def admin_product_images_upload(request, product_id):
     product = get_object_or_404(Product, id=product_id)
     if request.method == 'POST' and request.FILES:
-        for image in request.FILES.getlist('images'):
-            ProductImage.objects.create(product=product, image=image)
-        messages.success(request, 'Imágenes subidas exitosamente.')
+        ProductImage.objects.add_uploads(product, request.FILES.getlist('images'))
+        messages.success(request, 'Imágenes subidas exitosamente. Las versiones optimizadas se generan en segundo plano.')
     return redirect('products:admin_product_images', product_id=product_id)
 
+@staff_member_required
+def admin_product_images_status(request, product_id):
+    """Estado del procesamiento de las imágenes, para actualizar la página sin recargarla"""
+    images = ProductImage.objects.filter(product_id=product_id).only('id', 'image', 'renditions', 'status')
+    return JsonResponse({'images': [
+        {
+            'id': str(image.id),
+            'status': image.status,
+            'status_display': image.get_status_display(),
+            'url': rendition_url(image, 'card'),
+        }
+        for image in images
+    ]})
+
 @staff_member_required
 def admin_product_image_update(request, product_id, image_id):
     image = get_object_or_404(ProductImage, id=image_id, product_id=product_id)
@@ -1,15 +1,19 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from django.db.models import Count, Max, Q
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.utils import timezone
+from .consumers import notify_room_update
 from .models import ChatRoom, Message
+from .utils import invalidate_admin_unread_total
 
 
 class MessageInline(admin.TabularInline):
     """Inline para mostrar mensajes en la sala de chat"""
     model = Message
     extra = 0
-    fields = ('sender', 'content_preview', 'is_read', 'created_at')
-    readonly_fields = ('sender', 'content_preview', 'is_read', 'created_at')
+    fields = ('sender', 'content_preview', 'created_at')
+    readonly_fields = ('sender', 'content_preview', 'created_at')
     can_delete = False
     
     def content_preview(self, obj):
@@ -70,7 +74,7 @@ class ChatRoomAdmin(admin.ModelAdmin):
         queryset = super().get_queryset(request)
         return queryset.select_related('order', 'customer', 'admin', 'attended_by').annotate(
             _messages_count=Count('messages'),
-            _unread_count=Count('messages', filter=Q(messages__is_read=False)),
+            _unread_count=F('admin_unread_count') + F('customer_unread_count'),
             _last_message_time=Max('messages__created_at')
         )
     
@@ -115,7 +119,7 @@ class ChatRoomAdmin(admin.ModelAdmin):
         if hasattr(obj, '_unread_count'):
             count = obj._unread_count
         else:
-            count = obj.messages.filter(is_read=False).count()
+            count = obj.admin_unread_count + obj.customer_unread_count
         
         if count == 0:
             return format_html('<span style="color: #888;">0</span>')
@@ -137,22 +141,51 @@ class ChatRoomAdmin(admin.ModelAdmin):
     last_message_time.short_description = 'Último Mensaje'
     last_message_time.admin_order_field = '_last_message_time'
     
+    def save_model(self, request, obj, form, change):
+        """Avisa a los sockets conectados si cambió el estado o el admin de la sala"""
+        super().save_model(request, obj, form, change)
+        if change and {'is_active', 'admin'} & set(form.changed_data):
+            invalidate_admin_unread_total()
+            notify_room_update(obj)
+    
+    def set_rooms_active(self, queryset, is_active):
+        """
+        Cambia el estado de las salas que no lo tienen y avisa a sus sockets
+        conectados (al confirmar) para que acepten o rechacen mensajes.
+        Retorna cuántas cambiaron.
+        """
+        with transaction.atomic():
+            rooms = list(
+                ChatRoom.objects.filter(pk__in=list(queryset.values_list('pk', flat=True)))
+                .exclude(is_active=is_active).only('id', 'admin_id')
+            )
+            updated = ChatRoom.objects.filter(pk__in=[room.pk for room in rooms]).update(is_active=is_active)
+            for room in rooms:
+                room.is_active = is_active
+                notify_room_update(room)
+        invalidate_admin_unread_total()
+        return updated
+    
     @admin.action(description='Activar salas seleccionadas')
     def activate_rooms(self, request, queryset):
-        updated = queryset.update(is_active=True)
+        updated = self.set_rooms_active(queryset, True)
         self.message_user(request, f'{updated} sala(s) activada(s).')
     
     @admin.action(description='Desactivar salas seleccionadas')
     def deactivate_rooms(self, request, queryset):
-        updated = queryset.update(is_active=False)
+        updated = self.set_rooms_active(queryset, False)
         self.message_user(request, f'{updated} sala(s) desactivada(s).')
     
     @admin.action(description='Marcar todos los mensajes como leídos')
     def mark_all_as_read(self, request, queryset):
-        total_updated = 0
-        for room in queryset:
-            total_updated += room.messages.filter(is_read=False).update(is_read=True)
-        self.message_user(request, f'{total_updated} mensaje(s) marcado(s) como leído.')
+        # Mueve los marcadores de lectura de ambos participantes, sin tocar los mensajes
+        now = timezone.now()
+        updated = ChatRoom.objects.filter(pk__in=list(queryset.values_list('pk', flat=True))).update(
+            admin_last_read_at=now, customer_last_read_at=now,
+            admin_unread_count=0, customer_unread_count=0
+        )
+        invalidate_admin_unread_total()
+        self.message_user(request, f'{updated} sala(s) marcada(s) como leída(s).')
 
 
 @admin.register(Message)
@@ -167,7 +200,6 @@ class MessageAdmin(admin.ModelAdmin):
         'created_at'
     )
     list_filter = (
-        'is_read',
         'created_at',
         'sender__role'
     )
@@ -175,11 +207,10 @@ class MessageAdmin(admin.ModelAdmin):
     readonly_fields = ('id', 'created_at', 'chat_room', 'sender', 'content')
     list_per_page = 50
     date_hierarchy = 'created_at'
-    actions = ['mark_as_read', 'mark_as_unread']
     
     fieldsets = (
         ('Información del Mensaje', {
-            'fields': ('id', 'chat_room', 'sender', 'content', 'is_read')
+            'fields': ('id', 'chat_room', 'sender', 'content')
         }),
         ('Fechas', {
             'fields': ('created_at',),
@@ -199,22 +230,11 @@ class MessageAdmin(admin.ModelAdmin):
     content_preview.short_description = 'Mensaje'
     
     def read_status(self, obj):
-        """Muestra el estado de lectura con iconos"""
-        if obj.is_read:
+        """Muestra el estado de lectura (según el marcador del destinatario) con iconos"""
+        if obj.chat_room.is_read_by_recipient(obj):
             return format_html('<span style="color: #28a745;">✓ Leído</span>')
         return format_html('<span style="color: #ffc107;">⚠ No leído</span>')
     read_status.short_description = 'Estado'
-    read_status.admin_order_field = 'is_read'
-    
-    @admin.action(description='Marcar como leído')
-    def mark_as_read(self, request, queryset):
-        updated = queryset.update(is_read=True)
-        self.message_user(request, f'{updated} mensaje(s) marcado(s) como leído.')
-    
-    @admin.action(description='Marcar como no leído')
-    def mark_as_unread(self, request, queryset):
-        updated = queryset.update(is_read=False)
-        self.message_user(request, f'{updated} mensaje(s) marcado(s) como no leído.')
     
     def has_add_permission(self, request):
         """No permitir agregar mensajes manualmente desde el admin"""
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AppRoomChatsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app_room_chats'
+
+    def ready(self):
+        from . import checks  # noqa: F401 (registra los system checks)
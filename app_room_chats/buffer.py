@@ -0,0 +1,156 @@
+"""
+Escritura diferida de los mensajes del chat (CHAT_WRITE_BEHIND).
+
+El consumer construye el mensaje con su id y su fecha, lo difunde al grupo
+de inmediato y lo deja en el buffer del proceso. El buffer guarda los
+pendientes con un solo bulk_create (ver MessageQuerySet.bulk_add) cuando
+junta CHAT_WRITE_BUFFER_SIZE mensajes o cuando pasan
+CHAT_WRITE_BUFFER_DELAY segundos desde el primero pendiente.
+
+Garantía "al menos una vez": si el guardado falla por un error transitorio
+de la base de datos (conexión, bloqueo), el lote vuelve al buffer y se
+reintenta en el siguiente ciclo; los ids ya guardados se ignoran. Si falla
+por otro motivo, el lote se divide en mitades hasta aislar los mensajes que
+no se pueden guardar (por ejemplo, de una sala o usuario ya eliminados):
+el resto se guarda y cada mensaje fallido se reintenta hasta
+CHAT_WRITE_MAX_ATTEMPTS veces antes de descartarlo con un error en el log.
+Con CHAT_WRITE_BUFFER_MAX_PENDING mensajes pendientes el buffer no acepta
+más y el consumer guarda el mensaje directamente.
+
+Los pendientes también se guardan al desconectarse cada socket y al
+terminar el proceso. Si el proceso muere sin terminar normalmente se pierden
+como máximo los mensajes de los últimos CHAT_WRITE_BUFFER_DELAY segundos.
+"""
+import asyncio
+import atexit
+import logging
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import InterfaceError, OperationalError
+from .models import Message
+
+# Errores que no dependen de los mensajes: se reintenta el lote completo
+TRANSIENT_ERRORS = (InterfaceError, OperationalError)
+
+logger = logging.getLogger(__name__)
+
+
+class MessageBuffer:
+    """Mensajes construidos pero aún no guardados de este proceso"""
+
+    def __init__(self):
+        self.pending = []
+        # Intentos fallidos por id de los mensajes que no se pudieron guardar
+        self.attempts = {}
+        self._timer = None
+        self._flushes = set()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, message):
+        """
+        Agrega un mensaje sin guardar. No espera a la base de datos: el lote
+        se guarda en segundo plano al llenarse o al vencer el plazo. Retorna
+        False, sin agregarlo, si el buffer está lleno.
+        """
+        if len(self.pending) >= settings.CHAT_WRITE_BUFFER_MAX_PENDING:
+            return False
+        self.pending.append(message)
+        if len(self.pending) >= settings.CHAT_WRITE_BUFFER_SIZE:
+            self._cancel_timer()
+            self._track(asyncio.ensure_future(self._write()))
+        else:
+            self._schedule()
+        return True
+
+    def _track(self, task):
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    def _schedule(self):
+        loop = asyncio.get_running_loop()
+        if self._timer is None or self._timer.done() or self._timer.get_loop() is not loop:
+            self._timer = loop.create_task(self._flush_later())
+
+    def _cancel_timer(self):
+        timer, self._timer = self._timer, None
+        if timer is not None and timer.get_loop() is asyncio.get_running_loop():
+            timer.cancel()
+
+    async def _flush_later(self):
+        await asyncio.sleep(settings.CHAT_WRITE_BUFFER_DELAY)
+        # Desde aquí es un guardado en curso: flush() lo espera, no lo cancela
+        self._timer = None
+        self._track(asyncio.current_task())
+        await self._write()
+
+    async def _write(self):
+        """Guarda los pendientes en un lote; los que fallen vuelven al buffer"""
+        batch, self.pending = self.pending, []
+        if not batch:
+            return 0
+        saved, retry = await database_sync_to_async(self._save)(batch)
+        if retry:
+            self.pending[:0] = retry
+            self._schedule()
+        return saved
+
+    def _save(self, batch):
+        """
+        Guarda `batch` con bulk_add; si falla por un error que no es
+        transitorio, lo divide en mitades para guardar los demás mensajes.
+        Retorna (mensajes guardados, mensajes a reintentar).
+        """
+        try:
+            saved = Message.objects.bulk_add(batch)
+        except TRANSIENT_ERRORS:
+            logger.exception('No se pudieron guardar %d mensajes del chat; se reintentará', len(batch))
+            return 0, batch
+        except Exception:
+            if len(batch) > 1:
+                middle = len(batch) // 2
+                saved_first, retry_first = self._save(batch[:middle])
+                saved_second, retry_second = self._save(batch[middle:])
+                return saved_first + saved_second, retry_first + retry_second
+            return 0, self._failed(batch[0])
+        for message in batch:
+            self.attempts.pop(message.pk, None)
+        return saved, []
+
+    def _failed(self, message):
+        """Cuenta un intento fallido del mensaje; retorna [message] si se reintentará"""
+        attempts = self.attempts.pop(message.pk, 0) + 1
+        if attempts >= settings.CHAT_WRITE_MAX_ATTEMPTS:
+            logger.exception('Se descartó el mensaje %s del chat tras %d intentos', message.pk, attempts)
+            return []
+        self.attempts[message.pk] = attempts
+        logger.exception('No se pudo guardar el mensaje %s del chat; se reintentará', message.pk)
+        return [message]
+
+    async def flush(self):
+        """
+        Guarda todos los pendientes y espera los guardados en segundo plano
+        del mismo loop. Retorna la cantidad de mensajes guardados por esta
+        llamada (0 si el lote falló y quedó pendiente de reintento).
+        """
+        self._cancel_timer()
+        saved = await self._write()
+        loop = asyncio.get_running_loop()
+        running = [task for task in self._flushes if task.get_loop() is loop]
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+        return saved
+
+    def flush_sync(self):
+        """Guarda los pendientes al terminar el proceso (fuera del event loop)"""
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        _, lost = self._save(batch)
+        if lost:
+            logger.error('Se perdieron %d mensajes del chat al terminar el proceso', len(lost))
+
+
+message_buffer = MessageBuffer()
+atexit.register(message_buffer.flush_sync)
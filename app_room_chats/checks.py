@@ -0,0 +1,24 @@
+import os
+from django.conf import settings
+from django.core.checks import Warning, register
+
+from Zultech_main.channel_layers import MEMORY_BACKEND
+
+
+@register()
+def check_channel_layer(app_configs, **kwargs):
+    """
+    Advierte si la capa de canales en memoria se usa con varios workers: los
+    mensajes del chat no llegarían a los sockets conectados a otro worker
+    """
+    layer = getattr(settings, 'CHANNEL_LAYERS', {}).get('default', {})
+    workers = os.environ.get('WEB_CONCURRENCY', '1')
+    if layer.get('BACKEND') == MEMORY_BACKEND and workers.isdigit() and int(workers) > 1:
+        return [
+            Warning(
+                f'CHANNEL_LAYERS usa InMemoryChannelLayer con WEB_CONCURRENCY={workers}.',
+                hint='Define REDIS_URL (o REDIS_SENTINELS) para compartir el chat entre workers.',
+                id='app_room_chats.W001',
+            )
+        ]
+    return []
@@ -1,10 +1,103 @@
 import json
+import logging
+import time
+from datetime import datetime
+from asgiref.sync import async_to_sync
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from .buffer import message_buffer
+from app_orders.models import Order
 from .models import ChatRoom, Message
+from .presence import ADMIN, CUSTOMER, mark_offline, mark_online, online_roles
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+# Grupo de la bandeja de entrada de los admins (AdminInboxConsumer)
+ADMIN_INBOX_GROUP = 'admin_inbox'
+
+
+def room_group_name(room_id):
+    """Grupo de la capa de canales con los sockets conectados a una sala"""
+    return f'chat_{room_id}'
+
+
+def broadcast(group, event):
+    """
+    Envía `event` al grupo desde código síncrono (vistas, admin, servicios)
+    cuando se confirme la transacción en curso, o de inmediato fuera de una.
+    `event` puede ser una función que construye el evento al enviarlo. Si
+    la capa de canales falla (Redis caído) se registra el error: el cambio
+    ya está guardado y la petición no debe fallar por el aviso.
+    """
+    def send():
+        try:
+            async_to_sync(get_channel_layer().group_send)(group, event() if callable(event) else event)
+        except Exception:
+            logger.exception('No se pudo enviar un evento al grupo %s', group)
+
+    transaction.on_commit(send)
+
+
+def inbox_stats():
+    """Estadísticas del panel de chat_list (salas activas), en una sola consulta"""
+    return ChatRoom.objects.filter(is_active=True).stats()
+
+
+def notify_room_update(chat_room):
+    """
+    Avisa a los sockets de la sala que cambió su estado (cerrada o admin
+    asignado) para que actualicen la sala que guardan en memoria
+    """
+    broadcast(
+        room_group_name(chat_room.id),
+        {
+            'type': 'room_update',
+            'is_active': chat_room.is_active,
+            'admin_id': chat_room.admin_id,
+        }
+    )
+
+
+def read_receipt_event(chat_room, user, last_read_at):
+    """Evento de grupo: `user` leyó la sala hasta `last_read_at`"""
+    return {
+        'type': 'read_receipt',
+        'reader': 'customer' if user.pk == chat_room.customer_id else 'admin',
+        'last_read_at': last_read_at.isoformat(),
+    }
+
+
+def notify_read(chat_room, user, last_read_at):
+    """Avisa a los sockets de la sala que `user` la leyó (desde vistas HTTP)"""
+    broadcast(room_group_name(chat_room.id), read_receipt_event(chat_room, user, last_read_at))
+
+
+def notify_inbox(event, **data):
+    """
+    Envía un evento incremental a la bandeja de los admins conectados
+    (room_created, room_assigned, room_closed, order_status, ...) con las
+    estadísticas del panel calculadas al confirmar (`stats`), para que el
+    navegador no tenga que deducirlas del evento
+    """
+    broadcast(ADMIN_INBOX_GROUP, lambda: {
+        'type': 'inbox_event', 'event': event, 'stats': inbox_stats(), **data
+    })
+
+
+def notify_order_status(order_id, previous_status, status):
+    """Avisa a la bandeja de los admins que cambió el estado de una orden"""
+    notify_inbox(
+        'order_status',
+        order_id=str(order_id),
+        previous_status=previous_status,
+        status=status,
+        status_display=dict(Order.STATUS_CHOICES).get(status, status),
+    )
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
@@ -15,7 +108,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         """Cuando un usuario se conecta al WebSocket"""
         self.room_id = self.scope['url_route']['kwargs']['room_id']
-        self.room_group_name = f'chat_{self.room_id}'
+        self.room_group_name = room_group_name(self.room_id)
         self.user = self.scope['user']
         
         # Verificar que el usuario esté autenticado
@@ -23,9 +116,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
         
-        # Verificar que el usuario tenga acceso a esta sala
-        has_access = await self.check_room_access()
-        if not has_access:
+        # Cargar la sala y verificar el acceso una sola vez por conexión
+        self.room = await self.load_room()
+        if self.room is None:
             await self.close()
             return
         
@@ -37,15 +130,35 @@ class ChatConsumer(AsyncWebsocketConsumer):
         
         await self.accept()
         
-        # Enviar historial de mensajes
-        messages = await self.get_messages()
+        # Con escritura diferida, el historial debe incluir los pendientes
+        await message_buffer.flush()
+        
+        # Enviar la página más reciente del historial
+        await self.send_history('message_history')
+        
+        # Presencia: solo en la capa de canales, sin escrituras en la base de datos
+        self.presence_role = CUSTOMER if self.user.pk == self.room.customer_id else ADMIN
+        self.presence_touched_at = 0
+        self.typing_sent_at = 0
+        roles = await online_roles(self.channel_layer, self.room_id)
+        await self.touch_presence()
+        if self.presence_role not in roles:
+            await self.send_presence(True)
         await self.send(text_data=json.dumps({
-            'type': 'message_history',
-            'messages': messages
+            'type': 'presence_state',
+            'online': sorted(roles | {self.presence_role}),
+            'heartbeat_interval': settings.CHAT_PRESENCE_TTL / 2
         }))
     
     async def disconnect(self, close_code):
         """Cuando un usuario se desconecta del WebSocket"""
+        # Guardar los mensajes que aún estén en el buffer de escritura diferida
+        await message_buffer.flush()
+        if getattr(self, 'presence_role', None):
+            await mark_offline(self.channel_layer, self.room_id, self.presence_role, self.channel_name)
+            # Offline solo cuando se cierra el último socket de ese lado de la sala
+            if self.presence_role not in await online_roles(self.channel_layer, self.room_id):
+                await self.send_presence(False)
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
@@ -59,8 +172,25 @@ class ChatConsumer(AsyncWebsocketConsumer):
         if message_type == 'chat_message':
             message_content = text_data_json['message']
             
-            # Guardar el mensaje en la base de datos
-            message = await self.save_message(message_content)
+            if not self.room.is_active:
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'message': 'El chat está cerrado'
+                }))
+                return
+            
+            message = None
+            if settings.CHAT_WRITE_BEHIND:
+                # Se difunde ya y se guarda en lote más tarde (ver buffer.py)
+                message = Message(chat_room=self.room, sender=self.user, content=message_content)
+                if not message_buffer.add(message):
+                    # Buffer lleno: se guarda directamente
+                    message = None
+            if message is None:
+                # Guardar el mensaje en la base de datos
+                message = await self.save_message(message_content)
+            # El mensaje reemplaza el indicador; el próximo "typing" se difunde ya
+            self.typing_sent_at = 0
             
             # Obtener role del usuario
             user_role = getattr(self.user, 'role', 'customer')
@@ -77,10 +207,98 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     'timestamp': message.created_at.isoformat()
                 }
             )
+            
+            # Actualizar la bandeja de los admins sin recargar chat_list
+            await self.channel_layer.group_send(
+                ADMIN_INBOX_GROUP,
+                {
+                    'type': 'inbox_event',
+                    'event': 'message_received',
+                    'room_id': str(self.room_id),
+                    'from_customer': self.presence_role == CUSTOMER,
+                    'sender': self.user.email,
+                    'preview': message_content[:80],
+                    'timestamp': message.created_at.isoformat()
+                }
+            )
         
         elif message_type == 'mark_as_read':
-            # Marcar mensajes como leídos
-            await self.mark_messages_as_read()
+            # Marcar mensajes como leídos (incluidos los aún no guardados)
+            await message_buffer.flush()
+            last_read_at = await self.mark_messages_as_read()
+            await self.channel_layer.group_send(
+                self.room_group_name,
+                read_receipt_event(self.room, self.user, last_read_at)
+            )
+            if self.presence_role == ADMIN:
+                await self.channel_layer.group_send(
+                    ADMIN_INBOX_GROUP,
+                    {'type': 'inbox_event', 'event': 'room_read', 'room_id': str(self.room_id)}
+                )
+        
+        elif message_type == 'load_older':
+            # Página anterior del historial a partir del cursor recibido
+            cursor = text_data_json.get('cursor')
+            if cursor:
+                await self.send_history('older_messages', cursor)
+        
+        elif message_type == 'typing':
+            await self.send_typing()
+        
+        elif message_type == 'heartbeat':
+            await self.touch_presence()
+    
+    async def touch_presence(self):
+        """Renovar la entrada de presencia, como máximo una vez por tercio del TTL"""
+        now = time.monotonic()
+        if now - self.presence_touched_at >= settings.CHAT_PRESENCE_TTL / 3:
+            self.presence_touched_at = now
+            await mark_online(self.channel_layer, self.room_id, self.presence_role, self.channel_name)
+    
+    async def send_presence(self, online):
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'presence',
+                'role': self.presence_role,
+                'online': online
+            }
+        )
+    
+    async def send_typing(self):
+        """
+        Difundir que el usuario está escribiendo. Las pulsaciones se agrupan:
+        como máximo un evento cada CHAT_TYPING_THROTTLE segundos por socket, y
+        el navegador oculta el indicador si no se renueva en CHAT_TYPING_TTL.
+        """
+        now = time.monotonic()
+        if now - self.typing_sent_at < settings.CHAT_TYPING_THROTTLE:
+            return
+        self.typing_sent_at = now
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'typing',
+                'role': self.presence_role,
+                'sender': self.user.email,
+                'sender_channel': self.channel_name,
+                'ttl': settings.CHAT_TYPING_TTL
+            }
+        )
+    
+    async def send_history(self, message_type, cursor=None):
+        """
+        Enviar una página del historial. `cursor` es el valor recibido en la
+        página anterior (None: mensajes más recientes); `has_more` indica si
+        quedan mensajes más antiguos para pedir con "load_older".
+        """
+        messages, older_cursor = await self.get_messages(cursor)
+        await self.send(text_data=json.dumps({
+            'type': message_type,
+            'messages': messages,
+            'has_more': older_cursor is not None,
+            'cursor': older_cursor
+        }))
     
     async def chat_message(self, event):
         """Enviar mensaje al WebSocket"""
@@ -93,52 +311,130 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'timestamp': event['timestamp']
         }))
     
+    async def presence(self, event):
+        """El otro lado de la sala (cliente o admins) se conectó o desconectó"""
+        if event['role'] == self.presence_role:
+            return
+        await self.send(text_data=json.dumps({
+            'type': 'presence',
+            'role': event['role'],
+            'online': event['online']
+        }))
+    
+    async def typing(self, event):
+        """Indicador de escritura, excepto para el socket que lo originó"""
+        if event['sender_channel'] == self.channel_name:
+            return
+        await self.send(text_data=json.dumps({
+            'type': 'typing',
+            'role': event['role'],
+            'sender': event['sender'],
+            'ttl': event['ttl']
+        }))
+    
+    async def room_update(self, event):
+        """
+        La sala cambió (close_chat o admin asignado): actualizar la copia en
+        memoria sin volver a consultarla y avisar al navegador
+        """
+        self.room.is_active = event['is_active']
+        self.room.admin_id = event['admin_id']
+        await self.send(text_data=json.dumps({
+            'type': 'room_update',
+            'is_active': event['is_active'],
+            'has_admin': event['admin_id'] is not None
+        }))
+    
+    async def read_receipt(self, event):
+        """
+        Un participante leyó la sala: actualizar su marcador en la copia en
+        memoria (para el is_read del historial) y avisar al navegador
+        """
+        last_read_at = datetime.fromisoformat(event['last_read_at'])
+        if event['reader'] == 'customer':
+            self.room.customer_last_read_at = last_read_at
+        else:
+            self.room.admin_last_read_at = last_read_at
+        await self.send(text_data=json.dumps({
+            'type': 'read_receipt',
+            'reader': event['reader'],
+            'last_read_at': event['last_read_at']
+        }))
+    
     @database_sync_to_async
-    def check_room_access(self):
-        """Verificar que el usuario tenga acceso a la sala"""
+    def load_room(self):
+        """
+        Cargar la sala con solo los campos que usa la conexión y verificar el
+        acceso; retorna None si la sala no existe o el usuario no tiene acceso
+        """
         try:
-            chat_room = ChatRoom.objects.get(id=self.room_id)
-            # Verificar role del usuario
-            user_role = getattr(self.user, 'role', None)
-            is_admin = user_role == 'admin' or self.user.is_staff or self.user.is_superuser
-            # El usuario debe ser el cliente de la orden o un admin
-            return (chat_room.customer == self.user or is_admin)
+            chat_room = ChatRoom.objects.only(
+                'id', 'customer_id', 'admin_id', 'is_active',
+                'customer_last_read_at', 'admin_last_read_at'
+            ).get(id=self.room_id)
         except ChatRoom.DoesNotExist:
-            return False
+            return None
+        # Verificar role del usuario
+        user_role = getattr(self.user, 'role', None)
+        is_admin = user_role == 'admin' or self.user.is_staff or self.user.is_superuser
+        # El usuario debe ser el cliente de la orden o un admin
+        if chat_room.customer_id != self.user.pk and not is_admin:
+            return None
+        return chat_room
     
     @database_sync_to_async
-    def get_messages(self):
-        """Obtener el historial de mensajes de la sala"""
-        try:
-            chat_room = ChatRoom.objects.get(id=self.room_id)
-            messages = chat_room.messages.all()[:50]  # Últimos 50 mensajes
-            return [
-                {
-                    'id': str(msg.id),
-                    'sender': msg.sender.email,
-                    'sender_role': msg.sender.role,
-                    'content': msg.content,
-                    'timestamp': msg.created_at.isoformat(),
-                    'is_read': msg.is_read
-                }
-                for msg in messages
-            ]
-        except ChatRoom.DoesNotExist:
-            return []
+    def get_messages(self, cursor=None):
+        """Obtener una página del historial (remitentes cargados con JOIN)"""
+        messages, older_cursor = Message.objects.filter(
+            chat_room_id=self.room_id
+        ).history_page(cursor)
+        return [
+            {
+                'id': str(msg.id),
+                'sender': msg.sender.email,
+                'sender_role': msg.sender.role,
+                'content': msg.content,
+                'timestamp': msg.created_at.isoformat(),
+                'is_read': self.room.is_read_by_recipient(msg)
+            }
+            for msg in messages
+        ], older_cursor
     
     @database_sync_to_async
     def save_message(self, content):
-        """Guardar un mensaje en la base de datos"""
-        chat_room = ChatRoom.objects.get(id=self.room_id)
-        message = Message.objects.create(
-            chat_room=chat_room,
-            sender=self.user,
-            content=content
-        )
-        return message
+        """Guardar un mensaje en la base de datos (la sala ya está cargada)"""
+        return self.room.add_message(self.user, content)
     
     @database_sync_to_async
     def mark_messages_as_read(self):
-        """Marcar todos los mensajes de otros usuarios como leídos"""
-        chat_room = ChatRoom.objects.get(id=self.room_id)
-        chat_room.messages.exclude(sender=self.user).update(is_read=True)
+        """Mover el marcador de lectura del usuario (un UPDATE de la sala)"""
+        return self.room.mark_as_read(self.user)
+
+
+class AdminInboxConsumer(AsyncWebsocketConsumer):
+    """
+    Bandeja de entrada en vivo de los admins: chat_list se carga una vez y
+    luego recibe eventos incrementales (sala creada, mensaje recibido, sala
+    asignada/cerrada/leída, estado de orden) en vez de recargar la página
+    """
+    
+    async def connect(self):
+        user = self.scope['user']
+        user_role = getattr(user, 'role', None)
+        is_admin = user.is_authenticated and (
+            user_role == 'admin' or user.is_staff or user.is_superuser
+        )
+        if not is_admin:
+            await self.close()
+            return
+        
+        await self.channel_layer.group_add(ADMIN_INBOX_GROUP, self.channel_name)
+        await self.accept()
+    
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(ADMIN_INBOX_GROUP, self.channel_name)
+    
+    async def inbox_event(self, event):
+        """Reenviar el evento al navegador con su nombre como tipo"""
+        payload = {key: value for key, value in event.items() if key not in ('type', 'event')}
+        await self.send(text_data=json.dumps({'type': event['event'], **payload}))
@@ -1,4 +1,4 @@
-from .models import ChatRoom
+from .utils import get_admin_unread_total
 
 
 def unread_chat_count(request):
@@ -13,16 +13,9 @@ def unread_chat_count(request):
         
         if is_admin:
             try:
-                # Obtener todas las salas activas
-                chat_rooms = ChatRoom.objects.filter(is_active=True).prefetch_related('messages')
-                
-                # Contar mensajes no leídos
-                total_unread = 0
-                for chat in chat_rooms:
-                    total_unread += chat.unread_count_for_admin
-                
+                # Total cacheado: una sola consulta agregada cuando expira
                 return {
-                    'admin_unread_chats': total_unread
+                    'admin_unread_chats': get_admin_unread_total()
                 }
             except Exception:
                 pass
@@ -0,0 +1,138 @@
+import asyncio
+import statistics
+import time
+import uuid
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from app_orders.models import Order
+from app_room_chats.models import ChatRoom, Message
+from app_room_chats.routing import websocket_urlpatterns
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Simula cientos de sockets enviando mensajes a la vez y compara la '
+        'latencia (p50/p99 desde el envío hasta recibir el propio mensaje) '
+        'con guardado directo y con escritura diferida (CHAT_WRITE_BEHIND). '
+        'Por defecto trabaja sobre una base de datos de prueba desechable '
+        '(como la de los tests); con --in-place usa la base configurada y '
+        'elimina al terminar las salas y usuarios temporales.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, default=200,
+                            help='Sockets simultáneos, dos por sala (por defecto 200)')
+        parser.add_argument('--messages', type=int, default=10,
+                            help='Mensajes que envía cada socket (por defecto 10)')
+        parser.add_argument('--mode', choices=['both', 'direct', 'buffered'], default='both',
+                            help='Modo a medir (por defecto ambos)')
+        parser.add_argument('--in-place', action='store_true',
+                            help='Usar la base de datos configurada en lugar de una de prueba desechable')
+
+    def handle(self, *args, **options):
+        # Los consumers guardan desde otros hilos y cierran conexiones, así
+        # que no se puede revertir una transacción como en check_query_plans:
+        # se usa una base de datos de prueba que se destruye al terminar
+        if options['in_place']:
+            results = self.measure(options)
+        else:
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                results = self.measure(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if len(results) == 2:
+            direct, buffered = results['direct'], results['buffered']
+            self.stdout.write(self.style.SUCCESS(
+                f'¡Completado! p99 directo {direct:.1f} ms, p99 diferido {buffered:.1f} ms '
+                f'({direct / buffered if buffered else 0:.1f}x).'
+            ))
+
+    def measure(self, options):
+        """Mide cada modo con salas temporales, que se eliminan aunque algo falle"""
+        sockets = max(options['sockets'] // 2 * 2, 2)
+        modes = ['direct', 'buffered'] if options['mode'] == 'both' else [options['mode']]
+        tag = uuid.uuid4().hex[:8]
+
+        results = {}
+        try:
+            rooms = self.create_rooms(tag, sockets // 2)
+            for mode in modes:
+                before = Message.objects.filter(chat_room__in=[room for room, _ in rooms]).count()
+                with override_settings(CHAT_WRITE_BEHIND=(mode == 'buffered')):
+                    elapsed, latencies = async_to_sync(self.run)(rooms, options['messages'], tag)
+                saved = Message.objects.filter(chat_room__in=[room for room, _ in rooms]).count() - before
+                results[mode] = self.report(mode, elapsed, latencies, saved)
+                if saved != len(latencies):
+                    raise CommandError(f'{mode}: se enviaron {len(latencies)} mensajes y se guardaron {saved}.')
+        finally:
+            Order.objects.filter(user__username__startswith=f'load-{tag}-').delete()
+            User.objects.filter(username__startswith=f'load-{tag}-').delete()
+        return results
+
+    def create_rooms(self, tag, count):
+        admin = User.objects.create_user(username=f'load-{tag}-admin', password=None,
+                                         is_staff=True, role='ADMIN')
+        customers = User.objects.bulk_create([
+            User(username=f'load-{tag}-{i}', password='!') for i in range(count)
+        ])
+        orders = Order.objects.bulk_create([Order(user=customer) for customer in customers])
+        rooms = ChatRoom.objects.bulk_create([
+            ChatRoom(order=order, customer=order.user) for order in orders
+        ])
+        return [(room, (room.customer, admin)) for room in rooms]
+
+    async def run(self, rooms, messages, tag):
+        application = URLRouter(websocket_urlpatterns)
+        communicators = []
+        for room, users in rooms:
+            for user in users:
+                communicator = WebsocketCommunicator(application, f'/ws/chat/{room.id}/')
+                communicator.scope['user'] = user
+                connected, _ = await communicator.connect()
+                if not connected:
+                    raise CommandError(f'No se pudo conectar a la sala {room.id}.')
+                await communicator.receive_json_from()  # Historial inicial
+                communicators.append(communicator)
+
+        latencies = []
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            self.send_messages(communicator, f'{tag}-{i}', messages, latencies)
+            for i, communicator in enumerate(communicators)
+        ])
+        elapsed = time.perf_counter() - start
+
+        # Al desconectar se guardan los mensajes pendientes del buffer
+        for communicator in communicators:
+            await communicator.disconnect()
+        return elapsed, latencies
+
+    async def send_messages(self, communicator, prefix, messages, latencies):
+        for i in range(messages):
+            content = f'{prefix}-{i}'
+            sent = time.perf_counter()
+            await communicator.send_json_to({'type': 'chat_message', 'message': content})
+            # Los mensajes del otro socket de la sala también llegan aquí
+            while (await communicator.receive_json_from(timeout=60)).get('message') != content:
+                pass
+            latencies.append((time.perf_counter() - sent) * 1000)
+
+    def report(self, mode, elapsed, latencies, saved):
+        percentiles = statistics.quantiles(latencies, n=100)
+        p50, p99 = percentiles[49], percentiles[98]
+        label = 'Escritura diferida' if mode == 'buffered' else 'Guardado directo'
+        self.stdout.write(
+            f'{label}: {len(latencies)} mensajes en {elapsed:.2f}s '
+            f'({len(latencies) / elapsed:.0f} msg/s), p50 {p50:.1f} ms, '
+            f'p99 {p99:.1f} ms, guardados {saved}'
+        )
+        return p99
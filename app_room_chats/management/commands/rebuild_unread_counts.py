@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from app_room_chats.models import ChatRoom
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los contadores de mensajes no leídos de las salas de chat'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--active-only',
+            action='store_true',
+            help='Recalcular solo las salas activas'
+        )
+
+    def handle(self, *args, **options):
+        chat_rooms = ChatRoom.objects.all()
+        if options['active_only']:
+            chat_rooms = chat_rooms.filter(is_active=True)
+
+        updated = chat_rooms.rebuild_unread_counts()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'¡Completado! Contadores recalculados para {updated} sala(s).'
+            )
+        )
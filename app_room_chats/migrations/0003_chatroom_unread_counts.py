@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:27
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_unread_counts(apps, schema_editor):
+    ChatRoom = apps.get_model('app_room_chats', 'ChatRoom')
+    Message = apps.get_model('app_room_chats', 'Message')
+
+    def unread_count(messages):
+        return Coalesce(
+            Subquery(
+                messages.order_by().values('chat_room')
+                .annotate(total=Count('id')).values('total')
+            ),
+            0
+        )
+
+    unread = Message.objects.filter(chat_room=OuterRef('pk'), is_read=False)
+    ChatRoom.objects.update(
+        admin_unread_count=unread_count(unread.filter(sender=OuterRef('customer'))),
+        customer_unread_count=unread_count(unread.exclude(sender=OuterRef('customer'))),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_room_chats', '0002_chatroom_attended_at_chatroom_attended_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='admin_unread_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='customer_unread_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_unread_counts, migrations.RunPython.noop),
+    ]
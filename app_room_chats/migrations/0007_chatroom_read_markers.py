@@ -0,0 +1,82 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:13
+
+from datetime import datetime, timezone
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from app_room_chats.utils import invalidate_admin_unread_total
+
+NEVER_READ = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+
+def populate_read_markers(apps, schema_editor):
+    """Cada marcador es el último mensaje que el participante tenía marcado como leído"""
+    ChatRoom = apps.get_model('app_room_chats', 'ChatRoom')
+    Message = apps.get_model('app_room_chats', 'Message')
+
+    def last_read(messages):
+        return Subquery(
+            messages.order_by().values('chat_room')
+            .annotate(last=Max('created_at')).values('last')
+        )
+
+    read = Message.objects.filter(chat_room=OuterRef('pk'), is_read=True)
+    ChatRoom.objects.update(
+        admin_last_read_at=last_read(read.filter(sender=OuterRef('customer'))),
+        customer_last_read_at=last_read(read.exclude(sender=OuterRef('customer'))),
+    )
+
+
+def rebuild_unread_counts(apps, schema_editor):
+    """
+    Recalcula los contadores de no leídos a partir de los marcadores recién
+    cargados (como ChatRoom.objects.rebuild_unread_counts)
+    """
+    ChatRoom = apps.get_model('app_room_chats', 'ChatRoom')
+    Message = apps.get_model('app_room_chats', 'Message')
+
+    def unread_count(messages):
+        return Coalesce(
+            Subquery(messages.order_by().values('chat_room').annotate(total=Count('id')).values('total')),
+            0
+        )
+
+    def after_marker(marker):
+        return Coalesce(OuterRef(marker), Value(NEVER_READ))
+
+    messages = Message.objects.filter(chat_room=OuterRef('pk'))
+    ChatRoom.objects.update(
+        admin_unread_count=unread_count(messages.filter(
+            sender=OuterRef('customer'), created_at__gt=after_marker('admin_last_read_at')
+        )),
+        customer_unread_count=unread_count(messages.exclude(sender=OuterRef('customer')).filter(
+            created_at__gt=after_marker('customer_last_read_at')
+        )),
+    )
+    invalidate_admin_unread_total()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_room_chats', '0006_message_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='admin_last_read_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='customer_last_read_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(populate_read_markers, migrations.RunPython.noop),
+        migrations.RunPython(rebuild_unread_counts, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='message_unread_idx',
+        ),
+    ]
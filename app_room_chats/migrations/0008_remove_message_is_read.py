@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 22:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_room_chats', '0007_chatroom_read_markers'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+    ]
@@ -1,10 +1,100 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Substr
 from django.contrib.auth import get_user_model
-from app_orders.models import Order
+from django.utils import timezone
+from app_orders.models import Order, OrderItem
+from Zultech_main.pagination import CursorPaginator
+from .utils import invalidate_admin_unread_total
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
 import uuid
 
 User = get_user_model()
 
+# Fecha anterior a cualquier mensaje: marcador de quien nunca leyó la sala
+NEVER_READ = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def unread_increment(marker, created_ats):
+    """
+    Cuánto sube un contador de no leídos al guardar mensajes con las fechas
+    `created_ats`: solo cuentan los posteriores al marcador de lectura del
+    destinatario (`marker`), evaluado en el propio UPDATE. Un mensaje
+    anterior al marcador que se guarda tarde (escritura diferida) ya figura
+    como leído y no debe sumar.
+    """
+    created_ats = sorted(created_ats)
+    total = len(created_ats)
+    return Case(
+        When(**{f'{marker}__isnull': True}, then=Value(total)),
+        *[When(**{f'{marker}__lt': created_at}, then=Value(total - index))
+          for index, created_at in enumerate(created_ats)],
+        default=Value(0),
+    )
+
+
+class ChatRoomQuerySet(models.QuerySet):
+    def for_list(self):
+        """
+        Salas para chat_list: relaciones con JOIN y, por sala, la cantidad de
+        productos de la orden y el último mensaje (fecha y primeros 80
+        caracteres) como subconsultas, sin cargar mensajes ni items en memoria
+        """
+        last_message = Message.objects.filter(chat_room=OuterRef('pk')).order_by('-created_at', '-id')
+        items = (
+            OrderItem.objects.filter(order=OuterRef('order')).order_by()
+            .values('order').annotate(total=Count('id')).values('total')
+        )
+        return self.select_related('order', 'customer', 'admin', 'attended_by').annotate(
+            item_count=Coalesce(Subquery(items), 0),
+            last_message_at=Subquery(last_message.values('created_at')[:1]),
+            last_message_preview=Substr(Subquery(last_message.values('content')[:1]), 1, 80),
+        )
+
+    def stats(self):
+        """Estadísticas del panel de cotizaciones con una sola consulta (agregados condicionales)"""
+        return self.aggregate(
+            total_chats=Count('pk'),
+            unassigned_chats=Count('pk', filter=Q(admin__isnull=True)),
+            pending_orders=Count('pk', filter=Q(order__status='pending')),
+            processing_orders=Count('pk', filter=Q(order__status='processing')),
+            total_unread=Coalesce(Sum('admin_unread_count'), 0),
+        )
+
+    def rebuild_unread_counts(self):
+        """
+        Recalcula los contadores de no leídos de las salas a partir de los
+        marcadores de lectura (mensajes del otro participante posteriores al
+        marcador), con un único UPDATE para todas las salas del queryset
+        """
+        def unread_count(messages):
+            return Coalesce(
+                Subquery(
+                    messages.order_by().values('chat_room')
+                    .annotate(total=Count('id')).values('total')
+                ),
+                0
+            )
+
+        def after_marker(marker):
+            # Sin marcador (nunca leyó la sala) todos los mensajes cuentan
+            return Coalesce(OuterRef(marker), Value(NEVER_READ))
+
+        messages = Message.objects.filter(chat_room=OuterRef('pk'))
+        updated = self.update(
+            admin_unread_count=unread_count(messages.filter(
+                sender=OuterRef('customer'), created_at__gt=after_marker('admin_last_read_at')
+            )),
+            customer_unread_count=unread_count(messages.exclude(sender=OuterRef('customer')).filter(
+                created_at__gt=after_marker('customer_last_read_at')
+            )),
+        )
+        invalidate_admin_unread_total()
+        return updated
+
+
 class ChatRoom(models.Model):
     """
     Sala de chat entre cliente y administrador para discutir una orden/cotización
@@ -16,9 +106,18 @@ class ChatRoom(models.Model):
     attended_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='attended_chats', help_text='Administrador que atendió la cotización')
     attended_at = models.DateTimeField(null=True, blank=True, help_text='Fecha y hora en que se atendió la cotización')
     is_active = models.BooleanField(default=True)
+    # Contadores desnormalizados de mensajes no leídos (ver add_message y mark_as_read)
+    admin_unread_count = models.PositiveIntegerField(default=0, editable=False)
+    customer_unread_count = models.PositiveIntegerField(default=0, editable=False)
+    # Marcadores de lectura: hasta cuándo leyó la sala cada participante. Un
+    # mensaje está leído si es anterior o igual al marcador del destinatario
+    customer_last_read_at = models.DateTimeField(null=True, blank=True, editable=False)
+    admin_last_read_at = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ChatRoomQuerySet.as_manager()
+
     class Meta:
         ordering = ['-updated_at']
 
@@ -33,12 +132,125 @@ class ChatRoom(models.Model):
     @property
     def unread_count_for_customer(self):
         """Cuenta mensajes no leídos por el cliente"""
-        return self.messages.filter(sender__role='admin', is_read=False).count()
+        return self.customer_unread_count
 
     @property
     def unread_count_for_admin(self):
         """Cuenta mensajes no leídos por el admin"""
-        return self.messages.filter(sender__role='customer', is_read=False).count()
+        return self.admin_unread_count
+
+    def _unread_field_for(self, user):
+        """Contador que corresponde al lector: el cliente o el equipo de admins"""
+        if user.pk == self.customer_id:
+            return 'customer_unread_count'
+        return 'admin_unread_count'
+
+    def _read_marker_for(self, user):
+        """Marcador de lectura del lector: el del cliente o el del equipo de admins"""
+        if user.pk == self.customer_id:
+            return 'customer_last_read_at'
+        return 'admin_last_read_at'
+
+    def is_read_by_recipient(self, message):
+        """Si el destinatario de `message` ya lo leyó según su marcador"""
+        if message.sender_id == self.customer_id:
+            last_read_at = self.admin_last_read_at
+        else:
+            last_read_at = self.customer_last_read_at
+        return last_read_at is not None and message.created_at <= last_read_at
+
+    def _unread_field_for_sender(self, sender_id):
+        """Contador que incrementa un mensaje nuevo: el del otro participante"""
+        # Los mensajes del cliente quedan pendientes para el admin y viceversa
+        if sender_id == self.customer_id:
+            return 'admin_unread_count'
+        return 'customer_unread_count'
+
+    def _recipient_marker_for_sender(self, sender_id):
+        """Marcador de lectura del destinatario de un mensaje de `sender_id`"""
+        if sender_id == self.customer_id:
+            return 'admin_last_read_at'
+        return 'customer_last_read_at'
+
+    def add_message(self, sender, content):
+        """
+        Crea un mensaje e incrementa atómicamente el contador de no leídos
+        del otro participante, salvo que su marcador de lectura ya cubra la
+        fecha del mensaje
+        """
+        field = self._unread_field_for_sender(sender.pk)
+        marker = self._recipient_marker_for_sender(sender.pk)
+
+        with transaction.atomic():
+            message = Message.objects.create(
+                chat_room=self,
+                sender=sender,
+                content=content
+            )
+            ChatRoom.objects.filter(pk=self.pk).update(
+                **{field: F(field) + unread_increment(marker, [message.created_at])}
+            )
+        if field == 'admin_unread_count':
+            invalidate_admin_unread_total()
+        return message
+
+    def mark_as_read(self, user):
+        """
+        Registra que `user` leyó la sala hasta ahora: mueve su marcador de
+        lectura y reinicia su contador de no leídos con un único UPDATE de la
+        sala, sin importar cuántos mensajes tenga. Retorna el marcador.
+        """
+        field = self._unread_field_for(user)
+        marker = self._read_marker_for(user)
+        last_read_at = timezone.now()
+        ChatRoom.objects.filter(pk=self.pk).update(**{field: 0, marker: last_read_at})
+        if field == 'admin_unread_count':
+            invalidate_admin_unread_total()
+        setattr(self, field, 0)
+        setattr(self, marker, last_read_at)
+        return last_read_at
+
+
+class MessageQuerySet(models.QuerySet):
+    def bulk_add(self, messages):
+        """
+        Guarda en lote mensajes ya construidos (con id y fecha asignados) e
+        incrementa los contadores de no leídos con un UPDATE por sala y
+        contador; solo cuentan los mensajes posteriores al marcador de
+        lectura del destinatario (ver unread_increment). Los ids que ya
+        existan se omiten y no suman a los contadores, así que reintentar un
+        lote que sí se guardó no falla ni los infla. Retorna cuántos
+        mensajes se insertaron.
+        """
+        with transaction.atomic():
+            existing = set(self.filter(pk__in=[message.pk for message in messages]).values_list('pk', flat=True))
+            messages = [message for message in messages if message.pk not in existing]
+            increments = defaultdict(list)
+            for message in messages:
+                room = message.chat_room
+                key = (room.pk, room._unread_field_for_sender(message.sender_id),
+                       room._recipient_marker_for_sender(message.sender_id))
+                increments[key].append(message.created_at)
+            self.bulk_create(messages, ignore_conflicts=True)
+            for (room_id, field, marker), created_ats in increments.items():
+                ChatRoom.objects.filter(pk=room_id).update(
+                    **{field: F(field) + unread_increment(marker, created_ats)}
+                )
+        if any(field == 'admin_unread_count' for _, field, _ in increments):
+            invalidate_admin_unread_total()
+        return len(messages)
+
+    def history_page(self, cursor=None, page_size=None):
+        """
+        Ventana del historial desde el mensaje más reciente hacia atrás,
+        paginada por cursor sobre (created_at, id) con el remitente cargado
+        con JOIN: el costo no depende de cuántos mensajes tenga la sala.
+        Retorna (mensajes en orden cronológico, cursor de los anteriores o None).
+        """
+        page_size = page_size or settings.CHAT_HISTORY_PAGE_SIZE
+        paginator = CursorPaginator(self.select_related('sender'), page_size, ['-created_at'])
+        page = paginator.get_page(cursor)
+        return page.object_list[::-1], page.next_cursor
 
 
 class Message(models.Model):
@@ -49,11 +261,19 @@ class Message(models.Model):
     chat_room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     content = models.TextField()
-    is_read = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Se asigna al construir el mensaje (no al guardarlo) para que la escritura
+    # diferida guarde la misma fecha que ya se difundió por el WebSocket
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    objects = MessageQuerySet.as_manager()
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Historial de una sala (paginado por created_at, id) y mensajes
+            # posteriores a un marcador de lectura
+            models.Index(fields=['chat_room', 'created_at', 'id'], name='message_room_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender.email}: {self.content[:50]}"
@@ -0,0 +1,148 @@
+"""
+Presencia en las salas de chat (quién tiene la sala abierta), guardada en
+la capa de canales y no en la base de datos.
+
+Cada socket registra una entrada "sala:rol:canal" que vence a los
+CHAT_PRESENCE_TTL segundos; el navegador envía "heartbeat" para renovarla y
+se elimina al desconectarse. Si un worker muere sin desconectar sus
+sockets, sus entradas vencen solas.
+
+Con channels_redis las entradas son sorted sets (puntaje = vencimiento) en
+el mismo Redis que la capa: uno global, para que chat_list consulte todas
+las salas con un único ZRANGEBYSCORE, y uno por sala, para que conectar y
+desconectar solo lean los sockets de esa sala. Con InMemoryChannelLayer se
+guardan en la memoria del proceso, con el mismo alcance que la propia capa.
+"""
+import time
+import uuid
+from weakref import WeakKeyDictionary
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+CUSTOMER = 'customer'
+ADMIN = 'admin'
+
+
+class MemoryPresence:
+    """Entradas en diccionarios del proceso por sala (InMemoryChannelLayer)"""
+
+    def __init__(self):
+        self.rooms = {}
+
+    async def touch(self, room_id, member, expires_at):
+        self.rooms.setdefault(room_id, {})[member] = expires_at
+
+    async def remove(self, room_id, member):
+        entries = self.rooms.get(room_id, {})
+        entries.pop(member, None)
+        if not entries:
+            self.rooms.pop(room_id, None)
+
+    async def room_members(self, room_id, now):
+        entries = self.rooms.get(room_id, {})
+        for member, expires_at in list(entries.items()):
+            if expires_at <= now:
+                del entries[member]
+        return list(entries)
+
+    async def members(self, now):
+        return [
+            f'{room_id}:{member}'
+            for room_id in list(self.rooms)
+            for member in await self.room_members(room_id, now)
+        ]
+
+
+class RedisPresence:
+    """
+    Entradas en sorted sets del Redis de la capa (channels_redis): el global
+    con "sala:rol:canal" y uno por sala con "rol:canal"
+    """
+
+    def __init__(self, layer):
+        self.layer = layer
+        self.key = f'{layer.prefix}:presence'
+
+    def _room_key(self, room_id):
+        return f'{self.key}:{room_id}'
+
+    def _connection(self):
+        # Todas las claves de presencia en la misma conexión, para escribirlas juntas
+        return self.layer.connection(self.layer.consistent_hash(self.key))
+
+    async def touch(self, room_id, member, expires_at):
+        now = time.time()
+        room_key = self._room_key(room_id)
+        async with self._connection().pipeline(transaction=False) as pipe:
+            for key, entry in ((self.key, f'{room_id}:{member}'), (room_key, member)):
+                pipe.zadd(key, {entry: expires_at})
+                # Limpia las entradas vencidas para que cada consulta sea un solo comando
+                pipe.zremrangebyscore(key, '-inf', now)
+                pipe.expire(key, settings.CHAT_PRESENCE_TTL * 2)
+            await pipe.execute()
+
+    async def remove(self, room_id, member):
+        async with self._connection().pipeline(transaction=False) as pipe:
+            pipe.zrem(self.key, f'{room_id}:{member}')
+            pipe.zrem(self._room_key(room_id), member)
+            await pipe.execute()
+
+    async def room_members(self, room_id, now):
+        entries = await self._connection().zrangebyscore(self._room_key(room_id), now, '+inf')
+        return [entry.decode() for entry in entries]
+
+    async def members(self, now):
+        entries = await self._connection().zrangebyscore(self.key, now, '+inf')
+        return [entry.decode() for entry in entries]
+
+
+_stores = WeakKeyDictionary()
+
+
+def get_presence_store(layer=None):
+    """Almacén de presencia que corresponde a la capa de canales configurada"""
+    layer = layer or get_channel_layer()
+    store = _stores.get(layer)
+    if store is None:
+        if hasattr(layer, 'connection') and hasattr(layer, 'consistent_hash'):
+            store = RedisPresence(layer)
+        else:
+            store = MemoryPresence()
+        _stores[layer] = store
+    return store
+
+
+def _member(role, channel_name):
+    return f'{role}:{channel_name}'
+
+
+async def mark_online(layer, room_id, role, channel_name):
+    """Registra (o renueva) el socket `channel_name` en la sala"""
+    expires_at = time.time() + settings.CHAT_PRESENCE_TTL
+    await get_presence_store(layer).touch(str(room_id), _member(role, channel_name), expires_at)
+
+
+async def mark_offline(layer, room_id, role, channel_name):
+    await get_presence_store(layer).remove(str(room_id), _member(role, channel_name))
+
+
+async def online_rooms(layer=None):
+    """{id de sala: roles conectados} para todas las salas con presencia (chat_list)"""
+    rooms = {}
+    for member in await get_presence_store(layer).members(time.time()):
+        room_id, role, _ = member.split(':', 2)
+        rooms.setdefault(room_id, set()).add(role)
+    return rooms
+
+
+async def online_roles(layer, room_id):
+    """Roles (cliente/admin) con al menos un socket conectado a la sala, sin leer las demás salas"""
+    members = await get_presence_store(layer).room_members(str(room_id), time.time())
+    return {member.split(':', 1)[0] for member in members}
+
+
+def online_customer_rooms():
+    """Ids (UUID) de las salas cuyo cliente está conectado, para vistas HTTP"""
+    rooms = async_to_sync(online_rooms)()
+    return {uuid.UUID(room_id) for room_id, roles in rooms.items() if CUSTOMER in roles}
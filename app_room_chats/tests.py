@@ -1,3 +1,922 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+from datetime import timedelta
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from io import StringIO
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from channels_redis.core import RedisChannelLayer
+from app_orders.models import Order, OrderItem
+from Zultech_main.channel_layers import MEMORY_BACKEND, REDIS_BACKEND, build_channel_layers
+from .buffer import MessageBuffer
+from .consumers import room_group_name
+from .models import ChatRoom, Message, MessageQuerySet
+from .presence import get_presence_store, online_roles, online_rooms
+from .context_processors import unread_chat_count
+from .routing import websocket_urlpatterns
 
-# Create your tests here.
+try:
+    from fakeredis import TcpFakeServer
+except ImportError:
+    TcpFakeServer = None
+
+User = get_user_model()
+
+
+class ChatRoomUnreadCountTest(TestCase):
+    """Tests para los contadores desnormalizados de mensajes no leídos"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(
+            username='customer',
+            email='customer@test.com',
+            password='testpass123'
+        )
+        self.admin = User.objects.create_user(
+            username='admin',
+            email='admin@test.com',
+            password='testpass123',
+            is_staff=True,
+            role='ADMIN'
+        )
+        order = Order.objects.create(user=self.customer)
+        self.chat_room = ChatRoom.objects.create(order=order, customer=self.customer)
+
+    def test_add_message_increments_other_participant(self):
+        """Test cada mensaje incrementa el contador del otro participante"""
+        self.chat_room.add_message(self.customer, 'Hola')
+        self.chat_room.add_message(self.customer, '¿Precio?')
+        self.chat_room.add_message(self.admin, 'Buenas tardes')
+
+        self.chat_room.refresh_from_db()
+        self.assertEqual(self.chat_room.unread_count_for_admin, 2)
+        self.assertEqual(self.chat_room.unread_count_for_customer, 1)
+
+    def test_mark_as_read_resets_reader_counter(self):
+        """Test marcar como leído reinicia solo el contador y el marcador del lector"""
+        self.chat_room.add_message(self.customer, 'Hola')
+        self.chat_room.add_message(self.admin, 'Buenas tardes')
+
+        self.chat_room.mark_as_read(self.admin)
+
+        self.chat_room.refresh_from_db()
+        self.assertEqual(self.chat_room.unread_count_for_admin, 0)
+        self.assertEqual(self.chat_room.unread_count_for_customer, 1)
+        self.assertIsNone(self.chat_room.customer_last_read_at)
+        self.assertTrue(self.chat_room.is_read_by_recipient(self.chat_room.messages.get(sender=self.customer)))
+        self.assertFalse(self.chat_room.is_read_by_recipient(self.chat_room.messages.get(sender=self.admin)))
+
+    def test_message_saved_after_mark_as_read_keeps_counter(self):
+        """Test un mensaje anterior al marcador guardado tarde no cuenta como no leído"""
+        older = Message(chat_room=self.chat_room, sender=self.customer, content='Hola')
+        newer = Message(chat_room=self.chat_room, sender=self.customer, content='¿Sigue ahí?')
+        self.chat_room.mark_as_read(self.admin)
+        newer.created_at = timezone.now() + timedelta(seconds=1)
+
+        Message.objects.bulk_add([older, newer])
+
+        self.chat_room.refresh_from_db()
+        self.assertTrue(self.chat_room.is_read_by_recipient(older))
+        self.assertFalse(self.chat_room.is_read_by_recipient(newer))
+        self.assertEqual(self.chat_room.unread_count_for_admin, 1)
+
+    def test_mark_as_read_is_a_single_update(self):
+        """Test marcar como leído no depende del tamaño del historial"""
+        Message.objects.bulk_create([
+            Message(chat_room=self.chat_room, sender=self.customer, content=f'Mensaje {i}')
+            for i in range(10000)
+        ])
+        with CaptureQueriesContext(connection) as queries:
+            self.chat_room.mark_as_read(self.admin)
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(queries[0]['sql'].startswith('UPDATE "app_room_chats_chatroom"'))
+
+    def test_chat_room_view_marks_as_read(self):
+        """Test abrir la sala desde la web marca los mensajes como leídos"""
+        self.chat_room.add_message(self.admin, 'Buenas tardes')
+        client = Client()
+        client.force_login(self.customer)
+
+        response = client.get(reverse('room_chats:chat_room', kwargs={'room_id': self.chat_room.id}))
+        self.assertEqual(response.status_code, 200)
+
+        self.chat_room.refresh_from_db()
+        self.assertEqual(self.chat_room.unread_count_for_customer, 0)
+
+    def test_rebuild_unread_counts_command(self):
+        """Test el comando recalcula los contadores desde los mensajes"""
+        Message.objects.create(chat_room=self.chat_room, sender=self.customer, content='Hola')
+        Message.objects.create(chat_room=self.chat_room, sender=self.customer, content='Hola?')
+        read = Message.objects.create(chat_room=self.chat_room, sender=self.admin, content='Leído')
+        ChatRoom.objects.filter(pk=self.chat_room.pk).update(customer_last_read_at=read.created_at)
+
+        call_command('rebuild_unread_counts', stdout=StringIO())
+
+        self.chat_room.refresh_from_db()
+        self.assertEqual(self.chat_room.unread_count_for_admin, 2)
+        self.assertEqual(self.chat_room.unread_count_for_customer, 0)
+
+    def test_chat_list_query_count(self):
+        """Test el listado de salas no consulta los no leídos por cada sala"""
+        client = Client()
+        client.force_login(self.admin)
+
+        def add_rooms(count):
+            for _ in range(count):
+                order = Order.objects.create(user=self.customer)
+                chat_room = ChatRoom.objects.create(order=order, customer=self.customer)
+                chat_room.add_message(self.customer, 'Hola')
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(reverse('room_chats:chat_list'))
+            self.assertEqual(response.status_code, 200)
+            return len(context.captured_queries)
+
+        add_rooms(2)
+        count_queries()  # Calienta las cachés de los context processors
+        baseline = count_queries()
+        add_rooms(6)
+        count_queries()
+        self.assertEqual(count_queries(), baseline)
+
+
+class ChatListStatsTest(TestCase):
+    """Estadísticas y anotaciones del listado de salas"""
+
+    def setUp(self):
+        self.chat_room, self.customer, self.admin = create_chat_room()
+        other = ChatRoom.objects.create(
+            order=Order.objects.create(user=self.customer, status='processing'),
+            customer=self.customer, admin=self.admin
+        )
+        ChatRoom.objects.create(order=Order.objects.create(user=self.customer), customer=self.customer,
+                                is_active=False)
+        self.chat_room.add_message(self.customer, 'Primero')
+        self.chat_room.add_message(self.customer, 'Último ' + 'x' * 200)
+        other.add_message(self.admin, 'Hola')
+
+    def test_stats_in_one_query(self):
+        with self.assertNumQueries(1):
+            stats = ChatRoom.objects.filter(is_active=True).stats()
+        self.assertEqual(stats, {
+            'total_chats': 2, 'unassigned_chats': 1, 'pending_orders': 1,
+            'processing_orders': 1, 'total_unread': 2,
+        })
+
+    def test_rows_are_annotated(self):
+        product_order = self.chat_room.order
+        OrderItem.objects.bulk_create([
+            OrderItem(order=product_order, quantity=1, price=1, subtotal=1) for _ in range(3)
+        ])
+        last_message = self.chat_room.messages.latest('created_at')
+        with self.assertNumQueries(1):
+            rooms = {room.pk: room for room in ChatRoom.objects.filter(is_active=True).for_list()}
+            room = rooms[self.chat_room.pk]
+            self.assertEqual(room.item_count, 3)
+            self.assertEqual(room.last_message_preview, last_message.content[:80])
+            self.assertEqual(room.last_message_at, last_message.created_at)
+            self.assertEqual(room.customer.email, self.customer.email)
+
+
+class UnreadChatCountContextProcessorTest(TestCase):
+    """Tests para el contador global de no leídos de los admins"""
+
+    def setUp(self):
+        cache.clear()
+        self.customer = User.objects.create_user(username='customer', password='testpass123')
+        self.admin = User.objects.create_user(username='admin', password='testpass123', is_staff=True)
+        self.request = RequestFactory().get('/')
+        self.request.user = self.admin
+        self.chat_rooms = [
+            ChatRoom.objects.create(order=Order.objects.create(user=self.customer), customer=self.customer)
+            for _ in range(3)
+        ]
+
+    def test_count_is_cached(self):
+        """Test el contador usa una consulta y luego se sirve desde la caché"""
+        for chat_room in self.chat_rooms:
+            chat_room.add_message(self.customer, 'Hola')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(unread_chat_count(self.request)['admin_unread_chats'], 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(unread_chat_count(self.request)['admin_unread_chats'], 3)
+
+    def test_cache_invalidated_on_new_message_and_read(self):
+        """Test crear o leer mensajes invalida el contador cacheado"""
+        self.assertEqual(unread_chat_count(self.request)['admin_unread_chats'], 0)
+
+        self.chat_rooms[0].add_message(self.customer, 'Hola')
+        self.assertEqual(unread_chat_count(self.request)['admin_unread_chats'], 1)
+
+        self.chat_rooms[0].mark_as_read(self.admin)
+        self.assertEqual(unread_chat_count(self.request)['admin_unread_chats'], 0)
+
+    def test_customer_gets_zero_without_queries(self):
+        """Test los clientes no generan consultas para el contador"""
+        self.request.user = self.customer
+        with self.assertNumQueries(0):
+            self.assertEqual(unread_chat_count(self.request)['admin_unread_chats'], 0)
+
+
+class ChannelLayerSettingsTest(SimpleTestCase):
+    """Tests para la selección de la capa de canales desde el entorno"""
+
+    def test_memory_by_default(self):
+        self.assertEqual(build_channel_layers({})['default']['BACKEND'], MEMORY_BACKEND)
+
+    def test_redis_url(self):
+        layer = build_channel_layers({'REDIS_URL': 'rediss://redis:6379/0'})['default']
+        self.assertEqual(layer['BACKEND'], REDIS_BACKEND)
+        self.assertEqual(layer['CONFIG']['hosts'], [{'address': 'rediss://redis:6379/0'}])
+
+    def test_sentinel(self):
+        layer = build_channel_layers({
+            'REDIS_SENTINELS': 'sentinel-1:26379, sentinel-2:26379',
+            'REDIS_SENTINEL_MASTER': 'chat',
+            'REDIS_PASSWORD': 'secreto',
+        })['default']
+        self.assertEqual(layer['CONFIG']['hosts'], [{
+            'sentinels': [('sentinel-1', 26379), ('sentinel-2', 26379)],
+            'master_name': 'chat',
+            'password': 'secreto',
+        }])
+
+    def test_invalid_configuration(self):
+        with self.assertRaises(ImproperlyConfigured):
+            build_channel_layers({'CHANNEL_LAYER_BACKEND': 'redis'})
+        with self.assertRaises(ImproperlyConfigured):
+            build_channel_layers({'REDIS_SENTINELS': 'sin-puerto'})
+
+
+def create_chat_room():
+    customer = User.objects.create_user(username='customer', email='customer@test.com', password='testpass123')
+    admin = User.objects.create_user(username='admin', email='admin@test.com', password='testpass123',
+                                     is_staff=True, role='ADMIN')
+    chat_room = ChatRoom.objects.create(order=Order.objects.create(user=customer), customer=customer)
+    return chat_room, customer, admin
+
+
+async def receive(communicator, timeout=1):
+    """Siguiente evento del socket, ignorando los de presencia y escritura"""
+    while True:
+        event = await communicator.receive_json_from(timeout)
+        if event['type'] not in ('presence', 'presence_state', 'typing'):
+            return event
+
+
+async def connect(chat_room, user):
+    """Conecta un socket a la sala y consume el historial inicial"""
+    communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{chat_room.id}/')
+    communicator.scope['user'] = user
+    connected, _ = await communicator.connect()
+    assert connected
+    history = await receive(communicator)
+    assert history['type'] == 'message_history'
+    return communicator
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': MEMORY_BACKEND}})
+class ChatConsumerFanOutTest(TransactionTestCase):
+    """Los mensajes llegan a todos los sockets de la sala (un solo proceso)"""
+
+    async def test_message_reaches_every_socket(self):
+        chat_room, customer, admin = await sync_to_async(create_chat_room)()
+        customer_socket = await connect(chat_room, customer)
+        admin_socket = await connect(chat_room, admin)
+
+        await customer_socket.send_json_to({'type': 'chat_message', 'message': 'Hola'})
+
+        for socket in (customer_socket, admin_socket):
+            event = await receive(socket)
+            self.assertEqual((event['type'], event['message']), ('chat_message', 'Hola'))
+            await socket.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': MEMORY_BACKEND}})
+class ChatConsumerRoomCacheTest(TransactionTestCase):
+    """La sala se carga una vez al conectar y se actualiza por eventos del grupo"""
+
+    def setUp(self):
+        self.chat_room, self.customer, self.admin = create_chat_room()
+
+    def test_message_is_insert_and_counter_update_only(self):
+        """Test enviar un mensaje solo inserta el mensaje e incrementa el contador, sin leer la sala ni el cliente"""
+        async def send_messages():
+            socket = await connect(self.chat_room, self.customer)
+            # Las consultas del consumer corren en el hilo sincrónico del test
+            queries = CaptureQueriesContext(connection)
+            await sync_to_async(queries.__enter__)()
+            for text in ('Hola', 'Otra vez'):
+                await socket.send_json_to({'type': 'chat_message', 'message': text})
+                await receive(socket)
+            await sync_to_async(queries.__exit__)(None, None, None)
+            await socket.disconnect()
+            return queries
+
+        queries = async_to_sync(send_messages)()
+        statements = [
+            query['sql'].split()[0].upper() for query in queries.captured_queries
+            if not query['sql'].startswith(('SAVEPOINT', 'RELEASE', 'BEGIN', 'COMMIT'))
+        ]
+        # Por mensaje: el INSERT y el incremento del contador de no leídos
+        self.assertEqual(statements, ['INSERT', 'UPDATE'] * 2)
+        self.chat_room.refresh_from_db()
+        self.assertEqual(self.chat_room.admin_unread_count, 2)
+
+    def test_close_chat_updates_connected_sockets(self):
+        """Test close_chat avisa a los sockets y la sala deja de aceptar mensajes"""
+        async def close_and_send():
+            socket = await connect(self.chat_room, self.customer)
+            client = Client()
+            await sync_to_async(client.force_login)(self.admin)
+            response = await sync_to_async(client.post)(
+                reverse('room_chats:close_chat', args=[self.chat_room.id])
+            )
+            self.assertEqual(response.status_code, 200)
+            update = await receive(socket)
+            await socket.send_json_to({'type': 'chat_message', 'message': 'Hola'})
+            error = await receive(socket)
+            await socket.disconnect()
+            return update, error
+
+        update, error = async_to_sync(close_and_send)()
+        self.assertEqual((update['type'], update['is_active']), ('room_update', False))
+        self.assertEqual(error['type'], 'error')
+        self.assertFalse(Message.objects.exists())
+
+    def test_admin_actions_update_connected_sockets(self):
+        """Test desactivar y editar la sala desde el admin de Django avisa a los sockets"""
+        superuser = User.objects.create_superuser(username='root', email='root@test.com', password='testpass123')
+
+        async def deactivate_and_edit():
+            socket = await connect(self.chat_room, self.customer)
+            client = Client()
+            await sync_to_async(client.force_login)(superuser)
+            await sync_to_async(client.post)(reverse('admin:app_room_chats_chatroom_changelist'), {
+                'action': 'deactivate_rooms', '_selected_action': [self.chat_room.id],
+            })
+            deactivated = await receive(socket)
+            await socket.send_json_to({'type': 'chat_message', 'message': 'Hola'})
+            error = await receive(socket)
+
+            await sync_to_async(client.post)(
+                reverse('admin:app_room_chats_chatroom_change', args=[self.chat_room.id]),
+                {
+                    'order': self.chat_room.order_id, 'customer': self.customer.id,
+                    'admin': self.admin.id, 'is_active': 'on',
+                    'messages-TOTAL_FORMS': 0, 'messages-INITIAL_FORMS': 0,
+                }
+            )
+            edited = await receive(socket)
+            await socket.disconnect()
+            return deactivated, error, edited
+
+        deactivated, error, edited = async_to_sync(deactivate_and_edit)()
+        self.assertEqual((deactivated['type'], deactivated['is_active']), ('room_update', False))
+        self.assertEqual(error['type'], 'error')
+        self.assertEqual((edited['is_active'], edited['has_admin']), (True, True))
+        self.assertFalse(Message.objects.exists())
+
+    def test_admin_assignment_is_broadcast(self):
+        """Test asignar un admin a una sala existente avisa a los sockets conectados"""
+        async def assign_admin():
+            socket = await connect(self.chat_room, self.customer)
+            client = Client()
+            await sync_to_async(client.force_login)(self.admin)
+            await sync_to_async(client.get)(
+                reverse('room_chats:create_or_get_chat', args=[self.chat_room.order_id])
+            )
+            update = await receive(socket)
+            await socket.disconnect()
+            return update
+
+        update = async_to_sync(assign_admin)()
+        self.assertEqual((update['type'], update['has_admin']), ('room_update', True))
+
+    def test_unknown_user_is_rejected(self):
+        """Test un usuario que no es el cliente ni admin no puede conectarse"""
+        other = User.objects.create_user(username='other', email='other@test.com', password='testpass123')
+
+        async def try_connect():
+            communicator = WebsocketCommunicator(
+                URLRouter(websocket_urlpatterns), f'/ws/chat/{self.chat_room.id}/'
+            )
+            communicator.scope['user'] = other
+            connected, _ = await communicator.connect()
+            return connected
+
+        self.assertFalse(async_to_sync(try_connect)())
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': MEMORY_BACKEND}})
+class ReadReceiptConsumerTest(TransactionTestCase):
+    """Avisos de lectura por el grupo de la sala"""
+
+    async def test_read_receipt_reaches_other_participant(self):
+        chat_room, customer, admin = await sync_to_async(create_chat_room)()
+        await sync_to_async(chat_room.add_message)(customer, 'Hola')
+        customer_socket = await connect(chat_room, customer)
+        admin_socket = await connect(chat_room, admin)
+
+        await admin_socket.send_json_to({'type': 'mark_as_read'})
+        receipt = await receive(customer_socket)
+        self.assertEqual((receipt['type'], receipt['reader']), ('read_receipt', 'admin'))
+        await receive(admin_socket)
+
+        # El historial de una conexión nueva deriva is_read del marcador
+        await customer_socket.disconnect()
+        customer_socket = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{chat_room.id}/')
+        customer_socket.scope['user'] = customer
+        await customer_socket.connect()
+        history = await receive(customer_socket)
+        self.assertTrue(history['messages'][0]['is_read'])
+        await chat_room.arefresh_from_db()
+        self.assertEqual(chat_room.admin_unread_count, 0)
+        await customer_socket.disconnect()
+        await admin_socket.disconnect()
+
+    def test_chat_room_view_broadcasts_read_receipt(self):
+        chat_room, customer, admin = create_chat_room()
+
+        async def open_page():
+            socket = await connect(chat_room, admin)
+            client = Client()
+            await sync_to_async(client.force_login)(customer)
+            await sync_to_async(client.get)(reverse('room_chats:chat_room', args=[chat_room.id]))
+            receipt = await receive(socket)
+            await socket.disconnect()
+            return receipt
+
+        receipt = async_to_sync(open_page)()
+        self.assertEqual((receipt['type'], receipt['reader']), ('read_receipt', 'customer'))
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': MEMORY_BACKEND}}, CHAT_TYPING_THROTTLE=60)
+class PresenceConsumerTest(TransactionTestCase):
+    """Presencia e indicador de escritura solo por la capa de canales"""
+
+    def setUp(self):
+        self.chat_room, self.customer, self.admin = create_chat_room()
+
+    def test_presence_and_typing_without_queries(self):
+        async def chat():
+            customer_socket = await connect(self.chat_room, self.customer)
+            state = await customer_socket.receive_json_from()
+            admin_socket = await connect(self.chat_room, self.admin)
+            admin_state = await admin_socket.receive_json_from()
+            online = await customer_socket.receive_json_from()
+
+            queries = CaptureQueriesContext(connection)
+            await sync_to_async(queries.__enter__)()
+            for _ in range(5):
+                await admin_socket.send_json_to({'type': 'typing'})
+            await admin_socket.send_json_to({'type': 'heartbeat'})
+            typing = await customer_socket.receive_json_from()
+            await sync_to_async(queries.__exit__)(None, None, None)
+            # Las pulsaciones dentro del intervalo se agrupan en un solo evento
+            self.assertTrue(await customer_socket.receive_nothing())
+            self.assertTrue(await admin_socket.receive_nothing())
+
+            await admin_socket.disconnect()
+            offline = await customer_socket.receive_json_from()
+            await customer_socket.disconnect()
+            return state, admin_state, online, typing, offline, queries
+
+        state, admin_state, online, typing, offline, queries = async_to_sync(chat)()
+        self.assertEqual((state['type'], state['online']), ('presence_state', ['customer']))
+        self.assertEqual(admin_state['online'], ['admin', 'customer'])
+        self.assertEqual((online['type'], online['role'], online['online']), ('presence', 'admin', True))
+        self.assertEqual((typing['type'], typing['role']), ('typing', 'admin'))
+        self.assertEqual((offline['type'], offline['role'], offline['online']), ('presence', 'admin', False))
+        self.assertEqual(len(queries), 0)
+
+    def test_presence_events_only_read_their_room(self):
+        """Test conectar y desconectar sin recorrer la presencia de las demás salas"""
+        other_customer = User.objects.create_user(username='other', email='other@test.com', password='testpass123')
+        other_room = ChatRoom.objects.create(order=Order.objects.create(user=other_customer), customer=other_customer)
+
+        async def chat():
+            other_socket = await connect(other_room, other_customer)
+            await other_socket.receive_json_from()
+            store = get_presence_store()
+            with mock.patch.object(store, 'members', side_effect=AssertionError('lectura global')):
+                socket = await connect(self.chat_room, self.customer)
+                state = await socket.receive_json_from()
+                await socket.disconnect()
+            rooms = await online_rooms()
+            await other_socket.disconnect()
+            return state, rooms
+
+        state, rooms = async_to_sync(chat)()
+        self.assertEqual(state['online'], ['customer'])
+        self.assertEqual(rooms, {str(other_room.id): {'customer'}})
+
+    def test_chat_list_shows_connected_customers(self):
+        client = Client()
+        client.force_login(self.admin)
+
+        async def open_chat_list():
+            socket = await connect(self.chat_room, self.customer)
+            response = await sync_to_async(client.get)(reverse('room_chats:chat_list'))
+            await socket.disconnect()
+            return response
+
+        response = async_to_sync(open_chat_list)()
+        self.assertEqual(response.context['online_customers'], {self.chat_room.id})
+        self.assertContains(response, 'En línea')
+        response = client.get(reverse('room_chats:chat_list'))
+        self.assertEqual(response.context['online_customers'], set())
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': MEMORY_BACKEND}})
+class AdminInboxConsumerTest(TransactionTestCase):
+    """La bandeja de los admins recibe eventos incrementales"""
+
+    def setUp(self):
+        self.chat_room, self.customer, self.admin = create_chat_room()
+
+    async def connect_inbox(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/chat/inbox/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    def test_customers_are_rejected(self):
+        async def try_connect():
+            _, connected = await self.connect_inbox(self.customer)
+            return connected
+
+        self.assertFalse(async_to_sync(try_connect)())
+
+    def test_inbox_events(self):
+        client = Client()
+        client.force_login(self.admin)
+        customer_client = Client()
+        customer_client.force_login(self.customer)
+        new_order = Order.objects.create(user=self.customer)
+
+        async def collect():
+            inbox, _ = await self.connect_inbox(self.admin)
+            events = []
+
+            socket = await connect(self.chat_room, self.customer)
+            await socket.send_json_to({'type': 'chat_message', 'message': 'Hola'})
+            events.append(await inbox.receive_json_from())
+            await socket.disconnect()
+
+            await sync_to_async(customer_client.get)(
+                reverse('room_chats:create_or_get_chat', args=[new_order.id])
+            )
+            events.append(await inbox.receive_json_from())
+            await sync_to_async(client.get)(
+                reverse('room_chats:create_or_get_chat', args=[self.chat_room.order_id])
+            )
+            events.append(await inbox.receive_json_from())
+            await sync_to_async(client.post)(
+                reverse('orders:admin_order_update', args=[self.chat_room.order_id]), {'status': 'processing'}
+            )
+            events.append(await inbox.receive_json_from())
+            await sync_to_async(client.post)(reverse('room_chats:close_chat', args=[self.chat_room.id]))
+            events.append(await inbox.receive_json_from())
+            await inbox.disconnect()
+            return events
+
+        events = async_to_sync(collect)()
+        self.assertEqual([event['type'] for event in events], [
+            'message_received', 'room_created', 'room_assigned', 'order_status', 'room_closed'
+        ])
+        self.assertTrue(events[0]['from_customer'])
+        self.assertEqual(events[0]['preview'], 'Hola')
+        self.assertEqual(events[1]['order_id'], str(new_order.id))
+        self.assertEqual((events[3]['previous_status'], events[3]['status']), ('pending', 'processing'))
+        self.assertEqual(events[4]['room_id'], str(self.chat_room.id))
+        # Las estadísticas del panel vienen del servidor en cada evento de vistas
+        self.assertEqual(
+            [(e['stats']['total_chats'], e['stats']['unassigned_chats'], e['stats']['pending_orders'])
+             for e in events[1:]],
+            [(2, 2, 2), (2, 1, 2), (2, 1, 1), (1, 1, 1)]
+        )
+
+
+class BroadcastFailureTest(TestCase):
+    """Los avisos por la capa de canales no hacen fallar las vistas"""
+
+    def test_close_chat_survives_channel_layer_failure(self):
+        """Test si la capa de canales falla la sala se cierra igual y el error queda en el log"""
+        chat_room, _, admin = create_chat_room()
+        self.client.force_login(admin)
+        layer = mock.Mock(group_send=mock.AsyncMock(side_effect=ConnectionError))
+        with mock.patch('app_room_chats.consumers.get_channel_layer', return_value=layer), \
+                self.assertLogs('app_room_chats.consumers', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post(reverse('room_chats:close_chat', args=[chat_room.id]))
+            # Los avisos se envían después del commit, no durante la petición
+            self.assertEqual(layer.group_send.await_count, 0)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(layer.group_send.await_count, 2)
+        chat_room.refresh_from_db()
+        self.assertFalse(chat_room.is_active)
+
+
+class MessageHistoryTest(TestCase):
+    """Tests para la paginación por cursor del historial de mensajes"""
+
+    def setUp(self):
+        self.chat_room, self.customer, self.admin = create_chat_room()
+        now = timezone.now()
+        Message.objects.bulk_create([
+            Message(chat_room=self.chat_room, sender=self.customer if i % 2 else self.admin,
+                    content=f'Mensaje {i}')
+            for i in range(120)
+        ])
+        for message in Message.objects.all():
+            # Pares de mensajes con la misma fecha para probar el desempate por id
+            Message.objects.filter(id=message.id).update(
+                created_at=now + timedelta(seconds=int(message.content.split()[1]) // 2)
+            )
+        self.expected = list(
+            self.chat_room.messages.order_by('created_at', 'id').values_list('id', flat=True)
+        )
+
+    def test_pages_go_from_newest_to_oldest(self):
+        """Test cada página es cronológica y el cursor avanza hacia atrás"""
+        messages = Message.objects.filter(chat_room=self.chat_room)
+        pages = []
+        cursor = None
+        while True:
+            page, cursor = messages.history_page(cursor, page_size=50)
+            pages.insert(0, [message.id for message in page])
+            if cursor is None:
+                break
+        self.assertEqual([len(page) for page in pages], [20, 50, 50])
+        self.assertEqual(sum(pages, []), self.expected)
+
+    def test_page_is_one_query(self):
+        """Test una página carga los remitentes con JOIN, en una sola consulta"""
+        messages = Message.objects.filter(chat_room=self.chat_room)
+        _, cursor = messages.history_page(page_size=50)
+        with self.assertNumQueries(1):
+            page, _ = messages.history_page(cursor, page_size=50)
+            emails = {message.sender.email for message in page}
+        self.assertEqual(emails, {self.customer.email, self.admin.email})
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': MEMORY_BACKEND}}, CHAT_WRITE_BEHIND=True,
+                   CHAT_WRITE_BUFFER_SIZE=100, CHAT_WRITE_BUFFER_DELAY=60)
+class WriteBehindTest(TransactionTestCase):
+    """Escritura diferida: se difunde al instante y se guarda en lote"""
+
+    def setUp(self):
+        self.chat_room, self.customer, self.admin = create_chat_room()
+
+    async def test_broadcast_before_save_and_flush_on_disconnect(self):
+        socket = await connect(self.chat_room, self.customer)
+        for text in ('Hola', '¿Precio?'):
+            await socket.send_json_to({'type': 'chat_message', 'message': text})
+        events = [await receive(socket) for _ in range(2)]
+        self.assertEqual(await Message.objects.acount(), 0)
+
+        await socket.disconnect()
+        saved = [message async for message in Message.objects.order_by('created_at')]
+        self.assertEqual([str(message.id) for message in saved], [event['message_id'] for event in events])
+        self.assertEqual([message.created_at.isoformat() for message in saved],
+                         [event['timestamp'] for event in events])
+        await self.chat_room.arefresh_from_db()
+        self.assertEqual(self.chat_room.admin_unread_count, 2)
+
+    @override_settings(CHAT_WRITE_BUFFER_SIZE=3)
+    async def test_flush_when_batch_is_full(self):
+        socket = await connect(self.chat_room, self.admin)
+        for i in range(3):
+            await socket.send_json_to({'type': 'chat_message', 'message': f'Mensaje {i}'})
+            await receive(socket)
+        # El lote lleno se guarda en segundo plano, sin esperar el plazo
+        for _ in range(100):
+            if await Message.objects.acount() == 3:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(await Message.objects.acount(), 3)
+        await socket.disconnect()
+        await self.chat_room.arefresh_from_db()
+        self.assertEqual(self.chat_room.customer_unread_count, 3)
+
+    async def test_failed_flush_is_retried(self):
+        buffer = MessageBuffer()
+        buffer.add(Message(chat_room=self.chat_room, sender=self.customer, content='Hola'))
+        with mock.patch.object(MessageQuerySet, 'bulk_add', side_effect=DatabaseError), \
+                self.assertLogs('app_room_chats.buffer', 'ERROR'):
+            self.assertEqual(await buffer.flush(), 0)
+        self.assertEqual(len(buffer), 1)
+
+        self.assertEqual(await buffer.flush(), 1)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(await Message.objects.acount(), 1)
+
+    @override_settings(CHAT_WRITE_MAX_ATTEMPTS=2)
+    async def test_bad_message_does_not_block_the_rest(self):
+        ghost = await sync_to_async(User.objects.create_user)(
+            username='ghost', email='ghost@test.com', password='testpass123')
+        bad = Message(chat_room=self.chat_room, sender=ghost, content='Remitente eliminado')
+        await ghost.adelete()
+        buffer = MessageBuffer()
+        buffer.add(bad)
+        for i in range(3):
+            buffer.add(Message(chat_room=self.chat_room, sender=self.customer, content=f'Mensaje {i}'))
+
+        with self.assertLogs('app_room_chats.buffer', 'ERROR'):
+            self.assertEqual(await buffer.flush(), 3)
+        self.assertEqual([message.pk for message in buffer.pending], [bad.pk])
+
+        with self.assertLogs('app_room_chats.buffer', 'ERROR') as logs:
+            self.assertEqual(await buffer.flush(), 0)
+        self.assertIn('Se descartó', logs.output[-1])
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(await Message.objects.acount(), 3)
+        await self.chat_room.arefresh_from_db()
+        self.assertEqual(self.chat_room.admin_unread_count, 3)
+
+    @override_settings(CHAT_WRITE_BUFFER_MAX_PENDING=1)
+    async def test_full_buffer_saves_directly(self):
+        socket = await connect(self.chat_room, self.customer)
+        for text in ('Hola', '¿Precio?'):
+            await socket.send_json_to({'type': 'chat_message', 'message': text})
+            await receive(socket)
+        # El primero espera en el buffer; el segundo ya no cabe y se guarda al instante
+        self.assertEqual([message.content async for message in Message.objects.all()], ['¿Precio?'])
+        await socket.disconnect()
+        self.assertEqual(await Message.objects.acount(), 2)
+
+    def test_retried_batch_does_not_inflate_counters(self):
+        messages = [Message(chat_room=self.chat_room, sender=self.customer, content=f'Mensaje {i}')
+                    for i in range(2)]
+        self.assertEqual(Message.objects.bulk_add(messages), 2)
+        # El mismo lote otra vez (reintento tras un guardado que sí ocurrió)
+        self.assertEqual(Message.objects.bulk_add(messages), 0)
+        self.chat_room.refresh_from_db()
+        self.assertEqual(self.chat_room.admin_unread_count, 2)
+        self.assertEqual(Message.objects.count(), 2)
+
+    def test_load_test_command(self):
+        # El test ya corre sobre una base de datos desechable
+        out = StringIO()
+        call_command('chat_load_test', sockets=4, messages=3, in_place=True, stdout=out)
+        self.assertIn('p99 diferido', out.getvalue())
+        self.assertFalse(User.objects.filter(username__startswith='load-').exists())
+
+    def test_load_test_command_cleans_up_on_failure(self):
+        with mock.patch('app_room_chats.management.commands.chat_load_test.Command.run',
+                        side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            call_command('chat_load_test', sockets=4, messages=3, in_place=True, stdout=StringIO())
+        self.assertFalse(User.objects.filter(username__startswith='load-').exists())
+        self.assertEqual(ChatRoom.objects.count(), 1)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': MEMORY_BACKEND}}, CHAT_HISTORY_PAGE_SIZE=5)
+class ChatHistoryConsumerTest(TransactionTestCase):
+    """Protocolo de historial del WebSocket: página reciente y load_older"""
+
+    async def test_load_older(self):
+        chat_room, customer, admin = await sync_to_async(create_chat_room)()
+        for i in range(8):
+            await sync_to_async(chat_room.add_message)(admin, f'Mensaje {i}')
+
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{chat_room.id}/')
+        communicator.scope['user'] = customer
+        await communicator.connect()
+
+        history = await receive(communicator)
+        self.assertEqual(history['type'], 'message_history')
+        self.assertEqual([m['content'] for m in history['messages']],
+                         [f'Mensaje {i}' for i in range(3, 8)])
+        self.assertTrue(history['has_more'])
+
+        await communicator.send_json_to({'type': 'load_older', 'cursor': history['cursor']})
+        older = await receive(communicator)
+        self.assertEqual(older['type'], 'older_messages')
+        self.assertEqual([m['content'] for m in older['messages']],
+                         [f'Mensaje {i}' for i in range(3)])
+        self.assertFalse(older['has_more'])
+        await communicator.disconnect()
+
+
+# Proceso worker: se une al grupo de la sala con la capa de canales de los
+# settings (Redis por REDIS_URL) y devuelve el primer chat_message que recibe
+WORKER_SCRIPT = """
+import asyncio, json, sys
+import django
+django.setup()
+from channels.layers import get_channel_layer
+
+async def main(group):
+    layer = get_channel_layer()
+    channel = await layer.new_channel()
+    await layer.group_add(group, channel)
+    print('ready', flush=True)
+    while True:
+        event = await asyncio.wait_for(layer.receive(channel), timeout=20)
+        if event['type'] == 'chat_message':
+            break
+    print(json.dumps(event), flush=True)
+
+asyncio.run(main(sys.argv[1]))
+"""
+
+
+@skipUnless(os.environ.get('REDIS_URL') or TcpFakeServer,
+            'Requiere REDIS_URL o fakeredis (pip install "fakeredis[lua]")')
+class MultiProcessChannelLayerTest(TransactionTestCase):
+    """
+    Varios workers comparten el chat a través de Redis: un mensaje enviado
+    por ChatConsumer en este proceso llega a los grupos unidos desde otros
+    procesos. Sin REDIS_URL se usa un servidor fakeredis en este proceso.
+    """
+
+    def setUp(self):
+        self.server = None
+        redis_url = os.environ.get('REDIS_URL')
+        if not redis_url:
+            self.server = TcpFakeServer(('127.0.0.1', 0), server_type='redis')
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            host, port = self.server.server_address
+            redis_url = f'redis://{host}:{port}/0'
+        self.redis_url = redis_url
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def start_workers(self, group, count):
+        env = {**os.environ, 'REDIS_URL': self.redis_url, 'DJANGO_SETTINGS_MODULE': 'Zultech_main.settings'}
+        workers = [
+            subprocess.Popen([sys.executable, '-c', WORKER_SCRIPT, group],
+                             cwd=settings.BASE_DIR, env=env, stdout=subprocess.PIPE, text=True)
+            for _ in range(count)
+        ]
+        for worker in workers:
+            self.assertEqual(worker.stdout.readline().strip(), 'ready')
+        return workers
+
+    def test_group_send_fans_out_across_processes(self):
+        chat_room, customer, _ = create_chat_room()
+        workers = self.start_workers(room_group_name(chat_room.id), 2)
+
+        async def send_message():
+            socket = await connect(chat_room, customer)
+            await socket.send_json_to({'type': 'chat_message', 'message': 'Hola a todos'})
+            event = await receive(socket, timeout=5)
+            await socket.disconnect()
+            return event
+
+        with override_settings(CHANNEL_LAYERS=build_channel_layers({'REDIS_URL': self.redis_url})):
+            local_event = async_to_sync(send_message)()
+
+        self.assertEqual(local_event['message'], 'Hola a todos')
+        for worker in workers:
+            output, _ = worker.communicate(timeout=30)
+            event = json.loads(output)
+            self.assertEqual(event['type'], 'chat_message')
+            self.assertEqual(event['message'], 'Hola a todos')
+            self.assertEqual(event['sender'], customer.email)
+
+    def test_presence_is_shared_through_redis(self):
+        chat_room, customer, _ = create_chat_room()
+        layers = build_channel_layers({'REDIS_URL': self.redis_url})
+
+        async def connect_and_look_up():
+            socket = await connect(chat_room, customer)
+            # La presencia se registra después del historial, antes de presence_state
+            while (await socket.receive_json_from(timeout=5))['type'] != 'presence_state':
+                pass
+            # Otra instancia de la capa, como la de otro worker
+            other_worker = RedisChannelLayer(**layers['default']['CONFIG'])
+            rooms = await online_rooms(other_worker)
+            roles = await online_roles(other_worker, chat_room.id)
+            await socket.disconnect()
+            return rooms, roles, await online_rooms(other_worker), await online_roles(other_worker, chat_room.id)
+
+        with override_settings(CHANNEL_LAYERS=layers):
+            rooms, roles, rooms_after, roles_after = async_to_sync(connect_and_look_up)()
+        self.assertEqual(rooms, {str(chat_room.id): {'customer'}})
+        self.assertEqual(roles, {'customer'})
+        self.assertEqual(rooms_after, {})
+        self.assertEqual(roles_after, set())
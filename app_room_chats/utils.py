@@ -0,0 +1,30 @@
+"""
+Utilidades para los contadores de mensajes no leídos del chat
+"""
+from django.core.cache import cache
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+ADMIN_UNREAD_CACHE_KEY = 'room_chats:admin_unread_total'
+ADMIN_UNREAD_CACHE_TIMEOUT = 30  # segundos
+
+
+def get_admin_unread_total():
+    """
+    Obtiene el total de mensajes no leídos por los admins en salas activas.
+    Usa una entrada de caché de vida corta respaldada por un único SUM
+    """
+    total = cache.get(ADMIN_UNREAD_CACHE_KEY)
+    if total is None:
+        from .models import ChatRoom
+
+        total = ChatRoom.objects.filter(is_active=True).aggregate(
+            total=Coalesce(Sum('admin_unread_count'), 0)
+        )['total']
+        cache.set(ADMIN_UNREAD_CACHE_KEY, total, ADMIN_UNREAD_CACHE_TIMEOUT)
+    return total
+
+
+def invalidate_admin_unread_total():
+    """Invalida el total cacheado tras crear o leer mensajes"""
+    cache.delete(ADMIN_UNREAD_CACHE_KEY)
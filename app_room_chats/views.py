@@ -1,8 +1,12 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
+from django.urls import reverse
 from django.views.decorators.http import require_http_methods
+from .consumers import inbox_stats, notify_inbox, notify_read, notify_room_update
 from .models import ChatRoom, Message
+from .presence import online_customer_rooms
+from .utils import invalidate_admin_unread_total
 from app_orders.models import Order
 
 
@@ -24,11 +28,11 @@ def chat_room(request, room_id):
         messages.error(request, 'No tienes permiso para acceder a este chat.')
         return redirect('website:Dashboard')
     
-    # Marcar mensajes como leídos
+    # Marcar la sala como leída y avisar al otro participante
+    last_read_at = chat_room.mark_as_read(request.user)
+    notify_read(chat_room, request.user, last_read_at)
     if is_admin:
-        chat_room.messages.filter(sender__role='customer', is_read=False).update(is_read=True)
-    else:
-        chat_room.messages.filter(sender__role='admin', is_read=False).update(is_read=True)
+        notify_inbox('room_read', room_id=str(chat_room.id))
     
     context = {
         'chat_room': chat_room,
@@ -72,16 +76,30 @@ def create_or_get_chat(request, order_id):
     
     # Si es un admin entrando, asignarlo y registrar como quien atendió
     if is_admin:
-        if not chat_room.admin:
+        admin_assigned = not chat_room.admin_id
+        if admin_assigned:
             chat_room.admin = request.user
         # Registrar como quien atendió la cotización si aún no se ha registrado
         if not chat_room.attended_by:
             from django.utils import timezone
             chat_room.attended_by = request.user
             chat_room.attended_at = timezone.now()
-        chat_room.save()
+        # update_fields evita sobrescribir los contadores de no leídos
+        chat_room.save(update_fields=['admin', 'attended_by', 'attended_at', 'updated_at'])
+        if admin_assigned and not created:
+            # Los sockets ya conectados guardan la sala en memoria
+            notify_room_update(chat_room)
+        if admin_assigned:
+            notify_inbox('room_assigned', room_id=str(chat_room.id), admin=request.user.email)
     
     if created:
+        notify_inbox(
+            'room_created',
+            room_id=str(chat_room.id),
+            order_id=str(order.id),
+            customer=order.user.email,
+            url=reverse('room_chats:chat_room', args=[chat_room.id]),
+        )
         messages.success(request, 'Sala de chat creada exitosamente.')
     
     return redirect('room_chats:chat_room', room_id=chat_room.id)
@@ -98,9 +116,7 @@ def chat_list(request):
     
     if is_admin:
         # Admins ven todas las salas
-        chat_rooms = ChatRoom.objects.filter(is_active=True).select_related(
-            'order', 'customer', 'admin'
-        ).prefetch_related('messages', 'order__items')
+        chat_rooms = ChatRoom.objects.filter(is_active=True).for_list()
         
         # Aplicar filtros
         status_filter = request.GET.get('status', '')
@@ -122,25 +138,15 @@ def chat_list(request):
                 Q(order__id__icontains=search_query)
             )
         
-        # Estadísticas para admins (sin filtros)
-        all_chats = ChatRoom.objects.filter(is_active=True)
-        total_chats = all_chats.count()
-        unassigned_chats = all_chats.filter(admin__isnull=True).count()
-        pending_orders = all_chats.filter(order__status='pending').count()
-        processing_orders = all_chats.filter(order__status='processing').count()
-        
-        # Contar mensajes no leídos totales
-        total_unread = 0
-        for chat in all_chats.prefetch_related('messages'):
-            total_unread += chat.unread_count_for_admin
-        
         context = {
             'chat_rooms': chat_rooms,
-            'total_chats': total_chats,
-            'unassigned_chats': unassigned_chats,
-            'pending_orders': pending_orders,
-            'processing_orders': processing_orders,
-            'total_unread': total_unread,
+            # Estadísticas para admins (sin filtros): total, sin asignar,
+            # pendientes, en proceso y no leídos en una sola consulta
+            **inbox_stats(),
+            # Clientes con la sala abierta: una consulta a la capa de canales
+            'online_customers': online_customer_rooms(),
+            # La página se actualiza por WebSocket (AdminInboxConsumer)
+            'live_inbox': True,
             'status_filter': status_filter,
             'assigned_filter': assigned_filter,
             'search_query': search_query,
@@ -150,7 +156,7 @@ def chat_list(request):
         chat_rooms = ChatRoom.objects.filter(
             customer=request.user, 
             is_active=True
-        ).select_related('order', 'admin').prefetch_related('messages', 'order__items')
+        ).for_list()
         
         context = {
             'chat_rooms': chat_rooms,
@@ -174,6 +180,9 @@ def close_chat(request, room_id):
     
     chat_room = get_object_or_404(ChatRoom, id=room_id)
     chat_room.is_active = False
-    chat_room.save()
+    chat_room.save(update_fields=['is_active', 'updated_at'])
+    invalidate_admin_unread_total()
+    notify_room_update(chat_room)
+    notify_inbox('room_closed', room_id=str(chat_room.id))
     
     return JsonResponse({'success': True, 'message': 'Chat cerrado'})
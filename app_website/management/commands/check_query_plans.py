@@ -0,0 +1,157 @@
+import random
+import re
+import uuid
+from datetime import timedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from app_cart.models import Cart
+from app_orders.models import Order
+from app_products.models import Category, Product, ProductImage
+from app_room_chats.models import ChatRoom, Message
+
+User = get_user_model()
+
+
+def find_sequential_scans(plan, table, vendor):
+    """Retorna las líneas del plan que recorren `table` completa, sin índice"""
+    scans = []
+    for line in plan.splitlines():
+        if vendor == 'postgresql':
+            if re.search(rf'Seq Scan on {table}\b', line):
+                scans.append(line.strip())
+        elif vendor == 'sqlite':
+            match = re.search(rf'\bSCAN {table}\b(.*)$', line)
+            if match and 'USING' not in match.group(1):
+                scans.append(line.strip())
+    return scans
+
+
+class Command(BaseCommand):
+    help = (
+        'Ejecuta EXPLAIN sobre las consultas más frecuentes (catálogo, órdenes, '
+        'chat y carritos) y falla si alguna recorre su tabla completa. Por '
+        'defecto crea datos sintéticos dentro de una transacción que se revierte.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000,
+                            help='Productos y órdenes sintéticos a crear (por defecto 20000)')
+        parser.add_argument('--no-seed', action='store_true',
+                            help='Analizar los datos actuales sin crear datos sintéticos')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if not options['no_seed']:
+                self.seed(options['rows'])
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            failures = []
+            for label, queryset in self.get_hot_queries():
+                plan = queryset.explain()
+                scans = find_sequential_scans(plan, queryset.model._meta.db_table, connection.vendor)
+                if scans:
+                    failures.append(label)
+                    self.stdout.write(self.style.ERROR(f'✗ {label}'))
+                    for scan in scans:
+                        self.stdout.write(f'    {scan}')
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'✓ {label}'))
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'{plan}\n')
+
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(
+                f'{len(failures)} consulta(s) recorren la tabla completa: {", ".join(failures)}'
+            )
+        self.stdout.write(self.style.SUCCESS('¡Completado! Todas las consultas usan índices.'))
+
+    def get_hot_queries(self):
+        """Consultas con la misma forma que las de las vistas y servicios"""
+        product = Product.objects.filter(stock__gt=0).order_by('pk').first()
+        room = ChatRoom.objects.order_by('pk').first()
+        user = User.objects.filter(orders__isnull=False).order_by('pk').first()
+        if product is None or room is None or user is None:
+            raise CommandError('No hay datos suficientes; ejecuta el comando sin --no-seed.')
+        product_ids = list(Product.objects.values_list('pk', flat=True)[:12])
+
+        return [
+            ('Catálogo', Product.objects.filter(stock__gt=0).order_by('name', 'id')[:13]),
+            ('Catálogo por categoría', Product.objects.filter(
+                stock__gt=0, category_id=product.category_id
+            ).order_by('name', 'id')[:13]),
+            ('Productos relacionados', Product.objects.filter(
+                category_id=product.category_id, available=True, stock__gt=0
+            ).exclude(id=product.id)[:4]),
+            ('Imágenes del catálogo', ProductImage.objects.filter(product_id__in=product_ids)),
+            ('Imagen principal', ProductImage.objects.filter(product=product, is_main=True)[:1]),
+            ('Pedidos del usuario', Order.objects.filter(user=user).order_by('-created_at', '-id')[:11]),
+            ('Órdenes del staff', Order.objects.order_by('-created_at', '-id')[:21]),
+            ('Órdenes por estado', Order.objects.filter(
+                status='pending'
+            ).order_by('-created_at', '-id')[:21]),
+            ('Historial del chat', Message.objects.filter(
+                chat_room=room
+            ).order_by('-created_at', '-id')[:51]),
+            ('Mensajes no leídos', Message.objects.filter(
+                chat_room=room, created_at__gt=timezone.now() - timedelta(days=1)
+            ).exclude(sender_id=room.customer_id)),
+            ('Carritos antiguos', Cart.objects.filter(
+                updated_at__lt=timezone.now() - timedelta(days=30)
+            )),
+        ]
+
+    def seed(self, rows):
+        rng = random.Random(42)
+        tag = uuid.uuid4().hex[:8]
+
+        categories = Category.objects.bulk_create([
+            Category(name=f'Plan {tag} {i}', slug=f'plan-{tag}-{i}') for i in range(20)
+        ])
+        products = Product.objects.bulk_create([
+            Product(
+                category=rng.choice(categories),
+                name=f'Producto {rng.randrange(rows):06d}',
+                slug=f'plan-{tag}-{i}',
+                description='Producto sintético',
+                stock=rng.choice([0] + [rng.randint(1, 50)] * 9),
+                available=rng.random() > 0.1,
+            )
+            for i in range(rows)
+        ], batch_size=2000)
+        ProductImage.objects.bulk_create([
+            ProductImage(product=product, image=f'products/plan-{i}.jpg', is_main=(i % 2 == 0))
+            for i, product in enumerate(products)
+            for _ in range(2)
+        ], batch_size=2000)
+
+        users = User.objects.bulk_create([
+            User(username=f'plan-{tag}-{i}', password='!') for i in range(max(rows // 100, 10))
+        ])
+        statuses = [status for status, _ in Order.STATUS_CHOICES]
+        orders = Order.objects.bulk_create([
+            Order(user=rng.choice(users), status=rng.choice(statuses)) for _ in range(rows)
+        ], batch_size=2000)
+
+        rooms = ChatRoom.objects.bulk_create([
+            ChatRoom(order=order, customer=order.user) for order in orders[:max(rows // 10, 1)]
+        ], batch_size=2000)
+        Message.objects.bulk_create([
+            Message(
+                chat_room=room,
+                sender=room.customer if rng.random() < 0.5 else users[0],
+                content='Mensaje sintético',
+            )
+            for room in rooms
+            for _ in range(10)
+        ], batch_size=2000)
+
+        Cart.objects.bulk_create([
+            Cart(session_key=f'plan{tag}{i}') for i in range(rows // 2)
+        ], batch_size=2000)
+
+        self.stdout.write(f'Datos sintéticos creados: {rows} productos y {rows} órdenes')
@@ -1,3 +1,26 @@
 from django.test import TestCase
+from django.core.management import call_command
+from io import StringIO
+from app_products.models import Product
+from .management.commands.check_query_plans import find_sequential_scans
 
-# Create your tests here.
+
+class CheckQueryPlansTest(TestCase):
+    """Tests para el comando que revisa los planes de las consultas frecuentes"""
+
+    def test_hot_queries_use_indexes(self):
+        """Test ninguna consulta frecuente recorre su tabla completa"""
+        out = StringIO()
+        call_command('check_query_plans', rows=500, stdout=out)
+        self.assertIn('Todas las consultas usan índices', out.getvalue())
+        self.assertFalse(Product.objects.exists())
+
+    def test_find_sequential_scans(self):
+        """Test se detectan los recorridos completos, no los que usan índices"""
+        sqlite_plan = '2 0 0 SCAN app_cart_cart\n5 0 0 SCAN app_orders_order USING INDEX order_created_idx'
+        self.assertEqual(find_sequential_scans(sqlite_plan, 'app_cart_cart', 'sqlite'),
+                         ['2 0 0 SCAN app_cart_cart'])
+        self.assertEqual(find_sequential_scans(sqlite_plan, 'app_orders_order', 'sqlite'), [])
+
+        postgres_plan = 'Limit\n  ->  Seq Scan on app_cart_cart  (cost=0.00..1.01 rows=1)'
+        self.assertEqual(len(find_sequential_scans(postgres_plan, 'app_cart_cart', 'postgresql')), 1)